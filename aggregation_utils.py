@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# aggregation_utils.py
+# Version      : 1.0.0
+# Last updated : 2026-10-18
+# Description  : Vectorized per-minute aggregation of HA state rows
+# ---------------------------------------------
+
+import numpy as np
+
+AGGREGATIONS = ("last", "mean", "min", "max", "count")
+
+
+def parse_states(states):
+    """
+    Convert (metadata_id, state, last_updated_ts) tuples into three arrays,
+    dropping non-numeric states such as 'unavailable'
+
+    Returns:
+        (meta_ids int64, values float64, timestamps float64)
+    """
+    meta_ids, values, timestamps = [], [], []
+    for meta_id, state, ts in states:
+        try:
+            val = float(state)
+        except (ValueError, TypeError):
+            continue
+        meta_ids.append(meta_id)
+        values.append(val)
+        timestamps.append(ts)
+    return (np.array(meta_ids, dtype=np.int64),
+            np.array(values, dtype=np.float64),
+            np.array(timestamps, dtype=np.float64))
+
+
+def aggregate_minutes(meta_ids, values, timestamps, funcs, default="last"):
+    """
+    Aggregate state values into (metadata_id, epoch minute) buckets
+
+    Buckets are keyed on integer epoch minutes (ts // 60) and ordered by
+    timestamp inside each bucket, so 'last' does not depend on the row
+    order returned by SQLite.
+
+    Args:
+        funcs: dict metadata_id -> one of AGGREGATIONS
+        default: aggregation for metadata_ids missing in funcs
+
+    Returns:
+        (meta_ids, minutes, values) arrays, one entry per bucket
+    """
+    if len(values) == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float64))
+
+    minutes = (timestamps // 60).astype(np.int64)
+    order = np.lexsort((timestamps, minutes, meta_ids))
+    meta_ids, minutes, values = meta_ids[order], minutes[order], values[order]
+
+    new_bucket = np.empty(len(values), dtype=bool)
+    new_bucket[0] = True
+    new_bucket[1:] = (meta_ids[1:] != meta_ids[:-1]) | (minutes[1:] != minutes[:-1])
+    starts = np.flatnonzero(new_bucket)
+    ends = np.append(starts[1:], len(values))
+    counts = ends - starts
+
+    bucket_meta = meta_ids[starts]
+    results = {
+        "last": lambda: values[ends - 1],
+        "mean": lambda: np.add.reduceat(values, starts) / counts,
+        "min": lambda: np.minimum.reduceat(values, starts),
+        "max": lambda: np.maximum.reduceat(values, starts),
+        "count": lambda: counts.astype(np.float64),
+    }
+
+    configured = np.array(list(funcs), dtype=np.int64)
+    out = np.empty(len(starts), dtype=np.float64)
+    for func in AGGREGATIONS:
+        mask = np.isin(bucket_meta, [m for m, f in funcs.items() if f == func])
+        if func == default:
+            mask |= ~np.isin(bucket_meta, configured)
+        if mask.any():
+            out[mask] = results[func]()[mask]
+
+    return bucket_meta, minutes[starts], out
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# analytics_utils.py
+# Version      : 1.1.0
+# Last updated : 2026-10-18
+# Description  : Per-month partial summaries of solar_log_v2 that
+#                worker processes compute independently and that
+#                merge into month and year reports
+# ---------------------------------------------
+
+import numpy as np
+from archive_utils import month_bounds
+from columnar_utils import fetch_columns
+from db_utils import open_readonly
+from interpolation_utils import watt_per_klux_column
+
+# Log-spaced watt/klux histogram bins, 200 per decade (~1.2 % wide):
+# mergeable by addition, percentiles are read from the cumulative counts
+WPK_BINS = np.geomspace(0.01, 100000, 7 * 200 + 1)
+
+SUM_FIELDS = ["rows", "days", "minutes", "energy1_kwh", "energy2_kwh", "wpk_sum", "wpk_minutes"]
+MAX_FIELDS = ["peak_power1", "peak_power2", "max_lux"]
+
+
+def month_columns(db_path, month, weighted=True, site_id=None):
+    """
+    lux/power columns of one month (of one site if site_id is given) on
+    a private read-only connection; 'minutes' is the source_resolution
+    of each row (1 without weighted)
+    """
+    lo, hi = month_bounds(month)
+    conn = open_readonly(db_path)
+    try:
+        cursor = conn.execute(f"""
+            SELECT epoch_minute, lux, power1, power2,
+                   {'COALESCE(source_resolution, 1)' if weighted else '1'}
+            FROM solar_log_v2
+            WHERE epoch_minute >= ? AND epoch_minute < ?{'' if site_id is None else ' AND site_id = ?'}
+        """, (lo, hi) if site_id is None else (lo, hi, site_id))
+        return fetch_columns(cursor, ["lux", "power1", "power2", "minutes"])
+    finally:
+        conn.close()
+
+
+def _nanmax(values):
+    return float(np.nanmax(values)) if len(values) and not np.isnan(values).all() else None
+
+
+def month_partial(period, columns):
+    """
+    Mergeable summary of column arrays: sums, maxima and the watt/klux
+    histogram. Energy integrates power over the minutes each row
+    stands for; missing power counts as 0.
+    """
+    minutes = columns["minutes"]
+    wpk = watt_per_klux_column(columns)
+    daylight = wpk > 0
+    return {
+        "period": period,
+        "rows": len(minutes),
+        "days": len(np.unique(columns["timestamp"] // 1440)),
+        "minutes": float(minutes.sum()),
+        "energy1_kwh": float(np.nansum(columns["power1"] * minutes)) / 60000,
+        "energy2_kwh": float(np.nansum(columns["power2"] * minutes)) / 60000,
+        "peak_power1": _nanmax(columns["power1"]),
+        "peak_power2": _nanmax(columns["power2"]),
+        "max_lux": _nanmax(columns["lux"]),
+        "wpk_sum": float((wpk[daylight] * minutes[daylight]).sum()),
+        "wpk_minutes": float(minutes[daylight].sum()),
+        "wpk_hist": np.histogram(np.clip(wpk[daylight], WPK_BINS[0], WPK_BINS[-1]),
+                                 bins=WPK_BINS, weights=minutes[daylight])[0],
+    }
+
+
+def analyze_month(db_path, month, weighted=True, site_id=None):
+    """Worker entry point: the partial summary of one logbook month"""
+    return month_partial(month, month_columns(db_path, month, weighted, site_id))
+
+
+def merge_partials(period, partials):
+    """One partial summary from several (e.g. the months of a year)"""
+    merged = {"period": period}
+    for field in SUM_FIELDS:
+        merged[field] = sum(p[field] for p in partials)
+    for field in MAX_FIELDS:
+        values = [p[field] for p in partials if p[field] is not None]
+        merged[field] = max(values) if values else None
+    merged["wpk_hist"] = np.sum([p["wpk_hist"] for p in partials], axis=0)
+    return merged
+
+
+def hist_percentile(hist, q):
+    """q-th percentile (0-100) of the values counted in a WPK_BINS histogram"""
+    total = hist.sum()
+    if not total:
+        return None
+    i = int(np.searchsorted(np.cumsum(hist), total * q / 100))
+    # geometric bin centre
+    return float(np.sqrt(WPK_BINS[i] * WPK_BINS[i + 1]))
+
+
+def summary_row(partial):
+    """Report values of a (merged) partial, rounded for output"""
+    def rounded(value, digits):
+        return None if value is None else round(value, digits)
+
+    energy = partial["energy1_kwh"] + partial["energy2_kwh"]
+    return {
+        "period": partial["period"],
+        "days": partial["days"],
+        "rows": partial["rows"],
+        "energy_kwh": round(energy, 2),
+        "energy1_kwh": round(partial["energy1_kwh"], 2),
+        "energy2_kwh": round(partial["energy2_kwh"], 2),
+        "kwh_per_day": round(energy / partial["days"], 2) if partial["days"] else None,
+        "peak_power1": rounded(partial["peak_power1"], 1),
+        "max_lux": rounded(partial["max_lux"], 1),
+        "wpk_mean": round(partial["wpk_sum"] / partial["wpk_minutes"], 1) if partial["wpk_minutes"] else None,
+        "wpk_p10": rounded(hist_percentile(partial["wpk_hist"], 10), 1),
+        "wpk_p50": rounded(hist_percentile(partial["wpk_hist"], 50), 1),
+        "wpk_p90": rounded(hist_percentile(partial["wpk_hist"], 90), 1),
+    }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# analyze_solar_logbook.py
+# Version       : 1.1.0
+# Last updated  : 2026-10-18
+# Description   : Month and year reports (yield, peak power, watt/klux
+#                 distribution) over solar_log_v2, one month per
+#                 worker process
+# ---------------------------------------------
+
+import argparse
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from archive_solar_logbook import logbook_months
+from config_utils import load_config
+from db_utils import connection
+from site_utils import DEFAULT_SITE, logbook_sites
+from stats_utils import RunStats, emit_stats
+
+# numpy (analytics_utils) and tabulate are imported once the months to
+# analyze are known
+
+REPORT_HEADERS = ["period", "days", "rows", "energy_kwh", "energy1_kwh", "energy2_kwh", "kwh_per_day",
+                  "peak_power1", "max_lux", "wpk_mean", "wpk_p10", "wpk_p50", "wpk_p90", "vs_prev_year_pct"]
+
+
+def analyze(db_path, months, workers=None, weighted=True, site_id=None):
+    """
+    Partial summaries of the given months (of one site if site_id is
+    given), each computed in a worker process with its own read-only
+    connection (workers=None: one per core, 1: in this process).
+    Returns them in month order.
+    """
+    from analytics_utils import analyze_month
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(months) == 1:
+        return [analyze_month(db_path, month, weighted, site_id) for month in months]
+    with ProcessPoolExecutor(max_workers=min(workers, len(months))) as pool:
+        return list(pool.map(analyze_month, [db_path] * len(months), months, [weighted] * len(months),
+                             [site_id] * len(months)))
+
+
+def report(partials, group="month"):
+    """
+    Report rows per month or merged per year; vs_prev_year_pct compares
+    kWh per day with the same period one year earlier
+    """
+    from analytics_utils import merge_partials, summary_row
+
+    if group == "year":
+        years = {}
+        for partial in partials:
+            years.setdefault(partial["period"][:4], []).append(partial)
+        partials = [merge_partials(year, parts) for year, parts in sorted(years.items())]
+
+    rows = [summary_row(p) for p in partials if p["rows"]]
+    by_period = {row["period"]: row for row in rows}
+    for row in rows:
+        previous = by_period.get(f"{int(row['period'][:4]) - 1}{row['period'][4:]}")
+        row["vs_prev_year_pct"] = None
+        if previous and previous["kwh_per_day"]:
+            row["vs_prev_year_pct"] = round((row["kwh_per_day"] / previous["kwh_per_day"] - 1) * 100, 1)
+    return rows
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser(config):
+    parser = argparse.ArgumentParser(
+        description="Analyze solar_log_v2 per month or year, one month per worker process."
+    )
+    parser.add_argument(
+        '--db-path',
+        default=config.get("paths", "logbook_db_path", fallback="/config/solar_logbook.db"),
+        help='Path to the SQLite database'
+    )
+    parser.add_argument('--from-month', help='First month (YYYY-MM). Default: first month in the logbook')
+    parser.add_argument('--to-month', help='Last month (YYYY-MM). Default: last month in the logbook')
+    parser.add_argument('--group', choices=["month", "year"], default="month", help='Report per month or per year (default: month)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per core, 1 = no pool)')
+    parser.add_argument('--format', action='store_true', help='Pretty-print the result in table format')
+    parser.add_argument('--json', help='Also write the report rows to this JSON file')
+    parser.add_argument('--site', default=DEFAULT_SITE, help=f'Site to analyze (default: {DEFAULT_SITE})')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None, connections=None):
+    config = load_config()
+    args = build_parser(config).parse_args(argv)
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ Database not found at {args.db_path}")
+        exit(1)
+
+    stats = RunStats("analyze")
+    with connection(args.db_path, connections) as conn:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_xinfo(solar_log_v2)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "epoch_minute" not in columns:
+            print("❌ solar_log_v2 has no epoch_minute column. Run migrate_solar_logbook.py first.")
+            exit(1)
+        try:
+            [(_, site_id)] = logbook_sites(cursor, [args.site])
+            months = logbook_months(cursor, site_id)
+        except sqlite3.OperationalError as e:
+            print(f"❌ SQLite error: {e}")
+            exit(1)
+        except KeyError:
+            print(f"❌ Site '{args.site}' has no rows in the logbook.")
+            exit(1)
+
+    months = [m for m in months
+              if (not args.from_month or m >= args.from_month) and (not args.to_month or m <= args.to_month)]
+    if not months:
+        print("ℹ️ No data found.")
+        return
+
+    with stats.stage("analyze"):
+        partials = analyze(args.db_path, months, args.workers, "source_resolution" in columns, site_id)
+    with stats.stage("merge"):
+        rows = report(partials, args.group)
+    stats.count("months", len(months))
+    stats.count("rows", sum(p["rows"] for p in partials))
+
+    with stats.stage("render"):
+        table = [[row[h] for h in REPORT_HEADERS] for row in rows]
+        if args.format:
+            from tabulate import tabulate
+
+            print(tabulate(table, headers=REPORT_HEADERS, tablefmt="grid"))
+        else:
+            print("\t".join(REPORT_HEADERS))
+            for r in table:
+                print("\t".join("" if v is None else str(v) for v in r))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✅ Report written to {args.json}")
+    emit_stats(stats, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# archive_solar_logbook.py
+# Version       : 1.3.1
+# Last updated  : 2026-10-18
+# Description   : Freeze closed months of solar_log_v2 into a
+#                 memory-mappable columnar archive (default site)
+# ---------------------------------------------
+
+import os
+import argparse
+from datetime import datetime, timezone
+from archive_utils import archive_month, load_manifest, month_bounds, month_of_minute
+from config_utils import load_config
+from db_utils import connection
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, has_site_column
+from system_config_utils import SYSTEM_COLUMNS, CONFIG_ID_COLUMN
+
+
+def archivable_columns(cursor):
+    """
+    All stored REAL columns of solar_log_v2 plus the system columns kept
+    in system_config, or None if the table lacks the epoch_minute key the
+    archive is built on
+    """
+    cursor.execute("PRAGMA table_xinfo(solar_log_v2)")
+    table_info = cursor.fetchall()
+    names = {row[1] for row in table_info}
+    if "epoch_minute" not in names:
+        return None
+    # table_xinfo 'hidden' flag: 0 = normal column, 2/3 = generated
+    columns = [row[1] for row in table_info if row[2].upper() == "REAL" and row[6] == 0]
+    if CONFIG_ID_COLUMN in names:
+        columns += SYSTEM_COLUMNS
+    return columns
+
+
+def logbook_months(cursor, site_id=None):
+    """Every month from the first to the last logbook row (of one site if site_id is given)"""
+    if site_id is None:
+        cursor.execute("SELECT MIN(epoch_minute), MAX(epoch_minute) FROM solar_log_v2")
+    else:
+        cursor.execute(f"SELECT MIN(epoch_minute), MAX(epoch_minute) FROM solar_log_v2 WHERE {SITE_COLUMN} = ?",
+                       (site_id,))
+    first, last = cursor.fetchone()
+    months = []
+    if first is not None:
+        month = month_of_minute(first)
+        while month <= month_of_minute(last):
+            months.append(month)
+            month = month_of_minute(month_bounds(month)[1])
+    return months
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser(config):
+    parser = argparse.ArgumentParser(description="Archive closed months of solar_log_v2 as per-column binary files.")
+    parser.add_argument(
+        '--db-path',
+        default=config.get("paths", "logbook_db_path", fallback="/config/solar_logbook.db"),
+        help='Path to the SQLite database'
+    )
+    parser.add_argument(
+        '--archive-dir',
+        default=config.get("paths", "archive_dir", fallback="/config/solar_archive"),
+        help='Archive directory'
+    )
+    parser.add_argument('--month', action='append', help='Month to archive (YYYY-MM). Default: all closed months not yet archived')
+    parser.add_argument('--compress', action='store_true', help='Gzip the column files (smaller, but read without memory mapping)')
+    parser.add_argument('--force', action='store_true', help='Re-archive months that are already in the archive')
+    parser.add_argument('--list', action='store_true', help='List archived months and exit')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None, connections=None):
+    args = build_parser(load_config()).parse_args(argv)
+
+    manifest = load_manifest(args.archive_dir) or {"months": {}}
+
+    if args.list:
+        if not manifest["months"]:
+            print("ℹ️ Archive is empty.")
+        for month, entry in sorted(manifest["months"].items()):
+            print(f"{month}\t{entry['rows']} rows\t{'gzip' if entry.get('compressed') else 'mmap'}\t{entry['archived_at']}")
+        return
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ Database not found at {args.db_path}")
+        exit(1)
+
+    with connection(args.db_path, connections) as conn:
+        cursor = conn.cursor()
+
+        # Columns to archive: all stored REAL columns
+        columns = archivable_columns(cursor)
+        if columns is None:
+            print("❌ solar_log_v2 has no epoch_minute column. Run migrate_solar_logbook.py first.")
+            exit(1)
+
+        # Months to archive: only closed ones
+        current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+        months = sorted(set(args.month)) if args.month else logbook_months(
+            cursor, DEFAULT_SITE_ID if has_site_column(cursor) else None)
+
+        archived = 0
+        for month in months:
+            if month >= current_month:
+                print(f"⚠️ {month} is not closed yet, skipped")
+                continue
+            if month in manifest["months"] and not args.force:
+                continue
+            rows = archive_month(cursor, args.archive_dir, month, columns, args.compress)
+            archived += 1
+            print(f"✅ {month}: {rows} rows archived")
+
+    print(f"✅ Archive complete: {archived} month(s) written to {args.archive_dir}")
+
+
+if __name__ == "__main__":
+    main()
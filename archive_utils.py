@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# archive_utils.py
+# Version      : 1.3.1
+# Last updated : 2026-10-18
+# Description  : Columnar monthly archive of solar_log_v2:
+#                one binary file per column, read via memory mapping;
+#                holds the default site
+# ---------------------------------------------
+
+import calendar
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, has_site_column
+from system_config_utils import logbook_source
+
+# numpy is imported by the functions that read or write column files;
+# manifest lookups stay cheap for queries that never touch the archive
+
+ARCHIVE_FORMAT = 1
+MANIFEST = "manifest.json"
+TIMESTAMP_DTYPE = "<i4"   # epoch minutes
+VALUE_DTYPE = "<f4"       # NULL stored as NaN
+WIDE_VALUE_DTYPE = "<f8"  # for columns float32 cannot hold exactly
+
+# The exporter stores at most 3 decimals; rounding float32 values on read
+# hides their representation error (300.68 -> 300.67999267...)
+VALUE_DECIMALS = 3
+
+FILE_SUFFIX = {TIMESTAMP_DTYPE: ".i4", VALUE_DTYPE: ".f4", WIDE_VALUE_DTYPE: ".f8"}
+
+
+def month_bounds(month):
+    """Epoch-minute range [first, end) of a 'YYYY-MM' month (UTC)"""
+    year, mon = int(month[:4]), int(month[5:7])
+    first = calendar.timegm((year, mon, 1, 0, 0, 0)) // 60
+    days = calendar.monthrange(year, mon)[1]
+    return first, first + days * 1440
+
+
+def month_of_minute(minute):
+    return datetime.fromtimestamp(minute * 60, tz=timezone.utc).strftime("%Y-%m")
+
+
+def month_range(first, last):
+    """'YYYY-MM' months from that of timestamp first to that of last"""
+    year, mon = int(first[:4]), int(first[5:7])
+    months = []
+    while f"{year:04d}-{mon:02d}" <= last[:7]:
+        months.append(f"{year:04d}-{mon:02d}")
+        year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return months
+
+
+def load_manifest(archive_dir):
+    """Return the archive manifest or None if there is no archive"""
+    if not archive_dir:
+        return None
+    try:
+        with open(os.path.join(archive_dir, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        print(f"⚠️ Unsupported archive format in {archive_dir}, archive ignored")
+        return None
+    return manifest
+
+
+def save_manifest(archive_dir, manifest):
+    path = os.path.join(archive_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _column_path(archive_dir, month, name, dtype, compressed):
+    return os.path.join(archive_dir, month, name + FILE_SUFFIX[dtype] + (".gz" if compressed else ""))
+
+
+def _value_dtype(values):
+    """float32 if it round-trips the column at VALUE_DECIMALS, else float64"""
+    import numpy as np
+
+    narrow = np.round(values.astype(VALUE_DTYPE).astype(np.float64), VALUE_DECIMALS)
+    return VALUE_DTYPE if np.array_equal(narrow, values, equal_nan=True) else WIDE_VALUE_DTYPE
+
+
+def _write_array(path, array, compressed):
+    data = array.tobytes()
+    if compressed:
+        with gzip.open(path, "wb") as f:
+            f.write(data)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def _read_array(path, dtype, compressed):
+    import numpy as np
+
+    if compressed:
+        with gzip.open(path, "rb") as f:
+            return np.frombuffer(f.read(), dtype=dtype)
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def archive_month(cursor, archive_dir, month, columns, compress=False):
+    """
+    Freeze one month of solar_log_v2 into per-column files and register
+    it in the manifest: int32 epoch minutes, float32 values where that
+    is lossless, float64 otherwise. System columns are archived with
+    their system_config values; only rows of the default site are
+    archived. Returns the number of archived rows.
+    """
+    import numpy as np
+
+    first, end = month_bounds(month)
+    site = f"AND solar_log_v2.{SITE_COLUMN} = {DEFAULT_SITE_ID}" if has_site_column(cursor) else ""
+    cursor.execute(f"""
+        SELECT epoch_minute, {', '.join(columns)}
+        FROM {logbook_source(cursor)}
+        WHERE epoch_minute >= ? AND epoch_minute < ? {site}
+        ORDER BY epoch_minute
+    """, (first, end))
+    rows = cursor.fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns) + 1)
+
+    os.makedirs(os.path.join(archive_dir, month), exist_ok=True)
+    _write_array(_column_path(archive_dir, month, "timestamp", TIMESTAMP_DTYPE, compress),
+                 data[:, 0].astype(TIMESTAMP_DTYPE), compress)
+    dtypes = {}
+    for i, name in enumerate(columns, start=1):
+        dtypes[name] = _value_dtype(data[:, i])
+        _write_array(_column_path(archive_dir, month, name, dtypes[name], compress),
+                     data[:, i].astype(dtypes[name]), compress)
+
+    manifest = load_manifest(archive_dir) or {"format": ARCHIVE_FORMAT, "months": {}}
+    manifest["months"][month] = {
+        "rows": len(rows),
+        "columns": dtypes,
+        "compressed": compress,
+        "archived_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    save_manifest(archive_dir, manifest)
+    return len(rows)
+
+
+def invalidate_months(archive_dir, months):
+    """
+    Drop months from the manifest after their logbook rows changed, so
+    queries read them from SQLite again. Returns the dropped months.
+    """
+    manifest = load_manifest(archive_dir)
+    if not manifest:
+        return []
+    dropped = sorted(m for m in months if m in manifest["months"])
+    for month in dropped:
+        del manifest["months"][month]
+    if dropped:
+        save_manifest(archive_dir, manifest)
+    return dropped
+
+
+def read_month(archive_dir, manifest, month, names, lo=None, hi=None):
+    """
+    Load the archived columns of one month, restricted to epoch minutes
+    [lo, hi). Only the needed slice of each memory-mapped file is copied.
+
+    Returns:
+        dict: {"timestamp": int64, name: float64, ...}; columns missing
+        in the archive are NaN
+    """
+    import numpy as np
+
+    entry = manifest["months"][month]
+    compressed = entry.get("compressed", False)
+    ts = _read_array(_column_path(archive_dir, month, "timestamp", TIMESTAMP_DTYPE, compressed),
+                     TIMESTAMP_DTYPE, compressed)
+    start = int(np.searchsorted(ts, lo)) if lo is not None else 0
+    stop = int(np.searchsorted(ts, hi)) if hi is not None else len(ts)
+
+    columns = {"timestamp": np.asarray(ts[start:stop], dtype=np.int64)}
+    for name in names:
+        dtype = entry["columns"].get(name)
+        if dtype:
+            values = np.asarray(_read_array(_column_path(archive_dir, month, name, dtype, compressed),
+                                            dtype, compressed)[start:stop], dtype=np.float64)
+            columns[name] = np.round(values, VALUE_DECIMALS) if dtype == VALUE_DTYPE else values
+        else:
+            columns[name] = np.full(stop - start, np.nan)
+    return columns
+
+
+def plan_segments(manifest, lo=None, hi=None):
+    """
+    Split the epoch-minute range [lo, hi) into time-ordered segments:
+    ("archive", month) for archived months and ("sql", lo, hi) for the
+    stretches in between (None = unbounded)
+    """
+    segments = []
+    cursor = lo
+    for month in sorted(manifest["months"]) if manifest else []:
+        m_first, m_end = month_bounds(month)
+        if (hi is not None and m_first >= hi) or (lo is not None and m_end <= lo):
+            continue
+        if cursor is None or cursor < m_first:
+            segments.append(("sql", cursor, m_first))
+        segments.append(("archive", month))
+        cursor = m_end
+    if cursor is None or hi is None or cursor < hi:
+        segments.append(("sql", cursor, hi))
+    return segments
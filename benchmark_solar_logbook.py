@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# benchmark_solar_logbook.py
+# Version       : 1.0.0
+# Last updated  : 2026-10-18
+# Description   : Time export, insert, query, duplicate removal and
+#                 interpolation on synthetic databases and write the
+#                 results as JSON for comparison between versions
+# ---------------------------------------------
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from configparser import ConfigParser
+from datetime import date, datetime, timedelta, timezone
+from config_utils import load_config
+from export_solar_logbook import export_day, backfill
+from generate_synthetic_db import DEFAULT_SITE, create_logbook, generate_ha_db
+from interpolation_utils import interpolate_timeseries
+from query_solar_logbook import VALUE_HEADERS, query, remove_duplicates
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------------------------------------
+# Fixtures
+# ---------------------------------------------
+def copy_db(src, dst):
+    """Consistent copy of an SQLite DB (WAL included) via the backup API"""
+    if os.path.exists(dst):
+        os.remove(dst)
+    with contextlib.closing(sqlite3.connect(src)) as source, contextlib.closing(sqlite3.connect(dst)) as target:
+        source.backup(target)
+
+
+def fixture_info(ha_db, logbook_db):
+    """Size of the fixtures and the days they cover"""
+    with contextlib.closing(sqlite3.connect(ha_db)) as conn:
+        states, first, last = conn.execute(
+            "SELECT COUNT(*), MIN(last_updated_ts), MAX(last_updated_ts) FROM states").fetchone()
+        entities = conn.execute("SELECT COUNT(*) FROM states_meta").fetchone()[0]
+    with contextlib.closing(sqlite3.connect(logbook_db)) as conn:
+        logbook_rows = conn.execute("SELECT COUNT(*) FROM solar_log_v2").fetchone()[0]
+    return {
+        "states": states,
+        "entities": entities,
+        "logbook_rows": logbook_rows,
+        "first_day": datetime.fromtimestamp(first, tz=timezone.utc).date().isoformat(),
+        "last_day": datetime.fromtimestamp(last, tz=timezone.utc).date().isoformat(),
+        "ha_db_bytes": os.path.getsize(ha_db),
+        "logbook_db_bytes": os.path.getsize(logbook_db),
+    }
+
+
+def bench_config(ha_db, logbook_db, work_dir):
+    """Copy of the conf with [paths] pointing into the work directory"""
+    base = load_config()
+    config = ConfigParser()
+    config.read_dict({section: dict(base[section]) for section in base.sections()})
+    config["paths"].update(
+        ha_db_path=ha_db,
+        logbook_db_path=logbook_db,
+        output_dir=os.path.join(work_dir, "csv"),
+        archive_dir=os.path.join(work_dir, "archive"),
+    )
+    return config
+
+
+def code_version():
+    """Short git commit of the benchmarked tree, if it is a checkout"""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+# ---------------------------------------------
+# Benchmarks
+# ---------------------------------------------
+def timed(run, repeat, setup=None):
+    """
+    Call run(setup()) repeat times with stdout silenced; only run is timed.
+    Returns (seconds per run, result of the last run)
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        prepared = setup() if setup else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = run(prepared)
+            runs.append(time.perf_counter() - started)
+    return runs, result
+
+
+def benchmarks(config, fixture_db, work_dir, day, from_day, to_day, backfill_from, location):
+    """name -> (setup or None, run); run returns a summary dict with rows or a list of rows"""
+    target_db = config["paths"]["logbook_db_path"]
+    max_gap = config.getint("interpolation", "max_gap_minutes", fallback=15)
+    time_window = ["12:00", "2"]
+
+    def empty_logbook():
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_logbook(target_db, config)
+
+    def full_logbook():
+        copy_db(fixture_db, target_db)
+
+    def range_rows():
+        rows = query(fixture_db, from_day=from_day, to_day=to_day, limit=None)
+        for row in rows:
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        return rows
+
+    def interpolate(rows):
+        return interpolate_timeseries(rows, VALUE_HEADERS, max_gap)
+
+    def dedupe(_):
+        with contextlib.closing(sqlite3.connect(target_db)) as conn:
+            return {"rows": remove_duplicates(conn)}
+
+    return {
+        "export_day": (None, lambda _: export_day(day, config, location=location)),
+        "export_day_insert": (empty_logbook, lambda _: export_day(day, config, insert_db=True, location=location)),
+        "export_day_overwrite": (full_logbook, lambda _: export_day(day, config, insert_db=True, overwrite=True,
+                                                                    location=location)),
+        "export_backfill": (empty_logbook, lambda _: backfill(backfill_from, to_day, config, insert_db=True,
+                                                              location=location)),
+        "query_day": (None, lambda _: query(fixture_db, day=day, limit=None)),
+        "query_range": (None, lambda _: query(fixture_db, from_day=from_day, to_day=to_day, limit=None)),
+        "query_time": (None, lambda _: query(fixture_db, from_day=from_day, to_day=to_day,
+                                             time_of_day=time_window, limit=None)),
+        "query_interpolate": (None, lambda _: query(fixture_db, from_day=from_day, to_day=to_day, limit=None,
+                                                    interpolate=True, max_gap=max_gap)),
+        "remove_duplicates": (full_logbook, dedupe),
+        "interpolate_timeseries": (range_rows, interpolate),
+    }
+
+
+def result_rows(result):
+    if isinstance(result, dict):
+        return result.get("rows")
+    return len(result) if result is not None else None
+
+
+def compare(results, baseline_path, threshold):
+    """Print median changes against an earlier results file; True if none is slower than threshold %"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"🔎 Compared with {baseline_path} ({baseline.get('label')})")
+    ok = True
+    for name, entry in results.items():
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"ℹ️ {name:<24} no baseline")
+            continue
+        change = (entry["median_s"] / old["median_s"] - 1) * 100 if old["median_s"] else 0
+        slower = change > threshold
+        ok = ok and not slower
+        print(f"{'❌' if slower else '✅'} {name:<24} {old['median_s'] * 1000:9.1f} ms -> "
+              f"{entry['median_s'] * 1000:9.1f} ms ({change:+.1f} %)")
+    return ok
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the logbook tools on synthetic databases.")
+    parser.add_argument('--work-dir', default='/tmp/solar_logbook_bench',
+                        help='Directory for fixtures, scratch DBs and CSV files (default: /tmp/solar_logbook_bench)')
+    parser.add_argument('--days', type=int, default=90,
+                        help='Days of synthetic data when the fixtures are generated (default: 90)')
+    parser.add_argument('--extra-entities', type=int, default=20,
+                        help='Unrelated HA entities in generated fixtures (default: 20)')
+    parser.add_argument('--regenerate', action='store_true', help='Rebuild the fixtures even if they exist')
+    parser.add_argument('--backfill-days', type=int, default=7, help='Days read by the backfill benchmark (default: 7)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark; the median counts (default: 3)')
+    parser.add_argument('--only', nargs='+', help='Run only these benchmarks')
+    parser.add_argument('--label', help='Name of this run in the results (default: git commit)')
+    parser.add_argument('--output', help='Results file (default: benchmark_<label>.json in the work directory)')
+    parser.add_argument('--compare', help='Earlier results file to compare the medians with')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='With --compare: percent a median may grow before it counts as a regression (default: 10)')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    ha_db = os.path.join(args.work_dir, "home-assistant_v2.db")
+    fixture_db = os.path.join(args.work_dir, "solar_logbook.db")
+    if args.regenerate or not (os.path.exists(ha_db) and os.path.exists(fixture_db)):
+        print(f"🔧 Generating {args.days} day(s) of synthetic data in {args.work_dir}...")
+        start_day = (date.today() - timedelta(days=args.days)).isoformat()
+        generate_ha_db(ha_db, fixture_db, start_day, args.days, args.extra_entities)
+
+    info = fixture_info(ha_db, fixture_db)
+    config = bench_config(ha_db, os.path.join(args.work_dir, "scratch.db"), args.work_dir)
+    location = {"time_zone": DEFAULT_SITE["time_zone"]}
+    first_day = date.fromisoformat(info["first_day"])
+    last_day = date.fromisoformat(info["last_day"])
+    day = (first_day + (last_day - first_day) / 2).isoformat()
+    backfill_from = max(first_day, last_day - timedelta(days=args.backfill_days - 1)).isoformat()
+
+    suite = benchmarks(config, fixture_db, args.work_dir, day, info["first_day"], info["last_day"],
+                       backfill_from, location)
+    unknown = set(args.only or []) - set(suite)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))} (choose from {', '.join(suite)})")
+
+    print(f"ℹ️ Fixtures: {info['states']} states, {info['logbook_rows']} logbook rows, "
+          f"{info['first_day']} .. {info['last_day']}")
+    results = {}
+    for name, (setup, run) in suite.items():
+        if args.only and name not in args.only:
+            continue
+        runs, result = timed(run, args.repeat, setup)
+        results[name] = {
+            "median_s": statistics.median(runs),
+            "min_s": min(runs),
+            "runs_s": runs,
+            "rows": result_rows(result),
+        }
+        print(f"✅ {name:<24} {results[name]['median_s'] * 1000:9.1f} ms  ({results[name]['rows']} rows)")
+
+    label = args.label or code_version() or "unlabeled"
+    report = {
+        "label": label,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "parameters": {"day": day, "from_day": info["first_day"], "to_day": info["last_day"],
+                       "backfill_from": backfill_from},
+        "fixtures": info,
+        "results": results,
+    }
+    output = args.output or os.path.join(args.work_dir, f"benchmark_{label}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
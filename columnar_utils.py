@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# columnar_utils.py
+# Version      : 1.1.0
+# Last updated : 2026-10-18
+# Description  : Load solar_log_v2 query results into NumPy column
+#                arrays keyed by integer epoch minutes
+# ---------------------------------------------
+
+import numpy as np
+
+
+def _to_columns(data, names):
+    columns = {"timestamp": data[:, 0].astype(np.int64)}
+    for i, name in enumerate(names, start=1):
+        columns[name] = data[:, i]
+    return columns
+
+
+def iter_column_chunks(cursor, names, chunk_size=10000):
+    """
+    Yield the result of an executed query as column dicts of at most
+    chunk_size rows, so memory stays flat for arbitrarily long results.
+
+    The first selected column must be the epoch minute, the others are
+    numeric logbook columns (NULL becomes NaN).
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield _to_columns(np.array(rows, dtype=np.float64).reshape(len(rows), len(names) + 1), names)
+
+
+def fetch_columns(cursor, names, chunk_size=10000):
+    """
+    Read the result of an executed query into column arrays.
+
+    Returns:
+        dict: {"timestamp": int64 epoch minutes, name: float64, ...}
+    """
+    return concat_columns(list(iter_column_chunks(cursor, names, chunk_size)), names)
+
+
+def concat_columns(chunks, names):
+    """Join column-dict chunks into one column dict (empty if no chunks)"""
+    if not chunks:
+        return _to_columns(np.empty((0, len(names) + 1)), names)
+    return {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}
+
+
+def column_count(columns):
+    return len(columns["timestamp"])
+
+
+def timestamp_strings(minutes):
+    """Epoch minutes -> 'YYYY-MM-DD HH:MM:SS' (UTC) as a string array"""
+    iso = np.datetime_as_string(minutes.astype("datetime64[m]"), unit="s")
+    return np.char.replace(iso, "T", " ")
+
+
+def column_values(columns, headers):
+    """
+    Python value lists per header for output: timestamps as strings,
+    NaN as None; missing headers yield empty strings
+    """
+    n = column_count(columns)
+    values = []
+    for h in headers:
+        if h == "timestamp":
+            values.append(timestamp_strings(columns["timestamp"]).tolist())
+        elif h in columns:
+            col = columns[h]
+            values.append([None if v != v else v for v in col.tolist()])
+        else:
+            values.append([""] * n)
+    return values
+
+
+def iter_rows(columns, headers):
+    """Yield output rows (lists of Python values) in column order"""
+    return (list(row) for row in zip(*column_values(columns, headers)))
+
+
+def to_records(columns, headers):
+    """Build per-row dicts, only for callers that need record access"""
+    return [dict(zip(headers, row)) for row in iter_rows(columns, headers)]
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# config_utils.py
+# Version      : 1.0.0
+# Last updated : 2026-10-18
+# Description  : Load solar_logbook.conf once per process and
+#                typed helpers for optional values
+# ---------------------------------------------
+
+import os
+from configparser import ConfigParser
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solar_logbook.conf")
+
+# path -> (mtime, ConfigParser); a long-running process re-reads only after edits
+_config_cache = {}
+
+
+def load_config(path=DEFAULT_CONFIG_PATH):
+    """
+    Read the logbook config, cached until the file changes.
+    Callers must treat the returned ConfigParser as read-only.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        raise FileNotFoundError(f"❌ Config file not found: {path}")
+    cached = _config_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    config = ConfigParser()
+    if not config.read(path):
+        raise FileNotFoundError(f"❌ Config file not found: {path}")
+    _config_cache[path] = (mtime, config)
+    return config
+
+
+def get_optional_int(config, section, key):
+    val = config.get(section, key, fallback=None)
+    return int(val) if val else None
+
+
+def get_optional_float(config, section, key):
+    val = config.get(section, key, fallback=None)
+    return float(val) if val else None
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# correlation_utils.py
+# Version      : 1.3.0
+# Last updated : 2026-10-18
+# Description  : Running lux/power1 moments (weighted Welford) per month
+#                and system configuration, and per lux bin, for each
+#                site, kept up to date at insert time; regression slope, dispersion and
+#                outlier thresholds are read from them without a scan
+# ---------------------------------------------
+
+import math
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, logged_site_ids, partition_table
+from system_config_utils import logbook_source
+
+CORRELATION_TABLE = "solar_correlation"
+CORRELATION_BINS_TABLE = "solar_correlation_bins"
+
+# Fixed lux bin width of the histogram; changing it needs
+# rebuild_correlation() on existing logbooks
+LUX_BIN_WIDTH = 2000
+
+# rows, weight (minutes), means, sums of squared deviations (m2) and the
+# lux/power co-moment of one group of samples
+MOMENT_COLUMNS = ["rows", "weight", "mean_lux", "mean_power", "m2_lux", "m2_power", "c_lux_power"]
+EMPTY_MOMENTS = (0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+# Weights below this count as an emptied group (float residue of removals)
+_EPSILON = 1e-9
+
+CORRELATION_HEADERS = ["config", "months", "rows", "minutes", "mean_lux", "mean_power",
+                       "wpk_slope", "intercept", "r", "power_std", "residual_std", "outlier_band"]
+BIN_HEADERS = ["config", "lux_from", "lux_to", "rows", "minutes", "mean_lux", "mean_power",
+               "power_std", "wpk_mean", "outlier_low", "outlier_high"]
+
+
+def _create_tables(cursor):
+    columns = ", ".join(f"{c} {'INTEGER' if c == 'rows' else 'REAL'}" for c in MOMENT_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CORRELATION_TABLE} (
+            {SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID},
+            month TEXT,
+            config TEXT,
+            {columns},
+            PRIMARY KEY ({SITE_COLUMN}, month, config)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CORRELATION_BINS_TABLE} (
+            {SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID},
+            month TEXT,
+            config TEXT,
+            lux_bin INTEGER,
+            {columns},
+            PRIMARY KEY ({SITE_COLUMN}, month, config, lux_bin)
+        )
+    """)
+
+
+def ensure_correlation_tables(cursor):
+    """Create the moment tables; tables from before sites existed are keyed by site"""
+    for table in (CORRELATION_TABLE, CORRELATION_BINS_TABLE):
+        partition_table(cursor, table, _create_tables)
+    _create_tables(cursor)
+
+
+def config_key(modules, azimuth, tilt):
+    """String 1 configuration as 'modules/azimuth/tilt' ('-' for unset)"""
+    return "/".join("-" if v is None else f"{v:g}" for v in (modules, azimuth, tilt))
+
+
+# ---------------------------------------------
+# Moments
+# ---------------------------------------------
+def add_sample(moments, lux, power, weight=1.0):
+    """moments with one weighted (lux, power) sample added (West's update)"""
+    rows, w, mean_x, mean_y, m2_x, m2_y, c_xy = moments
+    w_new = w + weight
+    dx = lux - mean_x
+    dy = power - mean_y
+    mean_x += dx * weight / w_new
+    mean_y += dy * weight / w_new
+    return (rows + 1, w_new, mean_x, mean_y,
+            m2_x + weight * dx * (lux - mean_x),
+            m2_y + weight * dy * (power - mean_y),
+            c_xy + weight * dx * (power - mean_y))
+
+
+def merge_moments(a, b):
+    """
+    Moments of the union of two groups (Chan et al.). With b negated
+    (see negate()) it removes a subgroup exactly.
+    """
+    rows_a, w_a, mx_a, my_a, m2x_a, m2y_a, cxy_a = a
+    rows_b, w_b, mx_b, my_b, m2x_b, m2y_b, cxy_b = b
+    w = w_a + w_b
+    if abs(w) < _EPSILON:
+        return EMPTY_MOMENTS
+    dx = mx_b - mx_a
+    dy = my_b - my_a
+    f = w_a * w_b / w
+    return (rows_a + rows_b, w,
+            mx_a + dx * w_b / w,
+            my_a + dy * w_b / w,
+            max(m2x_a + m2x_b + dx * dx * f, 0.0),
+            max(m2y_a + m2y_b + dy * dy * f, 0.0),
+            cxy_a + cxy_b + dx * dy * f)
+
+
+def negate(moments):
+    rows, w, mean_x, mean_y, m2_x, m2_y, c_xy = moments
+    return (-rows, -w, mean_x, mean_y, -m2_x, -m2_y, -c_xy)
+
+
+def group_moments(samples):
+    """
+    Moments per (month, config) and per (month, config, lux bin) of
+    samples [(month, config, lux, power, weight)]
+    """
+    groups, bins = {}, {}
+    for month, config, lux, power, weight in samples:
+        key = (month, config)
+        groups[key] = add_sample(groups.get(key, EMPTY_MOMENTS), lux, power, weight)
+        bin_key = (month, config, int(lux // LUX_BIN_WIDTH))
+        bins[bin_key] = add_sample(bins.get(bin_key, EMPTY_MOMENTS), lux, power, weight)
+    return groups, bins
+
+
+# ---------------------------------------------
+# Storage
+# ---------------------------------------------
+def correlation_samples(cursor, first=None, last=None, site_id=DEFAULT_SITE_ID):
+    """
+    {timestamp: (month, config, lux, power1, minutes)} of the logbook rows
+    of a site between the minute timestamps first..last (inclusive,
+    default all) that have daylight and a power1 reading
+    """
+    where = f"solar_log_v2.{SITE_COLUMN} = ? AND lux > 0 AND power1 IS NOT NULL"
+    params = (site_id,)
+    if first is not None:
+        where += " AND timestamp BETWEEN ? AND ?"
+        params += (first, last)
+    cursor.execute(f"""
+        SELECT timestamp, lux, power1, modules1, azimuth1, tilt1, COALESCE(source_resolution, 1)
+        FROM {logbook_source(cursor)}
+        WHERE {where}
+    """, params)
+    return {ts: (ts[:7], config_key(modules, azimuth, tilt), lux, power, weight)
+            for ts, lux, power, modules, azimuth, tilt, weight in cursor.fetchall()}
+
+
+def _apply(cursor, table, key_columns, deltas):
+    """Merge delta moments into the stored rows of table; emptied rows are deleted"""
+    where = " AND ".join(f"{c} = ?" for c in key_columns)
+    for key, delta in deltas.items():
+        cursor.execute(f"SELECT {', '.join(MOMENT_COLUMNS)} FROM {table} WHERE {where}", key)
+        stored = cursor.fetchone()
+        moments = merge_moments(stored or EMPTY_MOMENTS, delta)
+        if moments[0] <= 0 or moments[1] < _EPSILON:
+            cursor.execute(f"DELETE FROM {table} WHERE {where}", key)
+        else:
+            columns = key_columns + MOMENT_COLUMNS
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['?'] * len(columns))})", (*key, *moments))
+
+
+def update_correlation(cursor, removed=(), added=(), site_id=DEFAULT_SITE_ID):
+    """
+    Take removed samples out of and add added samples to the stored
+    moments of a site (samples as in group_moments()). Does not commit.
+    """
+    ensure_correlation_tables(cursor)
+    removed_groups, removed_bins = group_moments(removed)
+    added_groups, added_bins = group_moments(added)
+    # Removals first: a removed and an added group of equal weight would
+    # cancel to zero weight in one delta and lose the change
+    for table, key_columns, minus, plus in (
+            (CORRELATION_TABLE, [SITE_COLUMN, "month", "config"], removed_groups, added_groups),
+            (CORRELATION_BINS_TABLE, [SITE_COLUMN, "month", "config", "lux_bin"], removed_bins, added_bins)):
+        _apply(cursor, table, key_columns, {(site_id, *key): negate(moments) for key, moments in minus.items()})
+        _apply(cursor, table, key_columns, {(site_id, *key): moments for key, moments in plus.items()})
+
+
+def refresh_correlation(cursor, before, after, site_id=DEFAULT_SITE_ID):
+    """
+    Update the moments of a site for rows that changed between two
+    correlation_samples() snapshots of the same timestamp range
+    """
+    removed = [sample for ts, sample in before.items() if after.get(ts) != sample]
+    added = [sample for ts, sample in after.items() if before.get(ts) != sample]
+    if removed or added:
+        update_correlation(cursor, removed, added, site_id)
+    return len(added)
+
+
+def rebuild_correlation(cursor, months=None, site_id=None):
+    """
+    Recompute the moments from solar_log_v2, of all months or only of
+    months ('YYYY-MM'), of every site or only of site_id; returns the
+    sample count
+    """
+    ensure_correlation_tables(cursor)
+    total = 0
+    for site in logged_site_ids(cursor) if site_id is None else [site_id]:
+        if months is None:
+            cursor.execute(f"DELETE FROM {CORRELATION_TABLE} WHERE {SITE_COLUMN} = ?", (site,))
+            cursor.execute(f"DELETE FROM {CORRELATION_BINS_TABLE} WHERE {SITE_COLUMN} = ?", (site,))
+            samples = list(correlation_samples(cursor, site_id=site).values())
+        else:
+            samples = []
+            for month in sorted(months):
+                for table in (CORRELATION_TABLE, CORRELATION_BINS_TABLE):
+                    cursor.execute(f"DELETE FROM {table} WHERE {SITE_COLUMN} = ? AND month = ?", (site, month))
+                samples += correlation_samples(cursor, f"{month}-01 00:00", f"{month}-31 23:59", site).values()
+        update_correlation(cursor, added=samples, site_id=site)
+        total += len(samples)
+    return total
+
+
+# ---------------------------------------------
+# Summaries
+# ---------------------------------------------
+def _merged(cursor, table, key_columns, from_month=None, to_month=None, site_ids=None):
+    """
+    Stored moments merged over the months in range and over the sites
+    site_ids (default all), keyed by key_columns
+    """
+    where, params = [], []
+    if site_ids is not None:
+        where.append(f"{SITE_COLUMN} IN ({', '.join(['?'] * len(site_ids))})")
+        params.extend(site_ids)
+    if from_month:
+        where.append("month >= ?")
+        params.append(from_month)
+    if to_month:
+        where.append("month <= ?")
+        params.append(to_month)
+    cursor.execute(f"""
+        SELECT month, {', '.join(key_columns)}, {', '.join(MOMENT_COLUMNS)}
+        FROM {table}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY {', '.join(key_columns)}, month
+    """, params)
+    merged, months = {}, {}
+    n = len(key_columns)
+    for row in cursor.fetchall():
+        key = row[1:1 + n]
+        merged[key] = merge_moments(merged.get(key, EMPTY_MOMENTS), row[1 + n:])
+        months.setdefault(key, set()).add(row[0])
+    return merged, months
+
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
+
+
+def correlation_summary(cursor, from_month=None, to_month=None, outlier_sigma=3.0, site_ids=None):
+    """
+    One row per configuration over the months in range and the sites
+    site_ids (default the whole fleet): least-squares
+    power1 = intercept + wpk_slope / 1000 * lux, correlation r, power and
+    residual standard deviations, and the residual band (outlier_sigma
+    residual std) outside which a minute counts as an outlier.
+    Raises sqlite3.OperationalError if the tables do not exist.
+    """
+    merged, months = _merged(cursor, CORRELATION_TABLE, ["config"], from_month, to_month, site_ids)
+    rows = []
+    for (config,), (n, w, mean_x, mean_y, m2_x, m2_y, c_xy) in merged.items():
+        slope = c_xy / m2_x if m2_x > 0 else None
+        residual = max(m2_y - c_xy * slope, 0.0) / w if slope is not None else None
+        rows.append([
+            config, len(months[(config,)]), n, round(w), _round(mean_x), _round(mean_y),
+            _round(slope * 1000 if slope is not None else None, 2),
+            _round(mean_y - slope * mean_x if slope is not None else None),
+            _round(c_xy / math.sqrt(m2_x * m2_y), 4) if m2_x > 0 and m2_y > 0 else None,
+            _round(math.sqrt(m2_y / w)),
+            _round(math.sqrt(residual) if residual is not None else None),
+            _round(outlier_sigma * math.sqrt(residual) if residual is not None else None),
+        ])
+    return rows
+
+
+def correlation_bins(cursor, from_month=None, to_month=None, outlier_sigma=3.0, site_ids=None):
+    """
+    One row per configuration and lux bin (site_ids as in
+    correlation_summary()): mean and standard deviation of power1 and
+    the outlier thresholds mean -/+ outlier_sigma std
+    """
+    merged, _ = _merged(cursor, CORRELATION_BINS_TABLE, ["config", "lux_bin"], from_month, to_month, site_ids)
+    rows = []
+    for (config, lux_bin), (n, w, mean_x, mean_y, _, m2_y, _) in merged.items():
+        std = math.sqrt(m2_y / w)
+        rows.append([
+            config, lux_bin * LUX_BIN_WIDTH, (lux_bin + 1) * LUX_BIN_WIDTH, n, round(w),
+            _round(mean_x), _round(mean_y), _round(std),
+            _round(mean_y / mean_x * 1000 if mean_x > 0 else None),
+            _round(max(mean_y - outlier_sigma * std, 0.0)), _round(mean_y + outlier_sigma * std),
+        ])
+    return rows
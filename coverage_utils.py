@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# coverage_utils.py
+# Version      : 1.1.0
+# Last updated : 2026-10-18
+# Description  : Minutes present per site, sensor and UTC day, refreshed at
+#                insert time, so incomplete days are found without
+#                scanning the minute rows
+# ---------------------------------------------
+
+import calendar
+from datetime import date, timedelta
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, logged_site_ids, partition_table
+
+COVERAGE_TABLE = "solar_coverage"
+
+# Logbook columns filled from HA sensors; "timestamp" counts the minutes
+# that have a row at all
+ROWS_SENSOR = "timestamp"
+COVERAGE_SENSORS = [
+    ROWS_SENSOR, "lux", "power1", "power2",
+    "grid_power", "grid_export", "grid_fossil_share", "total_power",
+    "power_load", "battery_load",
+    "solar_energy_string1", "solar_energy_string2"
+]
+
+
+def _create_table(cursor):
+    # minutes: weighted by source_resolution like the rollups, so rows from
+    # HA statistics count for the 5 / 60 minutes they stand for
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {COVERAGE_TABLE} (
+            {SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID},
+            day TEXT,
+            sensor TEXT,
+            minutes INTEGER,
+            PRIMARY KEY ({SITE_COLUMN}, day, sensor)
+        ) WITHOUT ROWID
+    """)
+
+
+def ensure_coverage_table(cursor):
+    partition_table(cursor, COVERAGE_TABLE, _create_table)
+    _create_table(cursor)
+
+
+def refresh_coverage(cursor, first, last, site_id=DEFAULT_SITE_ID):
+    """
+    Recount the coverage of a site for every UTC day overlapping the
+    minute timestamps first..last from solar_log_v2. Does not commit.
+    """
+    ensure_coverage_table(cursor)
+    first_day, last_day = first[:10], last[:10]
+    w = "COALESCE(source_resolution, 1)"
+    counts = ", ".join(
+        f"SUM({w})" if s == ROWS_SENSOR else f"SUM(({s} IS NOT NULL) * {w})" for s in COVERAGE_SENSORS
+    )
+    cursor.execute(f"""
+        SELECT substr(timestamp, 1, 10) AS day, {counts}
+        FROM solar_log_v2
+        WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?
+        GROUP BY day
+    """, (site_id, f"{first_day} 00:00", f"{last_day} 23:59"))
+    days = cursor.fetchall()
+
+    cursor.execute(f"DELETE FROM {COVERAGE_TABLE} WHERE {SITE_COLUMN} = ? AND day BETWEEN ? AND ?",
+                   (site_id, first_day, last_day))
+    cursor.executemany(
+        f"INSERT INTO {COVERAGE_TABLE} ({SITE_COLUMN}, day, sensor, minutes) VALUES (?, ?, ?, ?)",
+        [(site_id, day, sensor, minutes)
+         for day, *counts in days for sensor, minutes in zip(COVERAGE_SENSORS, counts)]
+    )
+
+
+def rebuild_coverage(cursor):
+    """Recount all days of every site from the full solar_log_v2 table; returns the number of site days"""
+    ensure_coverage_table(cursor)
+    cursor.execute(f"DELETE FROM {COVERAGE_TABLE}")
+    for site_id in logged_site_ids(cursor):
+        cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM solar_log_v2 WHERE {SITE_COLUMN} = ?", (site_id,))
+        first, last = cursor.fetchone()
+        if first is not None:
+            refresh_coverage(cursor, first, last, site_id)
+    cursor.execute(f"SELECT COUNT(*) FROM (SELECT DISTINCT {SITE_COLUMN}, day FROM {COVERAGE_TABLE})")
+    return cursor.fetchone()[0]
+
+
+def day_coverage(cursor, from_day, to_day, sensors=None, site_id=DEFAULT_SITE_ID):
+    """
+    {day: {sensor: minutes}} for the days from_day..to_day on which the
+    site has rows. Raises sqlite3.OperationalError if the table does not
+    exist.
+    """
+    sensors = sensors or COVERAGE_SENSORS
+    cursor.execute(f"""
+        SELECT day, sensor, minutes FROM {COVERAGE_TABLE}
+        WHERE {SITE_COLUMN} = ? AND day BETWEEN ? AND ? AND sensor IN ({', '.join(['?'] * len(sensors))})
+    """, (site_id, from_day, to_day, *sensors))
+    coverage = {}
+    for day, sensor, minutes in cursor.fetchall():
+        coverage.setdefault(day, {})[sensor] = minutes
+    return coverage
+
+
+def expected_minutes(day, start_utc, end_utc):
+    """
+    Minutes of the export window start_utc..end_utc (epoch seconds,
+    inclusive) that fall on the UTC day; the part of a window reaching
+    into a neighbouring day is counted there by the rows, not here
+    """
+    day_start = calendar.timegm(date.fromisoformat(day).timetuple()) // 60
+    first = max(int(start_utc) // 60, day_start)
+    last = min(int(end_utc) // 60, day_start + 1439)
+    return max(last - first + 1, 0)
+
+
+def deficient_days(coverage, expected, sensors, min_ratio):
+    """
+    [(day, {sensor: ratio})] of the days in expected ({day: expected
+    minutes}) where a sensor covers less than min_ratio of them; days
+    without rows have ratio 0 for every sensor
+    """
+    deficient = []
+    for day in sorted(expected):
+        if expected[day] <= 0:
+            continue
+        present = coverage.get(day, {})
+        ratios = {s: min(present.get(s, 0) / expected[day], 1.0) for s in sensors}
+        low = {s: r for s, r in ratios.items() if r < min_ratio}
+        if low:
+            deficient.append((day, low))
+    return deficient
+
+
+def day_runs(days):
+    """Consecutive ISO days as [(first, last)] ranges"""
+    runs = []
+    for day in sorted(days):
+        if runs and date.fromisoformat(runs[-1][1]) + timedelta(days=1) == date.fromisoformat(day):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# db_utils.py
+# Version      : 1.1.0
+# Last updated : 2026-10-18
+# Description  : SQLite connections that a long-running caller can
+#                keep open between runs
+# ---------------------------------------------
+
+import contextlib
+import os
+import sqlite3
+from urllib.parse import quote
+
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+
+def open_readonly(path, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, **kwargs):
+    """
+    Open an SQLite DB read-only (URI mode=ro): the connection can never
+    take a write lock, and waits up to busy_timeout_ms for a writer
+    instead of failing with "database is locked"
+    """
+    uri = f"file:{quote(os.path.abspath(path))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=busy_timeout_ms / 1000, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    return conn
+
+
+@contextlib.contextmanager
+def connection(path, connections=None, opener=sqlite3.connect):
+    """
+    Open path with opener and close it afterwards, or - if a connections
+    dict is given - reuse the connection pooled there and keep it open.
+
+    A pooled connection is reopened when the file was replaced, and work
+    left uncommitted by a failed run is rolled back.
+    """
+    if connections is None:
+        conn = opener(path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    key = (opener.__name__, path)
+    inode = os.stat(path).st_ino if os.path.exists(path) else None
+    conn, pooled_inode = connections.get(key, (None, None))
+    if conn is not None and pooled_inode != inode:
+        conn.close()
+        conn = None
+    if conn is None:
+        # Pooled connections are used by whichever thread runs next
+        conn = opener(path, check_same_thread=False)
+        connections[key] = (conn, os.stat(path).st_ino)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def close_connections(connections):
+    for conn, _ in connections.values():
+        conn.close()
+    connections.clear()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# efactor_utils.py
+# Version      : 1.1.0
+# Last updated : 2026-10-18
+# Description  : Energy efficiency factor (energy_efactor_readme.md)
+#                computed from logged columns: 1-hour solar mean from
+#                cumulative sums, stored per minute in solar_log_v2
+# ---------------------------------------------
+
+import calendar
+from datetime import datetime, timedelta
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, logged_site_ids
+
+# numpy is imported by the functions that compute the factor, so the
+# exporter imports this module without loading it
+
+EFACTOR_COLUMN = "energy_efactor"
+EFACTOR_COLUMN_SQL = f"ALTER TABLE solar_log_v2 ADD COLUMN {EFACTOR_COLUMN} REAL"
+
+# Trailing window of the solar mean, like sensor.average_electrical_solar_1h
+SOLAR_WINDOW_MINUTES = 60
+
+# grid_power and grid_fossil_share are only logged in minutes the sensor
+# reported; like an HA state the last value holds for at most this long
+STATE_HOLD_MINUTES = 60
+
+# Rows before a range that its factors depend on, and rows after it
+# whose factors depend on the range
+CONTEXT_MINUTES = max(SOLAR_WINDOW_MINUTES, STATE_HOLD_MINUTES)
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def shift_label(timestamp, minutes):
+    """Minute timestamp 'YYYY-MM-DD HH:MM' moved by minutes"""
+    return (datetime.strptime(timestamp[:16], _TIMESTAMP_FORMAT) + timedelta(minutes=minutes)).strftime(_TIMESTAMP_FORMAT)
+
+
+def rolling_mean(minutes, values, weights, window=SOLAR_WINDOW_MINUTES):
+    """
+    Weighted mean of values over the trailing window (t - window, t] of
+    every row (minutes sorted ascending), from two cumulative sums and
+    one searchsorted; NaN values are left out, NaN where none remain
+    """
+    import numpy as np
+
+    valid = ~np.isnan(values)
+    w = np.where(valid, weights, 0.0)
+    sum_vw = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0) * w)))
+    sum_w = np.concatenate(([0.0], np.cumsum(w)))
+    start = np.searchsorted(minutes, minutes - window, side="right")
+    end = np.arange(1, len(minutes) + 1)
+
+    total = sum_w[end] - sum_w[start]
+    out = np.full(len(minutes), np.nan)
+    has = total > 0
+    out[has] = (sum_vw[end] - sum_vw[start])[has] / total[has]
+    return out
+
+
+def hold_last(minutes, values, max_age=STATE_HOLD_MINUTES):
+    """values with NaN filled from the last value at most max_age minutes older"""
+    import numpy as np
+
+    index = np.where(~np.isnan(values), np.arange(len(values)), -1)
+    np.maximum.accumulate(index, out=index)
+    held = ~np.isnan(values) | ((index >= 0) & (minutes - minutes[np.maximum(index, 0)] <= max_age))
+    return np.where(held & (index >= 0), values[np.maximum(index, 0)], np.nan)
+
+
+def efactor_column(columns):
+    """
+    energy_efactor per row of a column dict (timestamp in epoch minutes,
+    power1, power2, grid_power, grid_fossil_share, minutes):
+
+        se = 1-hour mean of power1 + power2, ae = grid_power,
+        ee = 1 - grid_fossil_share / 100
+        ae <= 0: se / (se + ae), else (ee * ae + se) / (se + ae)
+
+    rounded to 2 decimals like the HA template; NaN without solar or
+    grid data and where se + ae is 0
+    """
+    import numpy as np
+
+    minutes = columns["timestamp"]
+    power1, power2 = columns["power1"], columns["power2"]
+    solar = np.where(np.isnan(power1) & np.isnan(power2), np.nan, np.nan_to_num(power1) + np.nan_to_num(power2))
+    se = rolling_mean(minutes, solar, columns["minutes"])
+    ae = hold_last(minutes, columns["grid_power"])
+    ee = 1 - hold_last(minutes, columns["grid_fossil_share"]) / 100
+
+    total = se + ae
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.where(ae <= 0, se, ee * ae + se) / total
+    factor[total == 0] = np.nan
+    return np.round(factor, 2)
+
+
+def refresh_efactor(cursor, first, last, site_id=DEFAULT_SITE_ID):
+    """
+    Recompute energy_efactor of a site for the minute timestamps
+    first..last (inclusive) and the CONTEXT_MINUTES after them, reading
+    the CONTEXT_MINUTES before as context. Only changed values are
+    written; does not commit. Returns the last timestamp that may have
+    changed.
+    """
+    import numpy as np
+    from columnar_utils import fetch_columns
+
+    until = shift_label(last, CONTEXT_MINUTES)
+    cursor.execute(f"""
+        SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 60,
+               power1, power2, grid_power, grid_fossil_share, COALESCE(source_resolution, 1), {EFACTOR_COLUMN}
+        FROM solar_log_v2
+        WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?
+        ORDER BY timestamp
+    """, (site_id, shift_label(first, -CONTEXT_MINUTES), until))
+    columns = fetch_columns(cursor, ["power1", "power2", "grid_power", "grid_fossil_share", "minutes", "stored"])
+    factor = efactor_column(columns)
+
+    lo = calendar.timegm(datetime.strptime(first[:16], _TIMESTAMP_FORMAT).timetuple()) // 60
+    stored = columns["stored"]
+    changed = (columns["timestamp"] >= lo) & ~((factor == stored) | (np.isnan(factor) & np.isnan(stored)))
+    if not changed.any():
+        return until
+    minutes = columns["timestamp"][changed]
+    labels = np.char.replace(np.datetime_as_string(minutes.astype("datetime64[m]"), unit="m"), "T", " ")
+    cursor.executemany(
+        f"UPDATE solar_log_v2 SET {EFACTOR_COLUMN} = ? WHERE {SITE_COLUMN} = ? AND timestamp = ?",
+        [(None if v != v else v, site_id, label) for v, label in zip(factor[changed].tolist(), labels.tolist())]
+    )
+    return until
+
+
+def rebuild_efactor(cursor):
+    """
+    Compute energy_efactor for the whole logbook, one vectorized pass
+    per site and month (with the hour before as context). Returns the
+    number of months.
+    """
+    months = 0
+    for site_id in logged_site_ids(cursor):
+        cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM solar_log_v2 WHERE {SITE_COLUMN} = ?", (site_id,))
+        first, last = cursor.fetchone()
+        if first is None:
+            continue
+        month = first[:7]
+        while month <= last[:7]:
+            year, mon = int(month[:4]), int(month[5:7])
+            next_month = f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+            refresh_efactor(cursor, f"{month}-01 00:00", shift_label(f"{next_month}-01 00:00", -1), site_id)
+            months += 1
+            month = next_month
+    return months
@@ -1,266 +1,1080 @@
 #!/usr/bin/env python3
 # ---------------------------------------------
 # export_solar_logbook.py
-# Version       : 1.5.4
-# Last updated  : 2025-08-31
+# Version       : 1.22.2
+# Last updated  : 2026-10-18
 # Author        : KlausiPapa & ChatGPT
-# Description   : Solar data export from Home Assistant with optional DB insert
+# Description   : Solar data export from Home Assistant with optional DB insert.
+#                 Importable: export_day() and backfill() take explicit
+#                 parameters, main() is the command line entry point.
+#                 Several sites: concurrent HA readers, one logbook writer
 # ---------------------------------------------
 
 import sqlite3
 import csv
 import os
 import argparse
+import contextlib
+import math
+from configparser import ConfigParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import timezone, datetime, timedelta
-import pytz
 from ha_location import read_ha_location_from_storage
-from configparser import ConfigParser
+from rollup_utils import refresh_rollups, RESOLUTION_COLUMN, RESOLUTION_COLUMN_SQL
+from efactor_utils import EFACTOR_COLUMN, refresh_efactor
+from correlation_utils import correlation_samples, refresh_correlation
+from coverage_utils import refresh_coverage
+from query_cache_utils import bump_generation
+from system_config_utils import SYSTEM_COLUMNS, CONFIG_ID_COLUMN, config_id, is_normalized, logbook_source
+from site_utils import (DEFAULT_SITE, DEFAULT_SITE_ID, SITE_COLUMN, ensure_site_column, is_partitioned,
+                        partition_table, site_config, site_id, site_location_path, site_names)
+from config_utils import load_config, get_optional_int, get_optional_float
+from stats_utils import RunStats, emit_stats
+from db_utils import connection
+from ha_reader import (open_ha_db, resolve_entities, resolve_statistics, StatesReader,
+                       StatisticsReader, DEFAULT_BUSY_TIMEOUT_MS)
+
+# numpy (aggregation_utils, archive_utils) and pytz are imported inside
+# the functions that need them, so importing this module stays cheap
 
 # ---------------------------------------------
-# Load config values
+# Logbook layout
 # ---------------------------------------------
-config = ConfigParser()
-config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solar_logbook.conf")
-if not config.read(config_path):
-    raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+# Logbook columns in insert order (matches the CSV header)
+DB_COLUMNS = [
+    "timestamp", "lux", "power1", "power2",
+    "modules1", "azimuth1", "tilt1",
+    "modules2", "azimuth2", "tilt2",
+    "batteries", "battery_cap",
+    "grid_power", "grid_export", "grid_fossil_share", "total_power",
+    "power_load", "battery_load",
+    "solar_energy_string1", "solar_energy_string2"
+]
+
+# Written to the DB only: minutes each row stands for (see rollup_utils)
+LOGBOOK_COLUMNS = DB_COLUMNS + [RESOLUTION_COLUMN]
 
-def get_optional_int(section, key):
-    val = config.get(section, key, fallback=None)
-    return int(val) if val else None
+# Written to a migrated logbook: the system values as a system_config id
+NORMALIZED_COLUMNS = [c for c in LOGBOOK_COLUMNS if c not in SYSTEM_COLUMNS] + [CONFIG_ID_COLUMN]
 
-def get_optional_float(section, key):
-    val = config.get(section, key, fallback=None)
-    return float(val) if val else None
+# Where rows come from: raw 'states' (per-minute aggregation) or HA's
+# pre-aggregated 'statistics' (5-minute / hourly, kept beyond purge_keep_days)
+SOURCES = ("states", "statistics")
 
-default_delta_hours = config.getint("time", "delta_hours", fallback=7)
+# Static PV system columns from [system] and their types
+SYSTEM_FIELDS = {
+    "modules1": int, "azimuth1": int, "tilt1": int,
+    "modules2": int, "azimuth2": int, "tilt2": int,
+    "batteries": int, "battery_cap": float,
+}
+
+# metadata_id is only unique within one site's HA DB
+WATERMARK_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS export_watermark (
+        {SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID},
+        metadata_id INTEGER,
+        entity_id TEXT,
+        last_updated_ts REAL,
+        PRIMARY KEY ({SITE_COLUMN}, metadata_id)
+    )
+"""
 
 # ---------------------------------------------
-# Argument parser
+# Settings from conf
 # ---------------------------------------------
-parser = argparse.ArgumentParser(
-    description="Export solar data for a given day from Home Assistant DB into CSV and optionally into a local logbook DB."
-)
-parser.add_argument('--day', help="Target date in format YYYY-MM-DD. Default is today.", default=datetime.now().date().isoformat())
-parser.add_argument('--insert-db', action='store_true', help="Insert result into local SQLite database 'solar_log_v2'.")
-parser.add_argument('--overwrite', action='store_true', help="Overwrite existing rows with the same timestamp in the DB.")
-parser.add_argument('--verbose', action='store_true', help="Enable verbose debug output.")
-parser.add_argument('--test', action='store_true', help="Only show last timestamp in DB for the selected day.")
-
-# System config overrides
-parser.add_argument('--modules1', type=int, default=None, help="Wp of modules (string 1).")
-parser.add_argument('--azimuth1', type=int, default=None, help="Azimuth angle (deg) of modules string 1.")
-parser.add_argument('--tilt1', type=int, default=None, help="Tilt angle (deg) of modules string 1.")
-parser.add_argument('--modules2', type=int, default=None, help="Wp of modules (string 2).")
-parser.add_argument('--azimuth2', type=int, default=None, help="Azimuth angle (deg) of modules string 2.")
-parser.add_argument('--tilt2', type=int, default=None, help="Tilt angle (deg) of modules string 2.")
-parser.add_argument('--batteries', type=int, default=None, help="Number of batteries.")
-parser.add_argument('--battery_cap', type=float, default=None, help="Total battery capacity in kWh.")
-
-parser.add_argument(
-    '--delta-hours',
-    type=int,
-    default=None,
-    help=f"Half-width of window around high noon in hours (default from conf: {default_delta_hours})"
-)
-parser.add_argument('--solar-offset', nargs='?', const="", help=(
-    "Solar correction in hours. If omitted, offset = 0. "
-    "If passed without value, the value from Home Assistant location will be used. "
-    "If passed with value, that will be used."
-))
-
-args = parser.parse_args()
+def system_values(config, overrides=None):
+    """Static system columns from [system]; non-None overrides win"""
+    overrides = overrides or {}
+    values = {}
+    for key, cast in SYSTEM_FIELDS.items():
+        if overrides.get(key) is not None:
+            values[key] = overrides[key]
+        elif cast is int:
+            values[key] = get_optional_int(config, "system", key)
+        else:
+            values[key] = get_optional_float(config, "system", key)
+    return values
+
+def entity_ids(config):
+    return [v for k, v in config["ha_sensors"].items()]
+
+def output_csv_path(config, day):
+    return os.path.join(config["paths"]["output_dir"], f"solar_log_{day}.csv")
+
+def resolve_solar_offset(value, location):
+    """
+    --solar-offset semantics: None -> 0, "" -> None (true solar noon at
+    the HA location, see high_noon_window()), anything else is parsed
+    as hours
+    """
+    if value is None:
+        return 0
+    if value == "":
+        if not location or location.get("longitude") is None:
+            print("⚠️ No HA location for --solar-offset, fallback to 0")
+            return 0
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        print("⚠️ Invalid --solar-offset, fallback to 0")
+        return 0
+
+def _get_aggregation(config, key, fallback):
+    from aggregation_utils import AGGREGATIONS
+
+    func = config.get("aggregation", key, fallback=fallback).strip().lower()
+    if func not in AGGREGATIONS:
+        print(f"⚠️ Unknown aggregation '{func}' for {key}, fallback to {fallback}")
+        return fallback
+    return func
+
+def aggregation_settings(config):
+    """(default function, {entity_id: function}) from [aggregation]"""
+    default = _get_aggregation(config, "default", "last")
+    by_entity = {
+        eid: _get_aggregation(config, key, default)
+        for key, eid in config["ha_sensors"].items()
+        if config.has_option("aggregation", key)
+    }
+    return default, by_entity
 
 # ---------------------------------------------
-# Fill missing args with conf values
+# Time range: High Noon local ± delta-hours
 # ---------------------------------------------
-args.modules1 = args.modules1 if args.modules1 is not None else get_optional_int("system", "modules1")
-args.azimuth1 = args.azimuth1 if args.azimuth1 is not None else get_optional_int("system", "azimuth1")
-args.tilt1 = args.tilt1 if args.tilt1 is not None else get_optional_int("system", "tilt1")
-args.modules2 = args.modules2 if args.modules2 is not None else get_optional_int("system", "modules2")
-args.azimuth2 = args.azimuth2 if args.azimuth2 is not None else get_optional_int("system", "azimuth2")
-args.tilt2 = args.tilt2 if args.tilt2 is not None else get_optional_int("system", "tilt2")
-args.batteries = args.batteries if args.batteries is not None else get_optional_int("system", "batteries")
-args.battery_cap = args.battery_cap if args.battery_cap is not None else get_optional_float("system", "battery_cap")
-args.delta_hours = args.delta_hours if args.delta_hours is not None else default_delta_hours
+def high_noon_window(day, time_zone, delta_hours, solar_offset=0, longitude=None):
+    """
+    Return (start_utc, end_utc) epoch seconds of the high noon ± delta_hours
+    window for a YYYY-MM-DD date string: 12:00 local standard time minus
+    solar_offset hours, or with solar_offset=None the true solar noon at
+    longitude (including the equation of time)
+    """
+    if solar_offset is None:
+        from solar_utils import solar_noon_utc
+
+        high_noon = solar_noon_utc(day, longitude)
+        return high_noon - delta_hours * 3600, high_noon + delta_hours * 3600
+
+    import pytz
+
+    local_tz = pytz.timezone(time_zone)
+    day_dt = datetime.strptime(day, "%Y-%m-%d")
+    ntz_date = datetime(day_dt.year, 1, 1, 12, 0)
+    base_offset = local_tz.utcoffset(ntz_date).total_seconds() / 3600
+    NTZ = timezone(timedelta(hours=base_offset))
+
+    local_noon = datetime(day_dt.year, day_dt.month, day_dt.day, 12, 0, tzinfo=NTZ)
+    corrected_local_noon = local_noon - timedelta(hours=solar_offset)
+    high_noon_utc = corrected_local_noon.astimezone(pytz.utc)
+
+    start_utc = (high_noon_utc - timedelta(hours=delta_hours)).timestamp()
+    end_utc = (high_noon_utc + timedelta(hours=delta_hours)).timestamp()
+    return start_utc, end_utc
 
 # ---------------------------------------------
-# Paths
+# Aggregate by minute
 # ---------------------------------------------
-DB_PATH = config["paths"]["ha_db_path"]
-LOGBOOK_DB_PATH = config["paths"]["logbook_db_path"]
-OUTPUT_CSV = os.path.join(config["paths"]["output_dir"], f"solar_log_{args.day}.csv")
+def minute_label(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+def aggregate_by_minute(states, entity_map, default="last", by_entity=None, stats=None):
+    """
+    Bucket (metadata_id, state, last_updated_ts) tuples into
+    {minute: {entity_id: value}}, skipping non-numeric states (counted
+    as 'rejected' in stats). Each sensor uses its function from
+    by_entity, else default.
+    """
+    from aggregation_utils import parse_states, aggregate_minutes
+
+    by_entity = by_entity or {}
+    funcs = {meta_id: by_entity.get(eid, default) for meta_id, eid in entity_map.items()}
+    parsed = parse_states(states)
+    if stats is not None:
+        stats.count("rejected", len(states) - len(parsed[0]))
+    meta_ids, minutes, values = aggregate_minutes(*parsed, funcs, default)
+
+    temp_data = {}
+    labels = {}
+    for meta_id, minute, val in zip(meta_ids.tolist(), minutes.tolist(), values.tolist()):
+        label = labels.get(minute)
+        if label is None:
+            label = labels[minute] = minute_label(minute * 60)
+            temp_data[label] = {}
+        temp_data[label][entity_map[meta_id]] = round(val, 3)
+    return temp_data
 
 # ---------------------------------------------
-# Time range: High Noon local ± delta-hours
+# Build rows
 # ---------------------------------------------
-location = read_ha_location_from_storage()
-if location:
-    print("🔎 Location info:")
-    print("  Timezone        :", location['time_zone'])
-    print("  Solar offset    :", location['offset_hours'], "hours")
-
-day_dt = datetime.strptime(args.day, "%Y-%m-%d")
-ntz_date = datetime(day_dt.year, 1, 1, 12, 0)
-local_tz = pytz.timezone(location['time_zone'])
-base_offset = local_tz.utcoffset(ntz_date).total_seconds() / 3600
-NTZ = timezone(timedelta(hours=base_offset))
-
-if args.solar_offset is None:
-    solar_offset = 0
-elif args.solar_offset == "":
-    solar_offset = float(location['offset_hours'])
-else:
-    try:
-        solar_offset = float(args.solar_offset)
-    except ValueError:
-        print("⚠️ Invalid --solar-offset, fallback to 0")
-        solar_offset = 0
+def build_rows(temp_data, sensors, system, resolutions=None):
+    """
+    Logbook rows in LOGBOOK_COLUMNS order from aggregated minutes.
+    sensors maps [ha_sensors] keys to entity ids, system holds the
+    static columns (see system_values()); resolutions maps minutes to
+    the minutes their row stands for (default 1).
+    """
+    resolutions = resolutions or {}
+    rows = []
+    for minute in sorted(temp_data.keys()):
+        entry = temp_data[minute]
+        lux = entry.get(sensors["illuminance"])
+        power1 = entry.get(sensors["inverter_power_solax"]) or entry.get(sensors["inverter_power_mini"])
+        power2 = entry.get(sensors["inverter_power_hybrid"])
+        grid_power = entry.get(sensors["grid_power"])
+        grid_export = entry.get(sensors["grid_export"])
+        grid_fossil_share = entry.get(sensors["grid_fossil_share"])
+        total_power = entry.get(sensors["total_power"])
+        power_load = entry.get(sensors["power_load"])
+        battery_load = entry.get(sensors["battery_load"])
+        solar_energy1 = entry.get(sensors["solar_energy1"])
+        solar_energy2 = entry.get(sensors["solar_energy2"])
 
-local_noon = datetime(day_dt.year, day_dt.month, day_dt.day, 12, 0, tzinfo=NTZ)
-corrected_local_noon = local_noon - timedelta(hours=solar_offset)
-high_noon_utc = corrected_local_noon.astimezone(pytz.utc)
+        rows.append([
+            minute, lux, power1, power2,
+            system["modules1"], system["azimuth1"], system["tilt1"],
+            system["modules2"], system["azimuth2"], system["tilt2"],
+            system["batteries"], system["battery_cap"],
+            grid_power, grid_export, grid_fossil_share, total_power,
+            power_load, battery_load,
+            solar_energy1, solar_energy2,
+            resolutions.get(minute, 1)
+        ])
+    return rows
+
+# ---------------------------------------------
+# Write CSV
+# ---------------------------------------------
+def expected_values(model, rows):
+    """Per row: the EXPECTED_HEADERS values of a solar_utils.ExpectedPower model"""
+    import numpy as np
+    from solar_utils import EXPECTED_HEADERS
+
+    p1, p2 = DB_COLUMNS.index("power1"), DB_COLUMNS.index("power2")
+    columns = model.columns({
+        "timestamp": np.array([row[0] for row in rows], dtype="datetime64[m]").astype(np.int64),
+        "power1": np.array([row[p1] for row in rows], dtype=np.float64),
+        "power2": np.array([row[p2] for row in rows], dtype=np.float64),
+    })
+    values = [[None if v != v else v for v in columns[h].tolist()] for h in EXPECTED_HEADERS]
+    return list(zip(*values))
 
-start_utc = (high_noon_utc - timedelta(hours=args.delta_hours)).timestamp()
-end_utc = (high_noon_utc + timedelta(hours=args.delta_hours)).timestamp()
+def write_csv(path, rows, model=None):
+    """Day CSV in DB_COLUMNS order; with an ExpectedPower model plus its columns"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode="w", newline="") as f:
+        writer = csv.writer(f)
+        if model is None:
+            writer.writerow(DB_COLUMNS)
+            writer.writerows(row[:len(DB_COLUMNS)] for row in rows)
+            return
+        from solar_utils import EXPECTED_HEADERS
+
+        writer.writerow(DB_COLUMNS + EXPECTED_HEADERS)
+        writer.writerows([*row[:len(DB_COLUMNS)], *extra] for row, extra in zip(rows, expected_values(model, rows)))
 
 # ---------------------------------------------
-# Entity definitions from conf
+# Insert into logbook DB
 # ---------------------------------------------
-ENTITY_IDS = [v for k, v in config["ha_sensors"].items()]
+def open_logbook(path, **kwargs):
+    """
+    Open the logbook DB tuned for bulk writes (WAL, relaxed fsync, larger
+    page cache) and make sure (site_id, timestamp) can serve as upsert key.
+    Raises sqlite3.DatabaseError for a logbook that needs migrate or dedupe.
+    """
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -20000")
+    # Logbooks not migrated since energy_efactor / since HA statistics became a source
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(solar_log_v2)")}
+    if EFACTOR_COLUMN not in columns:
+        # Computing it for the whole history is migrate's job, not an export run's
+        conn.close()
+        raise sqlite3.DatabaseError("solar_log_v2 has no energy_efactor column. Run migrate_solar_logbook.py first.")
+    if RESOLUTION_COLUMN not in columns:
+        conn.execute(RESOLUTION_COLUMN_SQL)
+    try:
+        ensure_site_column(conn.cursor())
+    except sqlite3.IntegrityError:
+        conn.close()
+        raise sqlite3.IntegrityError("solar_log_v2 contains duplicate timestamps. "
+                                     "Run query_solar_logbook.py --remove-duplicates first.") from None
+    return conn
+
+def last_timestamp_in_window(cursor, start_utc, end_utc, site_id=DEFAULT_SITE_ID):
+    """Latest logbook timestamp of a site inside one day's high noon window, or None"""
+    cursor.execute(
+        f"SELECT MAX(timestamp) FROM solar_log_v2 WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?",
+        (site_id, minute_label(start_utc), minute_label(end_utc))
+    )
+    return cursor.fetchone()[0]
+
+def count_rows(cursor, rows, site_id=DEFAULT_SITE_ID):
+    if not rows:
+        return 0
+    cursor.execute(f"SELECT COUNT(*) FROM solar_log_v2 WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?",
+                   (site_id, rows[0][0], rows[-1][0]))
+    return cursor.fetchone()[0]
+
+# Columns a merge keeps from the stored row (see _upsert_sql())
+KEPT_COLUMNS = SYSTEM_COLUMNS + [CONFIG_ID_COLUMN]
+
+def _upsert_sql(columns):
+    """Upserts of rows (site_id, *columns); columns start with timestamp"""
+    insert_sql = f"""
+        INSERT INTO solar_log_v2 ({SITE_COLUMN}, {', '.join(columns)})
+        VALUES ({', '.join(['?'] * (len(columns) + 1))})
+    """
+    key = f"ON CONFLICT({SITE_COLUMN}, timestamp)"
+    return {
+        # Keep rows that are already there
+        "insert": insert_sql + f"{key} DO NOTHING",
+        # --overwrite: replace every column
+        "overwrite": insert_sql + f"""{key} DO UPDATE SET
+            {', '.join(f'{col} = excluded.{col}' for col in columns[1:])}""",
+        # --incremental / --fill: merge a re-aggregated minute into its
+        # existing row, columns without a new value keep what an earlier run
+        # stored; the system values stay those the row was first written with
+        "merge": insert_sql + f"""{key} DO UPDATE SET
+            {', '.join(f'{col} = COALESCE({col}, excluded.{col})' if col in KEPT_COLUMNS
+                       else f'{col} = COALESCE(excluded.{col}, {col})' for col in columns[1:])}""",
+    }
+
+UPSERT_SQL = _upsert_sql(LOGBOOK_COLUMNS)
+NORMALIZED_UPSERT_SQL = _upsert_sql(NORMALIZED_COLUMNS)
+
+def normalized_rows(cursor, rows, site_id=DEFAULT_SITE_ID):
+    """
+    rows (LOGBOOK_COLUMNS order) of a site in NORMALIZED_COLUMNS order:
+    the system values of each row replaced by their system_config id
+    """
+    system_index = [LOGBOOK_COLUMNS.index(c) for c in SYSTEM_COLUMNS]
+    value_index = [LOGBOOK_COLUMNS.index(c) for c in NORMALIZED_COLUMNS[:-1]]
+    # The system values rarely change within a batch: one lookup per distinct set
+    spans = {}
+    for row in rows:
+        span = spans.setdefault(tuple(row[i] for i in system_index), [row[0], row[0]])
+        span[1] = row[0]
+    ids = {values: config_id(cursor, values, first, last, site_id) for values, (first, last) in spans.items()}
+    return [[site_id] + [row[i] for i in value_index] + [ids[tuple(row[i] for i in system_index)]] for row in rows]
+
+def insert_mode(overwrite=False, incremental=False):
+    return "merge" if incremental else "overwrite" if overwrite else "insert"
+
+def insert_rows(cursor, rows, mode="insert", last_timestamp=None, touched_months=None, site_id=DEFAULT_SITE_ID):
+    """
+    Write rows (sorted by timestamp) of a site into solar_log_v2 with one
+    executemany upsert in the given UPSERT_SQL mode (system values as a
+    system_config id once migrate_solar_logbook.py moved them) and
+    refresh energy_efactor, the affected rollups, lux/power moments and
+    day coverage and the logbook generation (cached query results),
+    without committing. Months written are added to
+    touched_months. Returns (inserted, merged, skipped) counts.
+    """
+    if last_timestamp:
+        kept = [row for row in rows if row[0] > last_timestamp]
+    else:
+        kept = rows
+
+    before = count_rows(cursor, kept, site_id)
+    # Samples of the rows an upsert may replace, so their moments can be taken out
+    samples = correlation_samples(cursor, kept[0][0], kept[-1][0], site_id) if kept else {}
+    if is_normalized(cursor):
+        cursor.executemany(NORMALIZED_UPSERT_SQL[mode], normalized_rows(cursor, kept, site_id))
+    else:
+        cursor.executemany(UPSERT_SQL[mode], [(site_id, *row) for row in kept])
+    inserted = count_rows(cursor, kept, site_id) - before
+    merged = len(kept) - inserted if mode != "insert" else 0
+    skipped = len(rows) - inserted - merged
+
+    # Keep energy_efactor (also of the hour after, whose solar mean
+    # includes these minutes), hour/day/month rollups, lux/power
+    # moments and day coverage in step with the minutes just written
+    if inserted or merged:
+        until = refresh_efactor(cursor, kept[0][0], kept[-1][0], site_id)
+        refresh_rollups(cursor, kept[0][0], until, site_id)
+        refresh_correlation(cursor, samples, correlation_samples(cursor, kept[0][0], kept[-1][0], site_id), site_id)
+        refresh_coverage(cursor, kept[0][0], kept[-1][0], site_id)
+        bump_generation(cursor)
+        if touched_months is not None:
+            touched_months.update({kept[0][0][:7], kept[-1][0][:7], until[:7]})
+    return inserted, merged, skipped
+
+def invalidate_archive(archive_dir, touched_months):
+    """Archived copies of months written in this run are stale"""
+    if not touched_months:
+        return
+    from archive_utils import invalidate_months
+
+    dropped = invalidate_months(archive_dir, touched_months)
+    if dropped:
+        print(f"⚠️ Archived month(s) {', '.join(dropped)} changed and now read from SQLite; re-run archive_solar_logbook.py")
+
+def ensure_watermark_table(cursor):
+    partition_table(cursor, "export_watermark", lambda c: c.execute(WATERMARK_TABLE_SQL))
+    cursor.execute(WATERMARK_TABLE_SQL)
+
+def load_watermarks(cursor, site_id=DEFAULT_SITE_ID):
+    ensure_watermark_table(cursor)
+    return dict(cursor.execute(f"SELECT metadata_id, last_updated_ts FROM export_watermark WHERE {SITE_COLUMN} = ?",
+                               (site_id,)))
+
+def store_watermarks(cursor, new_watermarks, entity_map, site_id=DEFAULT_SITE_ID):
+    ensure_watermark_table(cursor)
+    cursor.executemany(f"""
+        INSERT INTO export_watermark ({SITE_COLUMN}, metadata_id, entity_id, last_updated_ts)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT({SITE_COLUMN}, metadata_id) DO UPDATE SET
+            entity_id = excluded.entity_id,
+            last_updated_ts = MAX(last_updated_ts, excluded.last_updated_ts)
+    """, [(site_id, meta_id, entity_map[meta_id], ts) for meta_id, ts in new_watermarks.items()])
+
+def track_watermarks(new_watermarks, states):
+    """Remember the highest last_updated_ts seen per entity"""
+    for meta_id, _, ts in states:
+        if ts > new_watermarks.get(meta_id, 0):
+            new_watermarks[meta_id] = ts
+
+def open_ha_source(path, **kwargs):
+    """Read-only HA DB connection with the [ha_db] busy timeout"""
+    config = load_config()
+    busy_timeout_ms = config.getint("ha_db", "busy_timeout_ms", fallback=DEFAULT_BUSY_TIMEOUT_MS)
+    return open_ha_db(path, busy_timeout_ms, **kwargs)
 
 # ---------------------------------------------
-# Read from Home Assistant database
+# HA statistics as source
 # ---------------------------------------------
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-
-entity_id_map = {}
-for eid in ENTITY_IDS:
-    cursor.execute("SELECT metadata_id FROM states_meta WHERE entity_id = ?", (eid,))
-    result = cursor.fetchone()
-    if result:
-        entity_id_map[result[0]] = eid
+def statistics_fields(stat_map, default="last", by_entity=None):
+    """Statistics column per sensor: min/max if configured in [aggregation], else mean"""
+    by_entity = by_entity or {}
+    fields = {}
+    for meta_id, eid in stat_map.items():
+        func = by_entity.get(eid, default)
+        fields[meta_id] = func if func in ("min", "max") else "mean"
+    return fields
+
+def statistics_minutes(reader, stat_map, fields, start_utc, end_utc, include_start=True):
+    """
+    {minute: {entity_id: value}} and {minute: resolution} for one window
+    from the HA statistics: 5-minute rows where statistics_short_term
+    still has them, hourly rows from statistics for the whole hours
+    before, so both never overlap. Sensors with a mean use the column
+    from fields, counters (total_increasing) their state.
+    """
+    short_from = reader.first_start("statistics_short_term")
+    if short_from is None:
+        boundary = math.inf
+    elif short_from <= start_utc:
+        boundary = start_utc
     else:
-        print(f"⚠️ Entity not found in states_meta: {eid}")
-
-metadata_ids = tuple(entity_id_map.keys())
-query = f"""
-SELECT metadata_id, state, last_updated_ts
-FROM states
-WHERE metadata_id IN ({','.join(['?'] * len(metadata_ids))})
-  AND last_updated_ts BETWEEN ? AND ?
-"""
-cursor.execute(query, (*metadata_ids, start_utc, end_utc))
-data = cursor.fetchall()
-conn.close()
+        boundary = math.ceil(short_from / 3600) * 3600
+
+    segments = []
+    if boundary > start_utc:
+        segments.append(("statistics", start_utc, min(end_utc, boundary - 1), include_start))
+    if boundary <= end_utc:
+        segments.append(("statistics_short_term", max(boundary, start_utc), end_utc,
+                         include_start or boundary > start_utc))
+
+    temp_data = {}
+    resolutions = {}
+    for table, lo, hi, inclusive in segments:
+        resolution = StatisticsReader.TABLES[table]
+        for meta_id, start_ts, mean, min_, max_, state in reader.read(table, stat_map, lo, hi, inclusive):
+            picked = {"mean": mean, "min": min_, "max": max_}[fields[meta_id]]
+            value = next((v for v in (picked, mean, state) if v is not None), None)
+            if value is None:
+                continue
+            label = minute_label(start_ts)
+            temp_data.setdefault(label, {})[stat_map[meta_id]] = round(value, 3)
+            resolutions[label] = resolution
+    return temp_data, resolutions
+
+def open_window_reader(conn, source, config, chunk_size=10000, stats=None):
+    """
+    Resolve the configured sensors for source ("states" or "statistics")
+    on an open HA DB connection; the lookup and (for states) the
+    aggregation are timed in stats ('metadata', 'aggregate').
+
+    Returns:
+        (reader, entity_map, read_window): read_window(start_utc, end_utc,
+        since=None, include_start=True) gives (states, temp_data,
+        resolutions) for one window - the raw states read (none for
+        statistics), {minute: {entity_id: value}} and {minute: minutes
+        per row} (None = all 1). entity_map is empty for statistics.
+    """
+    stats = stats or RunStats()
+    default_agg, agg_by_entity = aggregation_settings(config)
+    ha_db_path = config["paths"]["ha_db_path"]
+
+    if source == "statistics":
+        with stats.stage("metadata"):
+            stat_map = resolve_statistics(conn.cursor(), entity_ids(config), ha_db_path)
+        reader = StatisticsReader(conn, chunk_size)
+        fields = statistics_fields(stat_map, default_agg, agg_by_entity)
+
+        def read_window(start_utc, end_utc, since=None, include_start=True):
+            return ([], *statistics_minutes(reader, stat_map, fields, start_utc, end_utc, include_start))
+        return reader, {}, read_window
+
+    with stats.stage("metadata"):
+        entity_map = resolve_entities(conn.cursor(), entity_ids(config), ha_db_path)
+    reader = StatesReader(conn, chunk_size)
+
+    def read_window(start_utc, end_utc, since=None, include_start=True):
+        states = reader.read(entity_map, start_utc, end_utc, since, include_start)
+        with stats.stage("aggregate"):
+            temp_data = aggregate_by_minute(states, entity_map, default_agg, agg_by_entity, stats)
+        return states, temp_data, None
+    return reader, entity_map, read_window
+
+def count_read(stats, reader):
+    """Book the HA reader's range-scan time and row counts in stats"""
+    stats.add("scan", reader.snapshot_seconds)
+    stats.count("fetched", reader.rows)
+    stats.count("chunks", reader.chunks)
+
+def expected_model(config, location, system):
+    """solar_utils.ExpectedPower for the system's strings, None without HA location"""
+    from solar_utils import expected_power_model
+
+    model = expected_power_model(config, location, system)
+    if model is None:
+        print("⚠️ No HA latitude/longitude, expected power columns left out")
+    return model
+
+def _defaults(config, system, delta_hours, location):
+    if system is None:
+        system = system_values(config)
+    if delta_hours is None:
+        delta_hours = config.getint("time", "delta_hours", fallback=7)
+    if location is None:
+        location = read_ha_location_from_storage(site_location_path(config))
+    return system, delta_hours, location
+
+def logbook_site_id(cursor, site):
+    """site_id of a site in the logbook; a site besides the default one needs a partitioned logbook"""
+    if site != DEFAULT_SITE and not is_partitioned(cursor):
+        raise sqlite3.DatabaseError("solar_log_v2 is keyed by timestamp alone. "
+                                    "Run migrate_solar_logbook.py before exporting other sites.")
+    return site_id(cursor, site)
 
 # ---------------------------------------------
-# Aggregate by minute
+# Single day: fetch the high noon window
 # ---------------------------------------------
-temp_data = {}
-for meta_id, state, ts in data:
-    try:
-        val = float(state)
-    except (ValueError, TypeError):
-        continue
-    dt = datetime.fromtimestamp(ts, tz=timezone.utc).replace(second=0, microsecond=0)
-    minute = dt.strftime("%Y-%m-%d %H:%M")
-    entity = entity_id_map.get(meta_id)
-    if not entity:
-        continue
-    if minute not in temp_data:
-        temp_data[minute] = {}
-    temp_data[minute][entity] = val
+def export_day(day, config=None, insert_db=False, overwrite=False, incremental=False,
+               system=None, delta_hours=None, solar_offset=0, location=None,
+               connections=None, chunk_size=10000, source="states", verbose=False, stats=None,
+               expected=False, site=DEFAULT_SITE):
+    """
+    Export one day's high noon window from the HA DB into its CSV file
+    and, with insert_db, into solar_log_v2. incremental (implies
+    insert_db) only reads states newer than the per-entity watermarks.
+    source="statistics" reads HA's 5-minute/hourly statistics instead
+    of the raw states (not with incremental). site names a [site:NAME]
+    section whose HA DB, sensors and system values replace the plain ones.
+
+    system, delta_hours and location default to the conf / HA values;
+    connections is an optional dict of connections kept open between
+    calls (see db_utils.connection). The HA DB is read read-only in
+    chunks of at most chunk_size rows. Stage timings and counters are
+    added to stats (a stats_utils.RunStats) if given. expected adds the
+    clear-sky expected power and performance ratio to the CSV.
+
+    Returns:
+        dict with rows, inserted, updated, skipped and csv (path)
+    """
+    if incremental and source != "states":
+        raise ValueError("incremental exports read the raw states")
+    config = site_config(config or load_config(), site)
+    stats = stats or RunStats()
+    system, delta_hours, location = _defaults(config, system, delta_hours, location)
+    insert_db = insert_db or incremental
+    logbook_path = config["paths"]["logbook_db_path"]
+
+    # Incremental mode: per-entity watermarks
+    watermarks = {}
+    if incremental:
+        with connection(logbook_path, connections, open_logbook) as log_conn:
+            cursor = log_conn.cursor()
+            watermarks = load_watermarks(cursor, logbook_site_id(cursor, site))
+
+    # Short, chunked range scans per entity along the (metadata_id, last_updated_ts)
+    # index on a read-only connection. In incremental mode they start at the minute
+    # holding the watermark, so that minute is re-aggregated from all of its states.
+    ha_db_path = config["paths"]["ha_db_path"]
+    with connection(ha_db_path, connections, open_ha_source) as conn:
+        reader, entity_map, read_window = open_window_reader(conn, source, config, chunk_size, stats)
+        start_utc, end_utc = high_noon_window(day, location['time_zone'], delta_hours, solar_offset,
+                                              location.get('longitude'))
+
+        since = {meta_id: ts // 60 * 60 for meta_id, ts in watermarks.items()}
+        data, temp_data, resolutions = read_window(start_utc, end_utc, since)
+    count_read(stats, reader)
+
+    if verbose:
+        print(f"🔎 Fetched {reader.rows} {'state(s)' if source == 'states' else 'statistics row(s)'} from HA DB")
+        print(reader.report())
+
+    new_watermarks = {}
+    track_watermarks(new_watermarks, data)
+    with stats.stage("aggregate"):
+        rows = build_rows(temp_data, config["ha_sensors"], system, resolutions)
+    stats.count("minutes", len(rows))
+    summary = {"rows": len(rows), "inserted": 0, "updated": 0, "skipped": 0}
+
+    # Optional insert into logbook DB
+    if insert_db:
+        touched_months = set()
+        with connection(logbook_path, connections, open_logbook) as conn:
+            cursor = conn.cursor()
+            sid = logbook_site_id(cursor, site)
+            last_timestamp = None
+            if not overwrite and not incremental:
+                try:
+                    last_timestamp = last_timestamp_in_window(cursor, start_utc, end_utc, sid)
+                    if last_timestamp:
+                        print(f"ℹ️ Last DB timestamp: {last_timestamp}")
+                except sqlite3.Error as e:
+                    print(f"❌ SQLite error while checking last timestamp: {e}")
+
+            with stats.stage("insert"):
+                # The archive holds the default site only
+                insert_count, update_count, skip_count = insert_rows(
+                    cursor, rows, insert_mode(overwrite, incremental), last_timestamp,
+                    touched_months if sid == DEFAULT_SITE_ID else None, sid)
+                store_watermarks(cursor, new_watermarks, entity_map, sid)
+            with stats.stage("commit"):
+                conn.commit()
+            invalidate_archive(config.get("paths", "archive_dir", fallback=None), touched_months)
+
+            if incremental:
+                # The day CSV is rebuilt from the logbook so it stays complete
+                # although only the touched minutes were aggregated.
+                print(f"✅ Incremental update: {len(data)} new state(s), {update_count} minute(s) merged.")
+                cursor.execute(f"""
+                    SELECT {', '.join(DB_COLUMNS)}
+                    FROM {logbook_source(cursor)}
+                    WHERE solar_log_v2.{SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?
+                    ORDER BY timestamp
+                """, (sid, minute_label(start_utc), minute_label(end_utc)))
+                rows = cursor.fetchall()
+
+        print(f"✅ Data inserted into solar_log_v2: {insert_count} new row(s), {update_count} updated, {skip_count} skipped.")
+        summary.update(rows=len(rows), inserted=insert_count, updated=update_count, skipped=skip_count)
+        stats.count("inserted", insert_count)
+        stats.count("updated", update_count)
+        stats.count("skipped", skip_count)
+
+    csv_path = output_csv_path(config, day)
+    with stats.stage("csv"):
+        write_csv(csv_path, rows, expected_model(config, location, system) if expected else None)
+    summary["csv"] = csv_path
+
+    print(f"✅ Export complete: {len(rows)} rows to {csv_path}")
+    return summary
 
 # ---------------------------------------------
-# Build rows
+# Backfill: one ordered, chunked pass over states
 # ---------------------------------------------
-rows = []
-for minute in sorted(temp_data.keys()):
-    entry = temp_data[minute]
-    lux = entry.get(config["ha_sensors"]["illuminance"])
-    power1 = entry.get(config["ha_sensors"]["inverter_power_solax"]) or entry.get(config["ha_sensors"]["inverter_power_mini"])
-    power2 = entry.get(config["ha_sensors"]["inverter_power_hybrid"])
-    grid_power = entry.get(config["ha_sensors"]["grid_power"])
-    grid_export = entry.get(config["ha_sensors"]["grid_export"])
-    grid_fossil_share = entry.get(config["ha_sensors"]["grid_fossil_share"])
-    total_power = entry.get(config["ha_sensors"]["total_power"])
-    power_load = entry.get(config["ha_sensors"]["power_load"])
-    battery_load = entry.get(config["ha_sensors"]["battery_load"])
-    solar_energy1 = entry.get(config["ha_sensors"]["solar_energy1"])
-    solar_energy2 = entry.get(config["ha_sensors"]["solar_energy2"])
-
-    rows.append([
-        minute, lux, power1, power2,
-        args.modules1, args.azimuth1, args.tilt1,
-        args.modules2, args.azimuth2, args.tilt2,
-        args.batteries, args.battery_cap,
-        grid_power, grid_export, grid_fossil_share, total_power,
-        power_load, battery_load,
-        solar_energy1, solar_energy2
-    ])
+def backfill(from_day, to_day, config=None, insert_db=False, overwrite=False,
+             system=None, delta_hours=None, solar_offset=0, location=None,
+             connections=None, chunk_size=10000, source="states", verbose=False, stats=None,
+             expected=False, fill=False, site=DEFAULT_SITE):
+    """
+    Export every day from from_day to to_day (inclusive), reading the HA
+    states (or with source="statistics" the HA statistics) day by day in
+    chunks of at most chunk_size rows: one CSV per day and, with
+    insert_db, a single logbook transaction for the whole range. Stage
+    timings and counters are added to stats if given; expected and site
+    work as in export_day(). fill (implies insert_db) merges every
+    minute into the logbook like an incremental run, so holes inside a
+    day and sensor values missing from stored rows are filled.
+
+    Returns:
+        dict with days, rows (read from HA), inserted, updated and skipped
+    """
+    config = site_config(config or load_config(), site)
+    stats = stats or RunStats()
+    system, delta_hours, location = _defaults(config, system, delta_hours, location)
+    insert_db = insert_db or fill
+    mode = insert_mode(overwrite, fill)
+
+    first_day = datetime.strptime(from_day, "%Y-%m-%d").date()
+    last_day = datetime.strptime(to_day, "%Y-%m-%d").date()
+    if last_day < first_day:
+        raise ValueError("to_day must not be before from_day")
+
+    windows = []
+    day = first_day
+    while day <= last_day:
+        windows.append((day.isoformat(), *high_noon_window(day.isoformat(), location['time_zone'],
+                                                           delta_hours, solar_offset, location.get('longitude'))))
+        day += timedelta(days=1)
+
+    model = expected_model(config, location, system) if expected else None
+    ha_db_path = config["paths"]["ha_db_path"]
+    with connection(ha_db_path, connections, open_ha_source) as conn, contextlib.ExitStack() as stack:
+        reader, entity_map, read_window = open_window_reader(conn, source, config, chunk_size, stats)
+        new_watermarks = {}
+
+        log_cursor = None
+        if insert_db:
+            log_conn = stack.enter_context(
+                connection(config["paths"]["logbook_db_path"], connections, open_logbook))
+            log_cursor = log_conn.cursor()
+            sid = logbook_site_id(log_cursor, site)
+        totals = [0, 0, 0]
+        touched_months = set()
+
+        def flush_day(day, start_utc, end_utc, temp_data, resolutions):
+            with stats.stage("aggregate"):
+                rows = build_rows(temp_data, config["ha_sensors"], system, resolutions)
+            stats.count("minutes", len(rows))
+            csv_path = output_csv_path(config, day)
+            with stats.stage("csv"):
+                write_csv(csv_path, rows, model)
+            if log_cursor is None:
+                print(f"✅ {day}: {len(rows)} rows to {csv_path}")
+                return
+            with stats.stage("insert"):
+                last_timestamp = None
+                if not overwrite and not fill:
+                    last_timestamp = last_timestamp_in_window(log_cursor, start_utc, end_utc, sid)
+                counts = insert_rows(log_cursor, rows, mode, last_timestamp,
+                                     touched_months if sid == DEFAULT_SITE_ID else None, sid)
+            for i, n in enumerate(counts):
+                totals[i] += n
+            print(f"✅ {day}: {len(rows)} rows, {counts[0]} inserted, {counts[1]} updated, {counts[2]} skipped")
+
+        # Day by day in short chunked reads. A window that starts before the
+        # previous one ended (delta_hours > 12) continues after that end, so
+        # every state lands in one day only.
+        prev_end = None
+        for day, start_utc, end_utc in windows:
+            overlap = prev_end is not None and prev_end >= start_utc
+            day_states, temp_data, resolutions = read_window(prev_end if overlap else start_utc, end_utc,
+                                                             include_start=not overlap)
+            track_watermarks(new_watermarks, day_states)
+            flush_day(day, start_utc, end_utc, temp_data, resolutions)
+            prev_end = end_utc
+
+        if log_cursor:
+            with stats.stage("insert"):
+                store_watermarks(log_cursor, new_watermarks, entity_map, sid)
+            with stats.stage("commit"):
+                log_conn.commit()
+            invalidate_archive(config.get("paths", "archive_dir", fallback=None), touched_months)
+            print(f"✅ Data inserted into solar_log_v2: {totals[0]} new row(s), {totals[1]} updated, {totals[2]} skipped.")
+
+    count_read(stats, reader)
+    for name, n in zip(("inserted", "updated", "skipped"), totals):
+        stats.count(name, n)
+    if verbose:
+        print(reader.report())
+    print(f"✅ Backfill complete: {len(windows)} day(s), {reader.rows} {source} row(s) read")
+    return {"days": len(windows), "rows": reader.rows,
+            "inserted": totals[0], "updated": totals[1], "skipped": totals[2]}
 
 # ---------------------------------------------
-# Write CSV
+# Several sites: read-only readers in worker processes, one writer
 # ---------------------------------------------
-os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
-with open(OUTPUT_CSV, mode="w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow([
-        "timestamp", "lux", "power1", "power2",
-        "modules1", "azimuth1", "tilt1",
-        "modules2", "azimuth2", "tilt2",
-        "batteries", "battery_cap",
-        "grid_power", "grid_export", "grid_fossil_share", "total_power",
-        "power_load", "battery_load",
-        "solar_energy_string1", "solar_energy_string2"
-    ])
-    writer.writerows(rows)
+# Days a reader hands to the writer at once; the writer commits each batch
+SITE_BATCH_DAYS = 7
+
+def read_site_days(sections, site, days, delta_hours=None, solar_offset=None, chunk_size=10000,
+                   source="states", expected=False):
+    """
+    Reader of export_sites(), run in a worker process: the high noon
+    windows of days (consecutive ISO dates) read read-only from the
+    site's HA DB, aggregated and written to its day CSVs. sections is
+    the config as {section: {key: value}}; solar_offset the raw
+    --solar-offset value, resolved at the site's HA location.
+
+    Returns:
+        (site, [(day, start_utc, end_utc, rows)], watermarks, entity_map, stats)
+    """
+    config = ConfigParser()
+    config.read_dict(sections)
+    config = site_config(config, site)
+    stats = RunStats()
+    system, delta_hours, location = _defaults(config, None, delta_hours, None)
+    if not location:
+        raise ValueError(f"no HA location at {site_location_path(config)}")
+    solar_offset = resolve_solar_offset(solar_offset, location)
+    model = expected_model(config, location, system) if expected else None
+
+    # A window that starts before the previous day's ended (delta_hours > 12)
+    # continues after that end, as in backfill()
+    previous = (datetime.strptime(days[0], "%Y-%m-%d").date() - timedelta(days=1)).isoformat()
+    prev_end = high_noon_window(previous, location['time_zone'], delta_hours, solar_offset,
+                                location.get('longitude'))[1]
+    batch, new_watermarks = [], {}
+    with connection(config["paths"]["ha_db_path"], None, open_ha_source) as conn:
+        reader, entity_map, read_window = open_window_reader(conn, source, config, chunk_size, stats)
+        for day in days:
+            start_utc, end_utc = high_noon_window(day, location['time_zone'], delta_hours, solar_offset,
+                                                  location.get('longitude'))
+            overlap = prev_end >= start_utc
+            states, temp_data, resolutions = read_window(prev_end if overlap else start_utc, end_utc,
+                                                         include_start=not overlap)
+            track_watermarks(new_watermarks, states)
+            with stats.stage("aggregate"):
+                rows = build_rows(temp_data, config["ha_sensors"], system, resolutions)
+            stats.count("minutes", len(rows))
+            with stats.stage("csv"):
+                write_csv(output_csv_path(config, day), rows, model)
+            batch.append((day, start_utc, end_utc, rows))
+            prev_end = end_utc
+    count_read(stats, reader)
+    return site, batch, new_watermarks, entity_map, stats
+
+def export_sites(sites, from_day, to_day, config=None, insert_db=False, overwrite=False, fill=False,
+                 delta_hours=None, solar_offset=None, workers=None, connections=None, chunk_size=10000,
+                 source="states", stats=None, expected=False):
+    """
+    Export the days from_day..to_day of several sites concurrently:
+    worker processes (workers=None: one per core, 1: in this process)
+    read each site's HA DB read-only in batches of SITE_BATCH_DAYS days
+    and write its CSVs; with insert_db (implied by fill) this process
+    is the only logbook writer and commits every batch it receives.
+    overwrite and fill work as in backfill(); solar_offset is the raw
+    --solar-offset value, resolved per site. A site that fails is
+    reported and skipped.
+
+    Returns:
+        dict with sites, days, rows (read from HA), inserted, updated, skipped and failed (site names)
+    """
+    config = config or load_config()
+    stats = stats or RunStats()
+    insert_db = insert_db or fill
+    mode = insert_mode(overwrite, fill)
+    for site in sites:
+        site_config(config, site)  # unknown sites fail before any work starts
+
+    first_day = datetime.strptime(from_day, "%Y-%m-%d").date()
+    days = [(first_day + timedelta(days=i)).isoformat()
+            for i in range((datetime.strptime(to_day, "%Y-%m-%d").date() - first_day).days + 1)]
+    if not days:
+        raise ValueError("to_day must not be before from_day")
+    sections = {section: dict(config.items(section, raw=True)) for section in config.sections()}
+    tasks = [(site, days[i:i + SITE_BATCH_DAYS]) for site in sites for i in range(0, len(days), SITE_BATCH_DAYS)]
+    options = (delta_hours, solar_offset, chunk_size, source, expected)
+    workers = workers or os.cpu_count() or 1
+
+    totals = {"inserted": 0, "updated": 0, "skipped": 0, "rows": 0}
+    failed = set()
+    with contextlib.ExitStack() as stack:
+        # Readers start before the logbook is opened, so no worker inherits its connection
+        if workers == 1 or len(tasks) == 1:
+            results = (_run_reader(read_site_days, sections, site, batch, *options) for site, batch in tasks)
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=min(workers, len(tasks))))
+            futures = [pool.submit(_run_reader, read_site_days, sections, site, batch, *options)
+                       for site, batch in tasks]
+            results = (future.result() for future in as_completed(futures))
+
+        cursor = None
+        if insert_db:
+            log_conn = stack.enter_context(connection(config["paths"]["logbook_db_path"], connections, open_logbook))
+            cursor = log_conn.cursor()
+            ids = {site: logbook_site_id(cursor, site) for site in sites}
+            log_conn.commit()
+        touched_months = set()
+
+        for site, batch, new_watermarks, entity_map, site_stats in results:
+            if isinstance(batch, Exception):
+                if site not in failed:
+                    print(f"❌ {site}: {batch}")
+                failed.add(site)
+                continue
+            for name, seconds in site_stats.stages.items():
+                stats.add(name, seconds)
+            for name, n in site_stats.counters.items():
+                stats.count(name, n)
+            totals["rows"] += site_stats.counters.get("fetched", 0)
+            if cursor is None:
+                for day, _, _, rows in batch:
+                    print(f"✅ {site} {day}: {len(rows)} rows")
+                continue
+            # The single writer: one transaction per batch
+            with stats.stage("insert"):
+                for day, start_utc, end_utc, rows in batch:
+                    last_timestamp = None
+                    if not overwrite and not fill:
+                        last_timestamp = last_timestamp_in_window(cursor, start_utc, end_utc, ids[site])
+                    counts = insert_rows(cursor, rows, mode, last_timestamp,
+                                         touched_months if ids[site] == DEFAULT_SITE_ID else None, ids[site])
+                    for name, n in zip(("inserted", "updated", "skipped"), counts):
+                        totals[name] += n
+                    print(f"✅ {site} {day}: {len(rows)} rows, {counts[0]} inserted, {counts[1]} updated, {counts[2]} skipped")
+                store_watermarks(cursor, new_watermarks, entity_map, ids[site])
+            with stats.stage("commit"):
+                log_conn.commit()
+        if insert_db:
+            invalidate_archive(config.get("paths", "archive_dir", fallback=None), touched_months)
+
+    for name in ("inserted", "updated", "skipped"):
+        stats.count(name, totals[name])
+    stats.count("sites", len(sites) - len(failed))
+    if insert_db:
+        print(f"✅ Data inserted into solar_log_v2: {totals['inserted']} new row(s), "
+              f"{totals['updated']} updated, {totals['skipped']} skipped.")
+    print(f"✅ Export complete: {len(sites) - len(failed)} of {len(sites)} site(s), {len(days)} day(s), "
+          f"{totals['rows']} {source} row(s) read")
+    return dict(totals, sites=len(sites), days=len(days), failed=sorted(failed))
+
+def _run_reader(reader, sections, site, *args):
+    """reader(sections, site, *args), with a failure returned as (site, exception, ...) for the writer to report"""
+    try:
+        return reader(sections, site, *args)
+    except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+        return site, e, None, None, None
 
 # ---------------------------------------------
-# Optional insert into logbook DB
+# Argument parser
 # ---------------------------------------------
-if args.insert_db:
-    conn = sqlite3.connect(LOGBOOK_DB_PATH)
-    cursor = conn.cursor()
-    last_timestamp = None
-    if not args.overwrite:
-        try:
-            cursor.execute("SELECT MAX(timestamp) FROM solar_log_v2")
-            result = cursor.fetchone()
-            if result and result[0]:
-                last_timestamp = result[0]
-                print(f"ℹ️ Last DB timestamp: {last_timestamp}")
-        except sqlite3.Error as e:
-            print(f"❌ SQLite error while checking last timestamp: {e}")
+def build_parser(default_delta_hours):
+    parser = argparse.ArgumentParser(
+        description="Export solar data for a given day from Home Assistant DB into CSV and optionally into a local logbook DB."
+    )
+    parser.add_argument('--day', help="Target date in format YYYY-MM-DD. Default is today.", default=datetime.now().date().isoformat())
+    parser.add_argument('--insert-db', action='store_true', help="Insert result into local SQLite database 'solar_log_v2'.")
+    parser.add_argument('--overwrite', action='store_true', help="Overwrite existing rows with the same timestamp in the DB.")
+    parser.add_argument('--verbose', action='store_true', help="Enable verbose debug output.")
+    parser.add_argument('--test', action='store_true', help="Only show last timestamp in DB for the selected day.")
+    parser.add_argument('--incremental', action='store_true', help=(
+        "Only fetch states newer than the per-entity watermark stored in the logbook DB "
+        "and update just the minutes they touch (implies --insert-db)."
+    ))
+    parser.add_argument('--from-day', help="Backfill: first date (inclusive) in format YYYY-MM-DD. Requires --to-day.")
+    parser.add_argument('--to-day', help="Backfill: last date (inclusive) in format YYYY-MM-DD. Requires --from-day.")
+    parser.add_argument('--fill', action='store_true', help=(
+        "Backfill: merge every minute into the DB (implies --insert-db), filling missing minutes and "
+        "sensor values inside a day instead of only appending after its last row."
+    ))
+    parser.add_argument('--source', choices=SOURCES, default=None, help=(
+        "Read raw 'states' or HA's 5-minute/hourly 'statistics', which outlive the "
+        "recorder's purge_keep_days (default from conf [ha_db] source: states)."
+    ))
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per read of the HA DB; each read is one short read transaction (default: 10000).")
 
-    insert_count = 0
-    skip_count = 0
+    # System config overrides
+    parser.add_argument('--modules1', type=int, default=None, help="Wp of modules (string 1).")
+    parser.add_argument('--azimuth1', type=int, default=None, help="Azimuth angle (deg) of modules string 1.")
+    parser.add_argument('--tilt1', type=int, default=None, help="Tilt angle (deg) of modules string 1.")
+    parser.add_argument('--modules2', type=int, default=None, help="Wp of modules (string 2).")
+    parser.add_argument('--azimuth2', type=int, default=None, help="Azimuth angle (deg) of modules string 2.")
+    parser.add_argument('--tilt2', type=int, default=None, help="Tilt angle (deg) of modules string 2.")
+    parser.add_argument('--batteries', type=int, default=None, help="Number of batteries.")
+    parser.add_argument('--battery_cap', type=float, default=None, help="Total battery capacity in kWh.")
 
-    for row in rows:
-        timestamp = row[0]
-        if last_timestamp and timestamp <= last_timestamp:
-            skip_count += 1
-            continue
-        if args.overwrite:
-            cursor.execute("DELETE FROM solar_log_v2 WHERE timestamp = ?", (timestamp,))
-        cursor.execute(f"""
-        INSERT INTO solar_log_v2 (
-            timestamp, lux, power1, power2,
-            modules1, azimuth1, tilt1,
-            modules2, azimuth2, tilt2,
-            batteries, battery_cap,
-            grid_power, grid_export, grid_fossil_share, total_power,
-            power_load, battery_load,
-            solar_energy_string1, solar_energy_string2
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, row)
-        insert_count += 1
+    parser.add_argument(
+        '--delta-hours',
+        type=int,
+        default=None,
+        help=f"Half-width of window around high noon in hours (default from conf: {default_delta_hours})"
+    )
+    parser.add_argument('--solar-offset', nargs='?', const="", help=(
+        "Solar correction in hours. If omitted, offset = 0. "
+        "If passed without value, the window is centred on the true solar noon at the "
+        "Home Assistant location (longitude and equation of time). "
+        "If passed with value, that will be used."
+    ))
+    parser.add_argument('--expected', action='store_true', help=(
+        "Add clear-sky expected power of both strings and the performance ratio to the CSV "
+        "(needs the HA location)."
+    ))
+    parser.add_argument('--site', action='append', help=(
+        "Export this [site:NAME] section's HA DB, sensors and system values, repeatable "
+        f"(default: {DEFAULT_SITE}, the plain [paths]/[system] installation)."
+    ))
+    parser.add_argument('--all-sites', action='store_true', help="Export the default site and every [site:NAME] section.")
+    parser.add_argument('--workers', type=int, default=None, help=(
+        "Reader processes when exporting several sites (default: one per core, 1 = no pool)."
+    ))
+    return parser
 
-    conn.commit()
-    conn.close()
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None, connections=None):
+    """
+    Command line entry point. argv defaults to sys.argv[1:]; a long-running
+    caller may pass a connections dict to keep the DBs open between runs.
+    """
+    config = load_config()
+    default_delta_hours = config.getint("time", "delta_hours", fallback=7)
+    parser = build_parser(default_delta_hours)
+    args = parser.parse_args(argv)
+
+    if bool(args.from_day) != bool(args.to_day):
+        parser.error("--from-day and --to-day must be used together")
+    if args.from_day and args.incremental:
+        parser.error("--incremental cannot be combined with a --from-day/--to-day backfill")
+    if args.fill and not args.from_day:
+        parser.error("--fill needs a --from-day/--to-day backfill")
+    if args.from_day and args.to_day < args.from_day:
+        parser.error("--to-day must not be before --from-day")
+    source = args.source or config.get("ha_db", "source", fallback="states")
+    if source not in SOURCES:
+        parser.error(f"unknown source '{source}' in [ha_db]")
+    if args.incremental and source != "states":
+        parser.error("--incremental reads the raw states, not --source statistics")
+    sites = site_names(config) if args.all_sites else args.site or [DEFAULT_SITE]
+    unknown = [site for site in sites if site not in site_names(config)]
+    if unknown:
+        parser.error(f"no [site:{unknown[0]}] section in the config")
+    delta_hours = args.delta_hours if args.delta_hours is not None else default_delta_hours
+
+    if len(sites) > 1:
+        if args.incremental:
+            parser.error("--incremental exports one site at a time")
+        if any(getattr(args, key) is not None for key in SYSTEM_FIELDS):
+            parser.error("system overrides apply to one site at a time")
+        stats = RunStats("sites")
+        try:
+            export_sites(sites, args.from_day or args.day, args.to_day or args.day, config, insert_db=args.insert_db,
+                         overwrite=args.overwrite, fill=args.fill, delta_hours=delta_hours,
+                         solar_offset=args.solar_offset, workers=args.workers, connections=connections,
+                         chunk_size=args.chunk_size, source=source, stats=stats, expected=args.expected)
+        except sqlite3.DatabaseError as e:
+            print(f"❌ {e}")
+            exit(1)
+        emit_stats(stats, config)
+        return
 
-    print(f"✅ Data inserted into solar_log_v2: {insert_count} new row(s), {skip_count} skipped.")
+    site = sites[0]
+    site_cfg = site_config(config, site)
+    system = system_values(site_cfg, {key: getattr(args, key) for key in SYSTEM_FIELDS})
+    location = read_ha_location_from_storage(site_location_path(site_cfg))
+    if location:
+        print("🔎 Location info:")
+        print("  Timezone        :", location['time_zone'])
+        print("  Solar offset    :", location['offset_hours'], "hours")
+    solar_offset = resolve_solar_offset(args.solar_offset, location)
+    if solar_offset is None:
+        from solar_utils import solar_noon_utc
+
+        noon = solar_noon_utc(args.from_day or args.day, location['longitude'])
+        print("  Solar noon      :", datetime.fromtimestamp(noon, tz=timezone.utc).strftime("%H:%M:%S"), "UTC")
+
+    stats = RunStats("backfill" if args.from_day else "incremental" if args.incremental else "export")
+    options = dict(config=config, insert_db=args.insert_db, overwrite=args.overwrite, system=system,
+                   delta_hours=delta_hours, solar_offset=solar_offset, location=location,
+                   connections=connections, chunk_size=args.chunk_size, source=source,
+                   verbose=args.verbose, stats=stats, expected=args.expected, site=site)
+    try:
+        if args.from_day:
+            backfill(args.from_day, args.to_day, fill=args.fill, **options)
+        else:
+            export_day(args.day, incremental=args.incremental, **options)
+    except sqlite3.DatabaseError as e:
+        # A logbook that needs migrate or dedupe (open_logbook, logbook_site_id)
+        print(f"❌ {e}")
+        exit(1)
+    emit_stats(stats, config)
 
-print(f"✅ Export complete: {len(rows)} rows to {OUTPUT_CSV}")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# generate_synthetic_db.py
+# Version       : 1.0.1
+# Last updated  : 2026-10-18
+# Description   : Build a synthetic home-assistant_v2.db (states at
+#                 the real sensor cadences) and the matching
+#                 solar_logbook.db for benchmarks
+# ---------------------------------------------
+
+import argparse
+import math
+import os
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from config_utils import load_config
+from export_solar_logbook import (DB_COLUMNS, aggregate_by_minute, aggregation_settings, build_rows,
+                                  high_noon_window, insert_rows, open_logbook, system_values)
+from migrate_solar_logbook import migrate
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN
+
+# numpy is imported inside generate_ha_db(): importing this module for
+# create_logbook() stays cheap
+
+# Seconds between two states: power and load meters report every 15 s,
+# everything else (illuminance, grid mix, energy counters) every 60 s
+FAST_CADENCE = 15
+SLOW_CADENCE = 60
+
+# Share of states recorded as 'unavailable'
+UNAVAILABLE_SHARE = 0.002
+
+# Site the sun curve is computed for when HA has no location
+DEFAULT_SITE = {"latitude": 51.0, "longitude": 10.0, "time_zone": "Europe/Berlin"}
+
+HA_SCHEMA_SQL = """
+    CREATE TABLE states_meta (
+        metadata_id INTEGER PRIMARY KEY,
+        entity_id VARCHAR(255)
+    );
+    CREATE TABLE states (
+        state_id INTEGER PRIMARY KEY,
+        state VARCHAR(255),
+        last_updated_ts FLOAT,
+        metadata_id INTEGER
+    );
+    CREATE UNIQUE INDEX ix_states_meta_entity_id ON states_meta (entity_id);
+    CREATE INDEX ix_states_metadata_id_last_updated_ts ON states (metadata_id, last_updated_ts);
+    CREATE INDEX ix_states_last_updated_ts ON states (last_updated_ts);
+"""
+
+
+def cadence(key):
+    """Seconds between states of the [ha_sensors] key"""
+    return FAST_CADENCE if "power" in key or "load" in key else SLOW_CADENCE
+
+
+# ---------------------------------------------
+# Signal model
+# ---------------------------------------------
+def clear_sky(t, day_of_year, latitude, longitude):
+    """Clear-sky irradiance (W/m²) at epoch seconds t, simple declination model"""
+    import numpy as np
+
+    decl = math.radians(23.44) * math.sin(2 * math.pi * (284 + day_of_year) / 365)
+    solar_hours = (t % 86400) / 3600 + longitude / 15
+    hour_angle = np.radians(15 * (solar_hours - 12))
+    lat = math.radians(latitude)
+    sin_elev = math.sin(lat) * math.sin(decl) + math.cos(lat) * math.cos(decl) * np.cos(hour_angle)
+    return 1000 * np.clip(sin_elev, 0, None) ** 1.15
+
+
+def day_signals(rng, day, day_start, site, system):
+    """
+    Signal model of one day: [ha_sensors] key -> function returning the
+    sensor value at an array of epoch seconds
+    """
+    import numpy as np
+
+    # Clouds: one random walk per 10 minutes around a daily clearness
+    clearness = rng.uniform(0.3, 1.0)
+    knots = day_start + np.arange(0, 86400 + 600, 600)
+    clouds = np.clip(clearness + np.cumsum(rng.normal(0, 0.08, len(knots))), 0.1, 1.0)
+    load_knots = 250 + rng.gamma(1.5, 150, len(knots))
+    fossil_knots = np.clip(45 + np.cumsum(rng.normal(0, 1.5, len(knots))), 10, 90)
+    modules1 = system.get("modules1") or 0
+    modules2 = system.get("modules2") or 0
+
+    day_of_year = day.timetuple().tm_yday
+
+    def irradiance(t):
+        return clear_sky(t, day_of_year, site["latitude"], site["longitude"]) * np.interp(t, knots, clouds)
+
+    def pv1(t):
+        return np.minimum(modules1 * irradiance(t) / 1000 * 0.85, modules1)
+
+    def pv2(t):
+        return np.minimum(modules2 * irradiance(t) / 1000 * 0.85, modules2)
+
+    def load(t):
+        return np.interp(t, knots, load_knots)
+
+    return {
+        "illuminance": lambda t: irradiance(t) * 120,
+        "inverter_power_solax": pv1,
+        "inverter_power_mini": lambda t: np.minimum(pv1(t), 600),
+        "inverter_power_hybrid": pv2,
+        "power_load": load,
+        "battery_load": lambda t: np.zeros(len(t)),
+        "grid_power": lambda t: load(t) - pv1(t) - pv2(t),
+        "grid_export": lambda t: np.maximum(pv1(t) + pv2(t) - load(t), 0),
+        "total_power": load,
+        "grid_fossil_share": lambda t: np.interp(t, knots, fossil_knots),
+        # energy counters: kWh per state step, summed up by generate_ha_db()
+        "solar_energy1": lambda t: pv1(t) * 0.6 * SLOW_CADENCE / 3.6e6,
+        "solar_energy2": lambda t: pv1(t) * 0.4 * SLOW_CADENCE / 3.6e6,
+    }
+
+
+# ---------------------------------------------
+# Databases
+# ---------------------------------------------
+def create_logbook(path, config=None):
+    """
+    Fresh solar_logbook.db with the exporter's columns, migrated like a
+    live logbook (sensor columns from [ha_sensors], time keys, rollups)
+    """
+    config = config or load_config()
+    if os.path.exists(path):
+        os.remove(path)
+    con = sqlite3.connect(path)
+    con.execute(f"""
+        CREATE TABLE solar_log_v2 (
+            {SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID},
+            timestamp TEXT,
+            {', '.join(f'{col} REAL' for col in DB_COLUMNS[1:])}
+        )
+    """)
+    migrate(con, config["ha_sensors"].keys())
+    con.close()
+
+
+def generate_ha_db(ha_db_path, logbook_path=None, start_day=None, days=365, extra_entities=0,
+                   config=None, site=None, delta_hours=None, seed=42):
+    """
+    Write days of states for the [ha_sensors] entities (plus
+    extra_entities unrelated ones the exporter has to skip) into a new
+    HA DB at ha_db_path. With logbook_path, the matching logbook is built
+    from the same states with the exporter's own aggregation.
+
+    Returns:
+        dict with days, entities, states and logbook_rows
+    """
+    import numpy as np
+
+    config = config or load_config()
+    site = site or DEFAULT_SITE
+    if delta_hours is None:
+        delta_hours = config.getint("time", "delta_hours", fallback=7)
+    first_day = date.fromisoformat(start_day) if start_day else date.today() - timedelta(days=days)
+    rng = np.random.default_rng(seed)
+
+    sensors = dict(config["ha_sensors"])
+    extra = {f"synthetic_{i}": f"sensor.synthetic_{i}" for i in range(1, extra_entities + 1)}
+    entities = {key: (meta_id, eid) for meta_id, (key, eid) in enumerate({**sensors, **extra}.items(), 1)}
+    entity_map = {meta_id: eid for key, (meta_id, eid) in entities.items() if key in sensors}
+    system = system_values(config)
+    default_agg, agg_by_entity = aggregation_settings(config)
+
+    if os.path.exists(ha_db_path):
+        os.remove(ha_db_path)
+    ha = sqlite3.connect(ha_db_path)
+    ha.execute("PRAGMA synchronous = OFF")
+    ha.executescript(HA_SCHEMA_SQL)
+    ha.executemany("INSERT INTO states_meta (metadata_id, entity_id) VALUES (?, ?)", entities.values())
+
+    log_conn = None
+    if logbook_path:
+        create_logbook(logbook_path, config)
+        log_conn = open_logbook(logbook_path)
+
+    energy = {}
+    total_states = logbook_rows = 0
+    for n in range(days):
+        day = first_day + timedelta(days=n)
+        day_start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+        signals = day_signals(rng, day, day_start, site, system)
+
+        stamps, meta_ids, states = [], [], []
+        for key, (meta_id, eid) in entities.items():
+            step = cadence(key)
+            t = day_start + np.arange(0, 86400, step) + rng.uniform(0, 1, 86400 // step)
+            if key in signals:
+                values = signals[key](t)
+            else:
+                values = 100 + rng.normal(0, 5, len(t))
+            if key.startswith("solar_energy"):
+                values = energy.get(key, 0.0) + np.cumsum(values)
+                energy[key] = float(values[-1])
+                text = [f"{v:.3f}" for v in values.tolist()]
+            else:
+                text = [f"{v:.2f}" for v in values.tolist()]
+            for i in np.flatnonzero(rng.random(len(t)) < UNAVAILABLE_SHARE).tolist():
+                text[i] = "unavailable"
+            stamps.append(t)
+            meta_ids.extend([meta_id] * len(t))
+            states.extend(text)
+
+        # Recorder order: state ids grow with time across entities
+        stamps = np.concatenate(stamps)
+        order = np.argsort(stamps, kind="stable").tolist()
+        stamps = stamps.tolist()
+        day_rows = [(states[i], stamps[i], meta_ids[i]) for i in order]
+        ha.executemany("INSERT INTO states (state, last_updated_ts, metadata_id) VALUES (?, ?, ?)", day_rows)
+        total_states += len(day_rows)
+
+        if log_conn:
+            start_utc, end_utc = high_noon_window(day.isoformat(), site["time_zone"], delta_hours)
+            window = [(meta_id, state, ts) for state, ts, meta_id in day_rows
+                      if meta_id in entity_map and start_utc <= ts <= end_utc]
+            temp_data = aggregate_by_minute(window, entity_map, default_agg, agg_by_entity)
+            rows = build_rows(temp_data, sensors, system)
+            logbook_rows += insert_rows(log_conn.cursor(), rows)[0]
+
+        if day.day == 1 or n == days - 1:
+            ha.commit()
+            if log_conn:
+                log_conn.commit()
+            print(f"ℹ️ {day}: {total_states} states, {logbook_rows} logbook rows")
+
+    ha.execute("PRAGMA journal_mode = WAL")
+    ha.close()
+    if log_conn:
+        log_conn.close()
+    return {"days": days, "entities": len(entities), "states": total_states, "logbook_rows": logbook_rows}
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic Home Assistant DB and matching solar logbook for benchmarks."
+    )
+    parser.add_argument('--ha-db', required=True, help='HA DB to create (replaced if it exists)')
+    parser.add_argument('--logbook-db', help='Matching logbook DB to create (replaced if it exists)')
+    parser.add_argument('--start-day', help='First day (YYYY-MM-DD). Default: the given span ending yesterday')
+    parser.add_argument('--years', type=float, default=1, help='Span in years (default: 1)')
+    parser.add_argument('--days', type=int, help='Span in days, overrides --years')
+    parser.add_argument('--extra-entities', type=int, default=0,
+                        help='Unrelated entities added to the HA DB (default: 0)')
+    parser.add_argument('--time-zone', default=DEFAULT_SITE["time_zone"],
+                        help=f"Time zone of the high noon window (default: {DEFAULT_SITE['time_zone']})")
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    days = args.days if args.days else max(1, round(args.years * 365))
+    site = dict(DEFAULT_SITE, time_zone=args.time_zone)
+
+    summary = generate_ha_db(args.ha_db, args.logbook_db, args.start_day, days, args.extra_entities,
+                             site=site, seed=args.seed)
+    print(f"✅ {args.ha_db}: {summary['states']} states of {summary['entities']} entities over {days} day(s)")
+    if args.logbook_db:
+        print(f"✅ {args.logbook_db}: {summary['logbook_rows']} rows")
+
+
+if __name__ == "__main__":
+    main()
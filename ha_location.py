@@ -2,16 +2,26 @@
 # Function to read Home Assistant location info from .storage/core.config
 
 import json
+import os
+
+# path -> (mtime, location); lets a long-running process skip re-parsing
+_location_cache = {}
 
 def read_ha_location_from_storage(path="/config/.storage/core.config"):
     """
     Load HA location from /config/.storage/core.config
 
+    The result is cached per process until the file changes.
+
     Returns:
         dict with latitude, longitude, elevation, time_zone, correction_minutes, offset_hours
         or None on failure
     """
     try:
+        mtime = os.path.getmtime(path)
+        cached = _location_cache.get(path)
+        if cached and cached[0] == mtime:
+            return dict(cached[1])
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
             if not isinstance(data, dict) or "data" not in data:
@@ -29,7 +39,7 @@ def read_ha_location_from_storage(path="/config/.storage/core.config"):
             correction_minutes = (lon - 15) * 4
             offset_hours = correction_minutes / 60
 
-            return {
+            result = {
                 "latitude": lat,
                 "longitude": lon,
                 "elevation": elev,
@@ -37,6 +47,8 @@ def read_ha_location_from_storage(path="/config/.storage/core.config"):
                 "correction_minutes": correction_minutes,
                 "offset_hours": offset_hours
             }
+            _location_cache[path] = (mtime, result)
+            return dict(result)
 
     except Exception as e:
         print(f"Error reading location: {e}")
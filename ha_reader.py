@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# ha_reader.py
+# Version      : 1.2.0
+# Last updated : 2026-10-18
+# Description  : Read-only access to the Home Assistant recorder DB
+#                (states and statistics) in short, index-ordered
+#                read transactions
+# ---------------------------------------------
+
+import time
+from db_utils import open_readonly, DEFAULT_BUSY_TIMEOUT_MS
+DEFAULT_CHUNK_ROWS = 10000
+
+# Keyset start position that includes states at exactly the start time
+# (state ids are positive)
+_BEFORE_ANY_STATE = 0
+# ... and one that skips them (larger than any SQLite rowid)
+_AFTER_ALL_STATES = 2 ** 63 - 1
+
+
+def open_ha_db(path, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, **kwargs):
+    """
+    Open the recorder DB read-only (see db_utils.open_readonly): the
+    exporter can never take a write lock on it, and waits while the
+    recorder checkpoints instead of failing with "database is locked"
+    """
+    return open_readonly(path, busy_timeout_ms, **kwargs)
+
+
+# (ha_db_path, table, entity ids) -> {metadata_id: entity_id}, only complete
+# maps: HA never renumbers an entity, a missing one may still show up later
+_entity_map_cache = {}
+
+
+def _resolve(cursor, table, key_column, id_column, entity_ids, cache_key, missing):
+    key = (cache_key, table, tuple(entity_ids))
+    if cache_key is not None and key in _entity_map_cache:
+        return dict(_entity_map_cache[key])
+
+    cursor.execute(f"""
+        SELECT {key_column}, {id_column}
+        FROM {table}
+        WHERE {id_column} IN ({','.join(['?'] * len(entity_ids))})
+    """, list(entity_ids))
+    found = {eid: meta_id for meta_id, eid in cursor.fetchall()}
+
+    entity_map = {}
+    for eid in entity_ids:
+        if eid in found:
+            entity_map[found[eid]] = eid
+        else:
+            print(f"⚠️ {missing}: {eid}")
+
+    if cache_key is not None and len(entity_map) == len(entity_ids):
+        _entity_map_cache[key] = dict(entity_map)
+    return entity_map
+
+
+def resolve_entities(cursor, entity_ids, cache_key=None):
+    """
+    {metadata_id: entity_id} for the entities present in states_meta,
+    looked up in one query; missing entities are reported
+    """
+    return _resolve(cursor, "states_meta", "metadata_id", "entity_id", entity_ids, cache_key,
+                    "Entity not found in states_meta")
+
+
+def resolve_statistics(cursor, entity_ids, cache_key=None):
+    """
+    {statistics_meta id: entity_id} for the entities HA keeps long-term
+    statistics for (sensors with a state_class), in one query
+    """
+    return _resolve(cursor, "statistics_meta", "id", "statistic_id", entity_ids, cache_key,
+                    "No statistics in statistics_meta for entity")
+
+
+class _ChunkedReader:
+    """
+    Base for the readers below: every chunk is a single statement in
+    autocommit mode, so a read snapshot is only held while one chunk of
+    at most chunk_rows rows is fetched. Keeps totals for report().
+    """
+
+    def __init__(self, conn, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.conn = conn
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.chunks = 0
+        self.snapshot_seconds = 0.0
+        self.longest_snapshot = 0.0
+
+    def _fetch(self, sql, params, count=True):
+        started = time.perf_counter()
+        rows = self.conn.execute(sql, params).fetchall()
+        held = time.perf_counter() - started
+        self.snapshot_seconds += held
+        self.longest_snapshot = max(self.longest_snapshot, held)
+        self.chunks += 1
+        if count:
+            self.rows += len(rows)
+        return rows
+
+    def report(self):
+        return (f"🔎 HA DB read: {self.rows} row(s) in {self.chunks} chunk(s), "
+                f"read snapshots held {self.snapshot_seconds * 1000:.1f} ms in total, "
+                f"longest {self.longest_snapshot * 1000:.1f} ms")
+
+
+class StatesReader(_ChunkedReader):
+    """
+    Reads (metadata_id, state, last_updated_ts) rows per entity along the
+    (metadata_id, last_updated_ts) index; the next chunk continues after
+    the last (last_updated_ts, state_id) seen
+    """
+
+    def iter_chunks(self, meta_id, start_ts, end_ts, include_start=True):
+        """
+        Yield the states of one entity with start_ts <= last_updated_ts
+        <= end_ts (start_ts itself excluded unless include_start) in time
+        order, as lists of at most chunk_rows tuples
+        """
+        last_ts = start_ts
+        last_id = _BEFORE_ANY_STATE if include_start else _AFTER_ALL_STATES
+        while True:
+            rows = self._fetch("""
+                SELECT state_id, metadata_id, state, last_updated_ts
+                FROM states
+                WHERE metadata_id = ?
+                  AND last_updated_ts >= ? AND last_updated_ts <= ?
+                  AND (last_updated_ts > ? OR state_id > ?)
+                ORDER BY last_updated_ts, state_id
+                LIMIT ?
+            """, (meta_id, last_ts, end_ts, last_ts, last_id, self.chunk_rows))
+            if not rows:
+                return
+            last_id, _, _, last_ts = rows[-1]
+            yield [row[1:] for row in rows]
+            if len(rows) < self.chunk_rows:
+                return
+
+    def read(self, meta_ids, start_ts, end_ts, since=None, include_start=True):
+        """
+        All states of the given entities in [start_ts, end_ts]; since
+        optionally maps metadata_id to a later start for that entity
+        """
+        states = []
+        for meta_id in meta_ids:
+            begin = start_ts
+            if since and meta_id in since:
+                begin = max(since[meta_id], start_ts)
+            for chunk in self.iter_chunks(meta_id, begin, end_ts, include_start):
+                states.extend(chunk)
+        return states
+
+
+class StatisticsReader(_ChunkedReader):
+    """
+    Reads (metadata_id, start_ts, mean, min, max, state) rows of HA's
+    statistics_short_term (5-minute) or statistics (hourly) table per
+    entity along their unique (metadata_id, start_ts) index
+    """
+
+    # Table -> minutes per row
+    TABLES = {"statistics_short_term": 5, "statistics": 60}
+
+    def first_start(self, table):
+        """Oldest period still kept in table (epoch seconds) or None"""
+        return self._fetch(f"SELECT MIN(start_ts) FROM {table}", (), count=False)[0][0]
+
+    def read(self, table, meta_ids, start_ts, end_ts, include_start=True):
+        """Rows of the given entities with periods starting in [start_ts, end_ts]"""
+        rows = []
+        for meta_id in meta_ids:
+            last_ts = start_ts
+            op = ">=" if include_start else ">"
+            while True:
+                chunk = self._fetch(f"""
+                    SELECT metadata_id, start_ts, mean, min, max, state
+                    FROM {table}
+                    WHERE metadata_id = ? AND start_ts {op} ? AND start_ts <= ?
+                    ORDER BY start_ts
+                    LIMIT ?
+                """, (meta_id, last_ts, end_ts, self.chunk_rows))
+                rows.extend(chunk)
+                if len(chunk) < self.chunk_rows:
+                    break
+                last_ts, op = chunk[-1][1], ">"
+        return rows
@@ -1,42 +1,41 @@
 #!/usr/bin/env python3
 # ---------------------------------------------
 # interpolation_utils.py
-# Version      : 1.2.0
-# Last updated : 2025-08-02
-# Description  : Interpolate selected numeric fields in solar log data
+# Version      : 2.0.1
+# Last updated : 2026-10-18
+# Description  : Time-aware, gap-limited interpolation of solar log data
 # ---------------------------------------------
 
 import numpy as np
-from copy import deepcopy
 
-def interpolate_timeseries(rows):
+# Rows GapInterpolator keeps back at most for one open gap (a week of minutes)
+MAX_PENDING_ROWS = 7 * 1440
+
+def interpolate_timeseries(rows, fields=None, max_gap=None):
     """
-    Interpolates numeric values (lux, power1, power2) in a list of dicts
-    Assumes each dict contains a timestamp and possibly missing numeric values
+    Interpolates missing numeric values in a list of dicts on the time axis
+    Each dict needs a 'timestamp' (datetime); fields defaults to every other key.
+    Gaps longer than max_gap minutes are left empty.
     """
     if not rows:
         return []
 
-    interpolated_rows = deepcopy(rows)
-    numeric_fields = ["lux", "power1", "power2"]
-
-    for field in numeric_fields:
-        values = [row.get(field) for row in interpolated_rows]
-        numeric = np.array([float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values])
+    interpolated_rows = [dict(row) for row in rows]
+    if fields is None:
+        fields = [k for k in rows[0] if k != "timestamp"]
 
-        if np.all(np.isnan(numeric)):
-            continue  # skip interpolation if all values are missing
+    def numeric(v):
+        return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
 
-        # Perform linear interpolation over index positions
-        interpolated = np.interp(
-            x=np.arange(len(numeric)),
-            xp=np.flatnonzero(~np.isnan(numeric)),
-            fp=numeric[~np.isnan(numeric)]
-        )
+    t = np.array([row["timestamp"].timestamp() / 60 for row in rows])
+    data = np.array([[numeric(row.get(field)) for field in fields] for row in rows], dtype=np.float64)
+    filled, _ = _fill_gaps(t, data.reshape(len(rows), len(fields)), max_gap)
 
-        # Assign interpolated values back
-        for i, val in enumerate(interpolated):
-            interpolated_rows[i][field] = round(val, 2)
+    # Assign interpolated values back
+    for i, row in enumerate(interpolated_rows):
+        for j, field in enumerate(fields):
+            if np.isnan(data[i, j]) and not np.isnan(filled[i, j]):
+                row[field] = float(filled[i, j])
 
     return interpolated_rows
 
@@ -57,3 +56,173 @@ def add_watt_per_klux(rows):
 
     return rows
 
+
+# ---------------------------------------------
+# Column-array variants (see columnar_utils.py)
+# ---------------------------------------------
+def _fill_gaps(t, data, max_gap=None, anchor_t=None, anchor_v=None):
+    """
+    Linear interpolation on the time axis for every column of a 2-D array
+
+    Args:
+        t: float64 (n,) timestamps in minutes, ascending
+        data: float64 (n, k), NaN marks missing values
+        max_gap: only fill gaps whose valid neighbours are at most this
+            many minutes apart (None = no limit)
+        anchor_t, anchor_v: (k,) last valid time/value per column before
+            the first row (NaN if unknown), used when streaming
+
+    Leading and trailing gaps are not extrapolated.
+
+    Returns:
+        (filled (n, k) array, bool (n,) rows with a gap that a later
+        value could still fill)
+    """
+    n, k = data.shape
+    if anchor_t is None:
+        anchor_t = np.full(k, np.nan)
+        anchor_v = np.full(k, np.nan)
+
+    valid = ~np.isnan(data)
+    idx = np.broadcast_to(np.arange(n)[:, None], (n, k))
+
+    prev = np.maximum.accumulate(np.where(valid, idx, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(valid, idx, n)[::-1], axis=0)[::-1]
+    has_prev = prev >= 0
+    has_next = nxt < n
+    prev_c = np.clip(prev, 0, n - 1)
+    next_c = np.clip(nxt, 0, n - 1)
+
+    t_prev = np.where(has_prev, t[prev_c], anchor_t)
+    v_prev = np.where(has_prev, np.take_along_axis(data, prev_c, axis=0), anchor_v)
+    t_next = t[next_c]
+    v_next = np.take_along_axis(data, next_c, axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        span = t_next - t_prev
+        fill = ~valid & has_next & ~np.isnan(t_prev)
+        if max_gap is not None:
+            fill &= span <= max_gap
+        frac = (t[:, None] - t_prev) / span
+        filled = np.where(fill, np.round(v_prev + frac * (v_next - v_prev), 2), data)
+
+        pending = ~valid & ~has_next & ~np.isnan(t_prev)
+        if max_gap is not None and n:
+            pending &= (t[-1] - t_prev) < max_gap
+
+    return filled, pending.any(axis=1)
+
+
+def interpolate_columns(columns, fields=None, max_gap=None):
+    """
+    Time-aware interpolation of NaN gaps in a column dict.
+
+    Args:
+        fields: float64 columns to fill (default: every column except
+            'timestamp')
+        max_gap: longest gap in minutes that is filled (None = no limit)
+
+    Returns a new dict; untouched columns are shared, not copied.
+    """
+    if fields is None:
+        fields = [f for f in columns if f != "timestamp"]
+    fields = [f for f in fields if f in columns]
+    result = dict(columns)
+    if not fields or not len(columns["timestamp"]):
+        return result
+
+    t = columns["timestamp"].astype(np.float64)
+    filled, _ = _fill_gaps(t, np.column_stack([columns[f] for f in fields]), max_gap)
+    for i, field in enumerate(fields):
+        result[field] = filled[:, i]
+    return result
+
+
+class GapInterpolator:
+    """
+    Chunk-by-chunk variant of interpolate_columns for streamed results.
+
+    feed() returns the rows whose gaps are settled and keeps back rows that
+    a value in a later chunk may still fill; the last valid value of every
+    column is carried across chunks. flush() returns the rest.
+
+    With max_gap=None any gap may still close, so rows are kept back until
+    it does - at most max_pending rows: the gaps still open then are given
+    up and stay empty, and the rows are released.
+    """
+
+    def __init__(self, fields, max_gap=None, max_pending=MAX_PENDING_ROWS):
+        self.fields = list(fields)
+        self.max_gap = max_gap
+        self.max_pending = max_pending
+        self.anchor_t = np.full(len(self.fields), np.nan)
+        self.anchor_v = np.full(len(self.fields), np.nan)
+        self.pending = None
+
+    def _join(self, columns):
+        if self.pending is None:
+            return columns
+        return {name: np.concatenate([self.pending[name], col]) for name, col in columns.items()}
+
+    def _split(self, columns, cut):
+        head = {name: col[:cut] for name, col in columns.items()}
+        tail = {name: col[cut:] for name, col in columns.items()}
+        return head, tail
+
+    def feed(self, columns):
+        columns = self._join(columns)
+        if not len(columns["timestamp"]):
+            self.pending = None
+            return columns
+
+        t = columns["timestamp"].astype(np.float64)
+        raw = np.column_stack([columns[f] for f in self.fields])
+        filled, waiting = _fill_gaps(t, raw, self.max_gap, self.anchor_t, self.anchor_v)
+        cut = int(np.argmax(waiting)) if waiting.any() else len(t)
+        give_up = len(t) - cut > self.max_pending
+        if give_up:
+            cut = len(t)
+
+        ready = dict(columns)
+        for i, field in enumerate(self.fields):
+            ready[field] = filled[:, i]
+        ready, _ = self._split(ready, cut)
+        _, self.pending = self._split(columns, cut)
+
+        # Carry the last original value of every column into the next chunk
+        valid = ~np.isnan(raw[:cut])
+        for i in np.flatnonzero(valid.any(axis=0)):
+            last = np.flatnonzero(valid[:, i])[-1]
+            self.anchor_t[i] = t[last]
+            self.anchor_v[i] = raw[last, i]
+        if give_up:
+            # No anchor: the rest of the open gaps is not filled either
+            open_gap = np.isnan(raw[-1])
+            self.anchor_t[open_gap] = np.nan
+            self.anchor_v[open_gap] = np.nan
+        return ready
+
+    def flush(self):
+        if self.pending is None:
+            return None
+        columns = self.pending
+        self.pending = None
+        t = columns["timestamp"].astype(np.float64)
+        raw = np.column_stack([columns[f] for f in self.fields])
+        filled, _ = _fill_gaps(t, raw, self.max_gap, self.anchor_t, self.anchor_v)
+        result = dict(columns)
+        for i, field in enumerate(self.fields):
+            result[field] = filled[:, i]
+        return result
+
+def watt_per_klux_column(columns):
+    """
+    Return 'watt_per_klux' as float64 array: (power1 / lux) * 1000,
+    NaN where lux <= 0 or a value is missing
+    """
+    lux = columns["lux"]
+    power = columns["power1"]
+    out = np.full(len(lux), np.nan)
+    valid = (lux > 0) & ~np.isnan(power)
+    out[valid] = np.round(power[valid] / lux[valid] * 1000, 1)
+    return out
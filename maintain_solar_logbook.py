@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# maintain_solar_logbook.py
+# Version       : 1.0.2
+# Last updated  : 2026-10-18
+# Description   : Logbook maintenance: remove duplicate timestamps,
+#                 enforce the unique timestamp key, ANALYZE and
+#                 incremental VACUUM, with a space report
+# ---------------------------------------------
+
+import sqlite3
+import os
+import argparse
+from config_utils import load_config
+from db_utils import connection
+from maintenance_utils import (DEDUPE_BATCH_DAYS, UNIQUE_INDEX, analyze, deduplicate,
+                               ensure_unique_key, reclaim_space, space_usage)
+from stats_utils import RunStats, emit_stats
+
+
+def megabytes(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser(config):
+    parser = argparse.ArgumentParser(description="Clean up and compact the solar logbook database.")
+    parser.add_argument(
+        '--db-path',
+        default=config.get("paths", "logbook_db_path", fallback="/config/solar_logbook.db"),
+        help='Path to the SQLite database'
+    )
+    parser.add_argument('--batch-days', type=int, default=DEDUPE_BATCH_DAYS,
+                        help=f'Days with duplicates cleaned per transaction (default: {DEDUPE_BATCH_DAYS})')
+    parser.add_argument('--vacuum-pages', type=int,
+                        help='Free pages released per run by the incremental vacuum (default: all)')
+    parser.add_argument('--no-dedupe', action='store_true', help='Skip duplicate removal and the unique key')
+    parser.add_argument('--no-analyze', action='store_true', help='Skip ANALYZE')
+    parser.add_argument('--no-vacuum', action='store_true', help='Skip the (incremental) vacuum')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None, connections=None):
+    config = load_config()
+    args = build_parser(config).parse_args(argv)
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ Database not found at {args.db_path}")
+        exit(1)
+
+    stats = RunStats("maintain")
+    with connection(args.db_path, connections) as conn:
+        cursor = conn.cursor()
+        size_before, page_size, pages, free = space_usage(conn)
+        print(f"ℹ️ {megabytes(size_before)}, {pages} pages of {page_size} bytes, {free} free")
+
+        if not args.no_dedupe:
+            with stats.stage("dedupe"):
+                touched_months = set()
+                removed, days = deduplicate(conn, max(args.batch_days, 1), touched_months)
+            stats.count("duplicates", removed)
+            if removed:
+                print(f"✅ Removed {removed} duplicate row(s) on {days} day(s)")
+                # Archived copies of the cleaned months still hold the duplicates
+                from export_solar_logbook import invalidate_archive
+
+                invalidate_archive(config.get("paths", "archive_dir", fallback="/config/solar_archive"), touched_months)
+            else:
+                print("ℹ️ No duplicate timestamps")
+
+            with stats.stage("unique_key"):
+                try:
+                    created = ensure_unique_key(cursor)
+                    conn.commit()
+                except sqlite3.IntegrityError:
+                    # Rows written between the dedupe batches and now
+                    print("❌ New duplicates appeared, unique key not created. Run again.")
+                    exit(1)
+            if created:
+                print(f"✅ Unique key {UNIQUE_INDEX} created")
+
+        # The dedupe lookup index and the unique key take pages of their own
+        size_indexed = space_usage(conn)[0]
+
+        if not args.no_analyze:
+            with stats.stage("analyze"):
+                analyze(conn)
+            print("✅ Planner statistics updated (ANALYZE)")
+
+        if not args.no_vacuum:
+            with stats.stage("vacuum"):
+                mode, released = reclaim_space(conn, args.vacuum_pages)
+            stats.count("pages_released", released)
+            if mode != "INCREMENTAL":
+                print(f"✅ auto_vacuum {mode} -> INCREMENTAL (one-time full VACUUM), {released} free page(s) released")
+            else:
+                print(f"✅ Incremental vacuum released {released} free page(s)")
+
+        size_after, _, pages, free = space_usage(conn)
+    grown = max(size_indexed - size_before, 0)
+    reclaimed = max(size_indexed - size_after, 0)
+    stats.count("bytes_indexes", grown)
+    stats.count("bytes_reclaimed", reclaimed)
+
+    record = stats.record()
+    steps = ", ".join(f"{name} {ms / 1000:.1f} s" for name, ms in record["stages_ms"].items())
+    indexes = f"{megabytes(grown)} new indexes, " if grown else ""
+    print(f"✅ Maintenance complete: {megabytes(size_before)} -> {megabytes(size_after)} "
+          f"({indexes}{megabytes(reclaimed)} reclaimed, {free} free pages left)"
+          + (f"; {steps}" if steps else ""))
+    emit_stats(stats, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# maintenance_utils.py
+# Version      : 1.3.1
+# Last updated : 2026-10-18
+# Description  : Logbook upkeep: duplicate timestamps removed in short
+#                per-day transactions, unique (site, timestamp) key,
+#                planner statistics and incremental reclaiming of free
+#                pages
+# ---------------------------------------------
+
+import os
+from correlation_utils import CORRELATION_TABLE, rebuild_correlation
+from coverage_utils import COVERAGE_TABLE, refresh_coverage
+from efactor_utils import EFACTOR_COLUMN, refresh_efactor
+from query_cache_utils import bump_generation
+from rollup_utils import RESOLUTIONS, refresh_rollups
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, SITE_COLUMN_SQL, SITE_INDEX, SITE_INDEX_SQL, ensure_site_time_index, has_site_column
+
+UNIQUE_INDEX = SITE_INDEX
+UNIQUE_INDEX_SQL = SITE_INDEX_SQL
+
+# Plain (site_id, timestamp) index that makes the per-day cleanup a range
+# lookup; replaced by the unique one
+LOOKUP_INDEX = "ix_solar_log_v2_timestamp_lookup"
+
+# Column lists of the indexes that key a row by its minute
+KEY_COLUMNS = (["timestamp"], [SITE_COLUMN, "timestamp"])
+
+# Days with duplicates cleaned per transaction; readers and the exporter
+# only wait for one batch
+DEDUPE_BATCH_DAYS = 7
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def _key_indexes(cursor):
+    """{index name: unique} of the indexes on solar_log_v2 (timestamp) or (site_id, timestamp)"""
+    cursor.execute("PRAGMA index_list(solar_log_v2)")
+    indexes = {}
+    for _, name, unique, *_ in cursor.fetchall():
+        cursor.execute(f"PRAGMA index_info({name})")
+        if [row[2] for row in cursor.fetchall()] in KEY_COLUMNS:
+            indexes[name] = bool(unique)
+    return indexes
+
+
+def has_unique_key(cursor):
+    """True if solar_log_v2 cannot hold two rows of one site with the same timestamp"""
+    return any(_key_indexes(cursor).values())
+
+
+def ensure_unique_key(cursor):
+    """
+    Create the (site_id, epoch_minute) time index if missing and the
+    unique (site_id, timestamp) index if the table has no unique key;
+    True if the unique key was created. Fails with sqlite3.IntegrityError
+    while duplicates remain.
+    """
+    ensure_site_time_index(cursor)
+    if has_unique_key(cursor):
+        return False
+    cursor.execute(UNIQUE_INDEX_SQL)
+    cursor.execute(f"DROP INDEX IF EXISTS {LOOKUP_INDEX}")
+    return True
+
+
+def duplicate_days(cursor):
+    """[(site_id, day, surplus rows)] of the days with duplicate timestamps"""
+    cursor.execute(f"""
+        SELECT {SITE_COLUMN}, substr(timestamp, 1, 10) AS day, SUM(n - 1)
+        FROM (SELECT {SITE_COLUMN}, timestamp, COUNT(*) AS n FROM solar_log_v2
+              GROUP BY {SITE_COLUMN}, timestamp HAVING n > 1)
+        GROUP BY {SITE_COLUMN}, day
+        ORDER BY {SITE_COLUMN}, day
+    """)
+    return cursor.fetchall()
+
+
+def deduplicate(conn, batch_days=DEDUPE_BATCH_DAYS, touched_months=None):
+    """
+    Keep the first row per timestamp, one committed transaction per
+    batch_days days with duplicates. The derived energy_efactor values,
+    rollups, lux/power moments and coverage of the cleaned days are
+    brought up to date where the logbook has them. Cleaned months of the
+    default site (the one the archive holds) are added to touched_months.
+    Returns (removed rows, days).
+    """
+    cursor = conn.cursor()
+    if has_unique_key(cursor):
+        return 0, 0
+    if not has_site_column(cursor):
+        cursor.execute(SITE_COLUMN_SQL)
+    # Also next to a plain timestamp index, which loses to the
+    # (site_id, epoch_minute) one for a site's per-day ranges
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {LOOKUP_INDEX} ON solar_log_v2 ({SITE_COLUMN}, timestamp)")
+    conn.commit()
+    days = [(site_id, day) for site_id, day, _ in duplicate_days(cursor)]
+
+    cursor.execute("PRAGMA table_info(solar_log_v2)")
+    efactor = EFACTOR_COLUMN in {row[1] for row in cursor.fetchall()}
+    rollups = efactor and _table_exists(cursor, RESOLUTIONS["hour"][0])
+    correlation = _table_exists(cursor, CORRELATION_TABLE)
+    coverage = _table_exists(cursor, COVERAGE_TABLE)
+
+    removed = 0
+    for i in range(0, len(days), batch_days):
+        for site_id, day in days[i:i + batch_days]:
+            first, last = f"{day} 00:00", f"{day} 23:59"
+            cursor.execute(f"""
+                DELETE FROM solar_log_v2
+                WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?
+                  AND rowid NOT IN (
+                      SELECT MIN(rowid) FROM solar_log_v2
+                      WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?
+                      GROUP BY timestamp
+                  )
+            """, (site_id, first, last, site_id, first, last))
+            removed += cursor.rowcount
+            until = refresh_efactor(cursor, first, last, site_id) if efactor else last
+            if rollups:
+                refresh_rollups(cursor, first, until, site_id)
+            if coverage:
+                refresh_coverage(cursor, first, last, site_id)
+            if touched_months is not None and site_id == DEFAULT_SITE_ID:
+                touched_months.add(day[:7])
+        bump_generation(cursor)
+        conn.commit()
+
+    if correlation and days:
+        for site_id in sorted({site_id for site_id, _ in days}):
+            rebuild_correlation(cursor, {day[:7] for s, day in days if s == site_id}, site_id)
+        conn.commit()
+    return removed, len(days)
+
+
+def space_usage(conn):
+    """(file bytes incl. WAL, page size, pages, free pages)"""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return size, page_size, pages, free
+
+
+def analyze(conn):
+    """Refresh the query planner statistics"""
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+
+
+def reclaim_space(conn, pages=None):
+    """
+    Return free pages to the file system. A logbook not yet in
+    auto_vacuum INCREMENTAL mode is switched with one full VACUUM
+    (which rewrites the file); afterwards each run only releases up to
+    pages free pages (default all). Returns (mode before, pages released).
+    """
+    conn.commit()
+    mode = AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0], "NONE")
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if mode != "INCREMENTAL":
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    else:
+        # executescript steps the pragma to completion (execute() frees one page)
+        conn.executescript(f"PRAGMA incremental_vacuum{'' if pages is None else f'({int(pages)})'}")
+    # Let the WAL (if any) carry the truncation into the database file
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return mode, free - conn.execute("PRAGMA freelist_count").fetchone()[0]
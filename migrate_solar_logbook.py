@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # ---------------------------------------------
 # migrate_solar_logbook.py
-# Version       : 1.1.0
-# Last updated  : 2025-08-31
+# Version       : 1.12.2
+# Last updated  : 2026-10-18
 # Author        : KlausiPapa & ChatGPT
 # Description   : Migration script to update solar_log_v2 table columns
 # ---------------------------------------------
@@ -11,61 +11,211 @@ import sqlite3
 import configparser
 from pathlib import Path
 import sys
+from rollup_utils import RESOLUTIONS, RESOLUTION_COLUMN, RESOLUTION_COLUMN_SQL, ensure_rollup_tables, rebuild_rollups
+from correlation_utils import CORRELATION_TABLE, ensure_correlation_tables, rebuild_correlation
+from coverage_utils import COVERAGE_TABLE, ensure_coverage_table, rebuild_coverage
+from efactor_utils import EFACTOR_COLUMN, EFACTOR_COLUMN_SQL, rebuild_efactor
+from query_cache_utils import bump_generation
+from system_config_utils import (SYSTEM_COLUMNS, CONFIG_ID_COLUMN, CONFIG_ID_COLUMN_SQL,
+                                 ensure_system_config_table, normalize)
+from site_utils import (DEFAULT_SITE_ID, SITE_COLUMN, SITE_INDEX_SQL, ensure_site_column, ensure_site_table,
+                        is_partitioned)
+
+# Integer time keys for sargable date/time filters in query_solar_logbook.py.
+# Virtual generated columns: computed from 'timestamp' (UTC, 'YYYY-MM-DD HH:MM'),
+# so writers need no change; the indexes below hold the backfilled values.
+TIME_KEY_COLUMNS = {
+    "epoch_minute": "CAST(strftime('%s', timestamp) AS INTEGER) / 60",
+    "minute_of_day": "epoch_minute % 1440",
+}
 
 # ---------------------------------------------
-# Load config
+# Migration
 # ---------------------------------------------
-conf_path = "/config/shell/solar_logbook.conf"
-config = configparser.ConfigParser()
-if not Path(conf_path).exists():
-    print(f"❌ Config file not found: {conf_path}")
-    sys.exit(1)
+def partition_logbook(cur):
+    """
+    Re-create solar_log_v2 without its key on timestamp alone (the
+    PRIMARY KEY of older tables), so several sites can log the same
+    minute. Rows keep their rowid and without a site_id become the
+    default site; the indexes are dropped for migrate() to re-create.
+    Does not commit.
+    """
+    cur.execute("PRAGMA index_list(solar_log_v2)")
+    for name in [row[1] for row in cur.fetchall() if row[3] == "c"]:
+        cur.execute(f"DROP INDEX {name}")
+
+    # table_xinfo: cid, name, type, notnull, default, pk, hidden (2/3 = generated)
+    cur.execute("PRAGMA table_xinfo(solar_log_v2)")
+    definitions, stored = [], []
+    for _, name, col_type, notnull, default, _, hidden in cur.fetchall():
+        if hidden in (2, 3):
+            definitions.append(f"{name} INTEGER GENERATED ALWAYS AS ({TIME_KEY_COLUMNS[name]}) VIRTUAL")
+            continue
+        definitions.append(f"{name} {col_type}" + (" NOT NULL" if notnull else "")
+                           + ("" if default is None else f" DEFAULT {default}"))
+        stored.append(name)
+    if SITE_COLUMN not in stored:
+        definitions.insert(0, f"{SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID}")
+
+    cur.execute("ALTER TABLE solar_log_v2 RENAME TO solar_log_v2_unpartitioned")
+    cur.execute(f"CREATE TABLE solar_log_v2 ({', '.join(definitions)})")
+    cur.execute(f"""
+        INSERT INTO solar_log_v2 (rowid, {', '.join(stored)})
+        SELECT rowid, {', '.join(stored)} FROM solar_log_v2_unpartitioned
+    """)
+    cur.execute("DROP TABLE solar_log_v2_unpartitioned")
+
+
+def migrate(con, sensor_columns):
+    """
+    Bring solar_log_v2 up to date: sensor columns, system values moved
+    to system_config, time keys, source resolution, site partitioning
+    with the unique (site_id, timestamp) key, energy_efactor, rollup,
+    lux/power correlation and coverage tables.
+    Returns the added columns. Raises sqlite3.IntegrityError, after
+    committing the steps before it, when duplicate timestamps block the key.
+    """
+    cur = con.cursor()
+    expected_columns = ["timestamp"] + list(sensor_columns)
+
+    # Ensure table exists with at least site and timestamp
+    cur.execute(f"CREATE TABLE IF NOT EXISTS solar_log_v2 ({SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID}, timestamp TEXT)")
+    con.commit()
+
+    # Get existing columns
+    cur.execute("PRAGMA table_xinfo(solar_log_v2)")
+    existing_cols = [row[1] for row in cur.fetchall()]
 
-config.read(conf_path)
-db_path = config["paths"]["logbook_db_path"]
+    # Add missing columns
+    added = []
+    for col in expected_columns:
+        if col not in existing_cols:
+            cur.execute(f"ALTER TABLE solar_log_v2 ADD COLUMN {col} REAL")
+            added.append(col)
 
-# Collect expected columns from config
-sensor_columns = list(config["ha_sensors"].keys())
+    for col, expr in TIME_KEY_COLUMNS.items():
+        if col not in existing_cols:
+            cur.execute(f"ALTER TABLE solar_log_v2 ADD COLUMN {col} INTEGER GENERATED ALWAYS AS ({expr}) VIRTUAL")
+            added.append(col)
+    # System values once per version in system_config instead of in every
+    # minute row; a wide table is converted and compacted below
+    normalized = False
+    if CONFIG_ID_COLUMN not in existing_cols:
+        if any(col in existing_cols for col in SYSTEM_COLUMNS):
+            for col in SYSTEM_COLUMNS:
+                if col not in existing_cols:
+                    cur.execute(f"ALTER TABLE solar_log_v2 ADD COLUMN {col} REAL")
+            versions = normalize(cur)
+            normalized = True
+            print(f"✅ Moved system columns to system_config ({versions} version(s))")
+        else:
+            ensure_system_config_table(cur)
+            cur.execute(CONFIG_ID_COLUMN_SQL)
+        added.append(CONFIG_ID_COLUMN)
 
-# Collect fixed system columns
-system_columns = [
-    "modules1", "azimuth1", "tilt1",
-    "modules2", "azimuth2", "tilt2",
-    "batteries", "battery_cap"
-]
+    # Minutes each row stands for (rows from HA statistics cover 5 or 60)
+    if RESOLUTION_COLUMN not in existing_cols:
+        cur.execute(RESOLUTION_COLUMN_SQL)
+        added.append(RESOLUTION_COLUMN)
 
-expected_columns = ["timestamp"] + sensor_columns + system_columns
+    # Several sites in one table: every row belongs to a site, keyed by
+    # (site_id, timestamp); a key on timestamp alone is rebuilt away
+    ensure_site_table(cur)
+    if SITE_COLUMN not in existing_cols:
+        added.append(SITE_COLUMN)
+    rebuilt = False
+    if not is_partitioned(cur):
+        cur.execute("PRAGMA index_list(solar_log_v2)")
+        for _, name, unique, *_ in cur.fetchall():
+            cur.execute(f"PRAGMA index_info({name})")
+            if unique and [row[2] for row in cur.fetchall()] == ["timestamp"]:
+                partition_logbook(cur)
+                rebuilt = True
+                print("✅ Re-created solar_log_v2 with the (site_id, timestamp) key")
+                break
+    ensure_site_column(cur, unique=False)
+    try:
+        cur.execute(SITE_INDEX_SQL)
+    except sqlite3.IntegrityError:
+        # Without the key every per-row update of the rebuilds below scans
+        # the table; they run on the next migration, after the dedupe
+        con.commit()
+        raise sqlite3.IntegrityError("Duplicate timestamps found, unique index not created. "
+                                     "Run maintain_solar_logbook.py, then migrate again.") from None
+
+    # Derived from logged columns: computed here for the history, by the
+    # exporter for the minutes it writes
+    efactor_added = EFACTOR_COLUMN not in existing_cols
+    if efactor_added:
+        cur.execute(EFACTOR_COLUMN_SQL)
+        added.append(EFACTOR_COLUMN)
+        months = rebuild_efactor(cur)
+        if months:
+            print(f"✅ Computed energy_efactor ({months} month(s))")
+
+    # (site_id, epoch_minute) comes with the site column above
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_solar_log_v2_minute_of_day ON solar_log_v2 (minute_of_day, epoch_minute)")
+
+    # Hour/day/month rollups: build once for existing data, the exporter
+    # keeps them up to date afterwards
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    existing_tables = {row[0] for row in cur.fetchall()}
+    if RESOLUTIONS["hour"][0] not in existing_tables or efactor_added:
+        hours = rebuild_rollups(cur)
+        print(f"✅ Built rollup tables ({hours} hour(s))")
+    if CORRELATION_TABLE not in existing_tables:
+        samples = rebuild_correlation(cur)
+        print(f"✅ Built lux/power correlation tables ({samples} minute(s))")
+    if COVERAGE_TABLE not in existing_tables:
+        days = rebuild_coverage(cur)
+        print(f"✅ Built coverage table ({days} day(s))")
+    # Tables kept from before sites existed get the site_id key
+    ensure_rollup_tables(cur)
+    ensure_correlation_tables(cur)
+    ensure_coverage_table(cur)
+    # Results cached before the migration are stale
+    bump_generation(cur)
+
+    con.commit()
+    if normalized or rebuilt:
+        # Give the pages of the dropped columns / old table back to the file system
+        cur.execute("VACUUM")
+
+    # WAL lets queries read while the exporter writes
+    cur.execute("PRAGMA journal_mode = WAL")
+    return added
 
 # ---------------------------------------------
-# Connect DB
+# Main
 # ---------------------------------------------
-if not Path(db_path).exists():
-    print(f"❌ Database not found: {db_path}")
-    sys.exit(1)
-
-con = sqlite3.connect(db_path)
-cur = con.cursor()
+def main(conf_path="/config/shell/solar_logbook.conf"):
+    config = configparser.ConfigParser()
+    if not Path(conf_path).exists():
+        print(f"❌ Config file not found: {conf_path}")
+        sys.exit(1)
 
-# Ensure table exists with at least timestamp
-cur.execute("CREATE TABLE IF NOT EXISTS solar_log_v2 (timestamp TEXT PRIMARY KEY)")
-con.commit()
+    config.read(conf_path)
+    db_path = config["paths"]["logbook_db_path"]
 
-# Get existing columns
-cur.execute("PRAGMA table_info(solar_log_v2)")
-existing_cols = [row[1] for row in cur.fetchall()]
+    if not Path(db_path).exists():
+        print(f"❌ Database not found: {db_path}")
+        sys.exit(1)
 
-# Add missing columns
-added = []
-for col in expected_columns:
-    if col not in existing_cols:
-        cur.execute(f"ALTER TABLE solar_log_v2 ADD COLUMN {col} REAL")
-        added.append(col)
+    con = sqlite3.connect(db_path)
+    try:
+        # Collect expected columns from config
+        added = migrate(con, config["ha_sensors"].keys())
+    except sqlite3.IntegrityError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        con.close()
 
-con.commit()
-con.close()
+    if added:
+        print(f"✅ Added new columns: {', '.join(added)}")
+    else:
+        print("ℹ️ No new columns needed. Table already up to date.")
 
-if added:
-    print(f"✅ Added new columns: {', '.join(added)}")
-else:
-    print("ℹ️ No new columns needed. Table already up to date.")
 
+if __name__ == "__main__":
+    main()
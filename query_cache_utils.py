@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# query_cache_utils.py
+# Version      : 1.0.0
+# Last updated : 2026-10-18
+# Description  : Rendered query results reused until the logbook
+#                changes: a generation counter bumped by every writer,
+#                and a size-bounded LRU cache in its own SQLite file
+#                with hit/miss statistics
+# ---------------------------------------------
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# One row (id 0) in the logbook, bumped in the transaction of each write;
+# unlike PRAGMA data_version it means the same to every process
+GENERATION_TABLE = "logbook_generation"
+
+CACHE_TABLE = "query_cache"
+CACHE_STATS_TABLE = "query_cache_stats"
+CACHE_COUNTERS = ["hits", "misses", "stored", "evicted", "invalidated"]
+
+
+# ---------------------------------------------
+# Logbook change marker
+# ---------------------------------------------
+def bump_generation(cursor):
+    """Mark the logbook as changed for cached query results. Does not commit."""
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {GENERATION_TABLE} (id INTEGER PRIMARY KEY, generation INTEGER NOT NULL)")
+    cursor.execute(f"""
+        INSERT INTO {GENERATION_TABLE} (id, generation) VALUES (0, 1)
+        ON CONFLICT(id) DO UPDATE SET generation = generation + 1
+    """)
+
+
+def logbook_generation(cursor):
+    """Writes counted by bump_generation(), 0 before the first one"""
+    try:
+        cursor.execute(f"SELECT generation FROM {GENERATION_TABLE} WHERE id = 0")
+    except sqlite3.OperationalError:
+        return 0
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def change_marker(cursor, path):
+    """
+    [generation, schema version, inode]: changes with every write through
+    the logbook tools, every migration and when the file is replaced
+    """
+    schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+    return [logbook_generation(cursor), schema_version, os.stat(path).st_ino]
+
+
+def cache_key(params, marker):
+    """Hash of the normalized parameters (JSON-serialisable) and the change marker"""
+    text = json.dumps([params, marker], sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# ---------------------------------------------
+# Cache file
+# ---------------------------------------------
+def ensure_cache_tables(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+            key TEXT PRIMARY KEY,
+            logbook TEXT,
+            marker TEXT,
+            output TEXT,
+            bytes INTEGER,
+            used REAL
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{CACHE_TABLE}_used ON {CACHE_TABLE} (used)")
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {CACHE_STATS_TABLE} (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+
+def open_cache(path, **kwargs):
+    """Cache DB at path (created with its directory); losing it only costs misses"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    ensure_cache_tables(conn.cursor())
+    conn.commit()
+    return conn
+
+
+def _count(cursor, name, n=1):
+    if n:
+        cursor.execute(f"""
+            INSERT INTO {CACHE_STATS_TABLE} (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, (name, n))
+
+
+def cache_get(conn, key):
+    """Stored output for key (marked as used) or None; counts the hit or miss"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT output FROM {CACHE_TABLE} WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute(f"UPDATE {CACHE_TABLE} SET used = ? WHERE key = ?", (time.time(), key))
+    _count(cursor, "hits" if row else "misses")
+    conn.commit()
+    return row[0] if row else None
+
+
+def cache_put(conn, key, logbook, marker, output, max_entries, max_bytes):
+    """
+    Store output for key. Entries of the same logbook under another
+    change marker are dropped (invalidated), then the least recently
+    used ones until at most max_entries entries and max_bytes bytes are
+    left. An output larger than max_bytes is not stored.
+    """
+    size = len(output.encode())
+    if size > max_bytes or max_entries < 1:
+        return
+    cursor = conn.cursor()
+    marker = json.dumps(marker)
+    cursor.execute(f"DELETE FROM {CACHE_TABLE} WHERE logbook = ? AND marker <> ?", (logbook, marker))
+    _count(cursor, "invalidated", cursor.rowcount)
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO {CACHE_TABLE} (key, logbook, marker, output, bytes, used)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (key, logbook, marker, output, size, time.time()))
+    _count(cursor, "stored")
+
+    # Newest first: keep the entries that fit, evict the rest
+    cursor.execute(f"SELECT key, bytes FROM {CACHE_TABLE} ORDER BY used DESC")
+    kept = total = 0
+    evicted = []
+    for entry, entry_bytes in cursor.fetchall():
+        if kept < max_entries and total + entry_bytes <= max_bytes:
+            kept += 1
+            total += entry_bytes
+        else:
+            evicted.append((entry,))
+    cursor.executemany(f"DELETE FROM {CACHE_TABLE} WHERE key = ?", evicted)
+    _count(cursor, "evicted", len(evicted))
+    conn.commit()
+
+
+def cache_stats(conn):
+    """{entries, bytes, hits, misses, stored, evicted, invalidated}"""
+    cursor = conn.cursor()
+    entries, size = cursor.execute(f"SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM {CACHE_TABLE}").fetchone()
+    stats = dict.fromkeys(CACHE_COUNTERS, 0)
+    stats.update(cursor.execute(f"SELECT name, value FROM {CACHE_STATS_TABLE}"))
+    return {"entries": entries, "bytes": size, **stats}
+
+
+def clear_cache(conn):
+    """Drop every entry and reset the counters"""
+    conn.execute(f"DELETE FROM {CACHE_TABLE}")
+    conn.execute(f"DELETE FROM {CACHE_STATS_TABLE}")
+    conn.commit()
@@ -1,196 +1,782 @@
 #!/usr/bin/env python3
 # ---------------------------------------------
 # query_solar_logbook.py
-# Version      : 1.5.6
-# Last updated : 2025-08-31
+# Version      : 1.20.2
+# Last updated : 2026-10-18
 # Description  : Query solar_log_v2 sorted by timestamp
-#                and optionally interpolate and compute watt/klux
+#                and optionally interpolate and compute watt/klux,
+#                per site or across sites; printed results are cached
+#                until the logbook changes.
+#                Importable: query() and the helpers below take explicit
+#                parameters, main() is the command line entry point
 # ---------------------------------------------
 
 import sqlite3
 import argparse
-from tabulate import tabulate
+import contextlib
 import os
 import csv
+import gzip
+import io
+import sys
+import calendar
+import time
 from datetime import datetime, timedelta
-from interpolation_utils import interpolate_timeseries, add_watt_per_klux
-from configparser import ConfigParser
+from rollup_utils import RESOLUTIONS, ROLLUP_METRICS, ENERGY_COUNTERS
+from correlation_utils import CORRELATION_HEADERS, BIN_HEADERS, correlation_summary, correlation_bins
+from archive_utils import load_manifest, plan_segments
+from config_utils import load_config
+from db_utils import connection
+from maintenance_utils import deduplicate
+from system_config_utils import SYSTEM_COLUMNS, CONFIG_ID_COLUMN, logbook_source
+from site_utils import DEFAULT_SITE, SITE_COLUMN, logbook_sites, site_config, site_location_path
+from query_cache_utils import cache_get, cache_key, cache_put, cache_stats, change_marker, clear_cache, open_cache
+from stats_utils import RunStats, emit_stats
+
+# numpy (columnar_utils, interpolation_utils, archive reads) and tabulate
+# are imported only by the code paths that need them: a plain --day
+# query runs on sqlite3 rows alone and starts without loading numpy
 
 # ---------------------------------------------
-# Load config
+# Column headers
 # ---------------------------------------------
-config = ConfigParser()
-config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solar_logbook.conf")
-if not config.read(config_path):
-    raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+HEADERS = ["timestamp", "lux", "power1", "power2",
+           "modules1", "azimuth1", "tilt1",
+           "modules2", "azimuth2", "tilt2",
+           "batteries", "battery_cap",
+           "power_load", "battery_load",
+           "grid_power", "grid_export", "grid_fossil_share", "total_power",
+           "solar_energy1", "solar_energy2",
+           "energy_efactor",
+           "watt_per_klux"]
+VALUE_HEADERS = HEADERS[1:-1]  # numeric logbook columns
 
 # ---------------------------------------------
-# Argument parser
+# Maintenance
 # ---------------------------------------------
-parser = argparse.ArgumentParser(description="Query or clean the solar_log_v2 table.")
-parser.add_argument(
-    '--db-path',
-    default=config.get("paths", "logbook_db_path", fallback="/config/solar_logbook.db"),
-    help='Path to the SQLite database'
-)
-parser.add_argument('--limit', type=int, default=10, help='Limit number of rows to display')
-parser.add_argument('--remove-duplicates', action='store_true', help='Remove duplicate entries by timestamp')
-parser.add_argument('--format', action='store_true', help='Pretty-print the result in table format')
-parser.add_argument('--day', help='Show only rows for a specific date (YYYY-MM-DD)')
-parser.add_argument('--to-day', help='End date (inclusive) in format YYYY-MM-DD')
-parser.add_argument('--from-day', help='Start date (inclusive) in format YYYY-MM-DD')
-parser.add_argument('--time', nargs='+', help='Time of day filter: HH:MM [duration_hours]')
-parser.add_argument('--auto-limit', action='store_true', help='Automatically set limit based on time range')
-parser.add_argument('--filter-nonzero', action='store_true', help='Only show rows with power1 or power2 > 0')
-parser.add_argument('--export', help='Export results to a CSV file')
-parser.add_argument('--interpolate', action='store_true', help='Interpolate missing numeric values')
-args = parser.parse_args()
-
-# ---------------------------------------------
-# Connect to SQLite database
-# ---------------------------------------------
-if not os.path.exists(args.db_path):
-    print(f"❌ Database not found at {args.db_path}")
-    exit(1)
-
-conn = sqlite3.connect(args.db_path)
-cursor = conn.cursor()
-
-# ---------------------------------------------
-# Optional: Remove duplicates by timestamp
-# ---------------------------------------------
-if args.remove_duplicates:
-    print("🔧 Removing duplicates based on timestamp...")
-    cursor.execute("SELECT COUNT(*) FROM solar_log_v2")
-    before = cursor.fetchone()[0]
-
-    cursor.execute("""
-        DELETE FROM solar_log_v2
-        WHERE rowid NOT IN (
-            SELECT MIN(rowid)
-            FROM solar_log_v2
-            GROUP BY timestamp
-        )
-    """)
-    conn.commit()
-
-    cursor.execute("SELECT COUNT(*) FROM solar_log_v2")
-    after = cursor.fetchone()[0]
-    deleted = before - after
-    print(f"✅ Removed {deleted} duplicate rows.")
-
-# ---------------------------------------------
-# Optional time-of-day filter (in SQL)
-# ---------------------------------------------
-time_clause = ""
-if args.time:
-    try:
-        start_time = datetime.strptime(args.time[0], "%H:%M").time()
-        duration_hours = int(args.time[1]) if len(args.time) > 1 else 1
-        start_str = start_time.strftime("%H:%M:%S")
-        end_time = (datetime.combine(datetime.today(), start_time) + timedelta(hours=duration_hours)).time()
-        end_str = end_time.strftime("%H:%M:%S")
-        time_clause = f"AND TIME(timestamp) BETWEEN '{start_str}' AND '{end_str}'"
-    except ValueError:
-        print("❌ Invalid --time format. Use --time HH:MM [duration_hours]")
-        exit(1)
+def remove_duplicates(conn, archive_dir=None):
+    """
+    Keep the first row per timestamp (see maintain_solar_logbook.py) and
+    drop the cleaned months from the archive in archive_dir; returns the
+    number of deleted rows
+    """
+    touched_months = set()
+    removed = deduplicate(conn, touched_months=touched_months)[0]
+    if archive_dir:
+        from export_solar_logbook import invalidate_archive
+
+        invalidate_archive(archive_dir, touched_months)
+    return removed
 
 # ---------------------------------------------
-# Auto-limit based on --time and date range
+# Rollups (hour/day/month) instead of minute rows
 # ---------------------------------------------
-if args.auto_limit and args.time:
-    duration_hours = int(args.time[1]) if len(args.time) > 1 else 1
-    if args.from_day and args.to_day:
-        start_date = datetime.strptime(args.from_day, "%Y-%m-%d").date()
-        end_date = datetime.strptime(args.to_day, "%Y-%m-%d").date()
+def rollup_headers():
+    headers = ["period", "minutes"]
+    for m in ROLLUP_METRICS:
+        headers += [f"{m}_mean", f"{m}_min", f"{m}_max"]
+    return headers + list(ENERGY_COUNTERS)
+
+def query_rollups(cursor, resolution, day=None, from_day=None, to_day=None, limit=10, site_id=None):
+    """
+    Rows of the hour/day/month rollup table (of one site if site_id is
+    given), values rounded to 2 decimals. Raises sqlite3.OperationalError
+    if the rollup table does not exist.
+    """
+    table, width = RESOLUTIONS[resolution]
+
+    # Periods are prefixes of 'YYYY-MM-DD HH:MM', so dates truncated to the
+    # period width give a range on the (site_id, period) key
+    rollup_where = []
+    rollup_params = []
+    if site_id is not None:
+        rollup_where.append(f"{SITE_COLUMN} = ?")
+        rollup_params.append(site_id)
+    if day:
+        rollup_where.append("period BETWEEN ? AND ?")
+        rollup_params.extend([day[:width], day[:width] + "~"])
+    if from_day:
+        rollup_where.append("period >= ?")
+        rollup_params.append(from_day[:width])
+    if to_day:
+        rollup_where.append("period <= ?")
+        rollup_params.append(to_day[:width] + "~")
+
+    cursor.execute(f"""
+        SELECT {', '.join(rollup_headers())}
+        FROM {table}
+        {"WHERE " + " AND ".join(rollup_where) if rollup_where else ""}
+        ORDER BY period ASC
+        LIMIT ?
+    """, (*rollup_params, limit))
+    return [[round(v, 2) if isinstance(v, float) else v for v in row] for row in cursor.fetchall()]
+
+# ---------------------------------------------
+# Filters
+# ---------------------------------------------
+def has_time_keys(cursor):
+    """True if migrate_solar_logbook.py added the integer time key columns"""
+    cursor.execute("PRAGMA table_xinfo(solar_log_v2)")
+    return {"epoch_minute", "minute_of_day"} <= {row[1] for row in cursor.fetchall()}
+
+def missing_columns(cursor):
+    """
+    VALUE_HEADERS the logbook lacks (e.g. energy_efactor before
+    migration); read as NULL. System columns in system_config count as present.
+    """
+    cursor.execute("PRAGMA table_xinfo(solar_log_v2)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if CONFIG_ID_COLUMN in columns:
+        columns.update(SYSTEM_COLUMNS)
+    return set(VALUE_HEADERS) - columns
+
+def day_start_minute(day):
+    """Epoch minute of 00:00 UTC on a YYYY-MM-DD date"""
+    return calendar.timegm(datetime.strptime(day, "%Y-%m-%d").timetuple()) // 60
+
+def parse_time_window(time_args):
+    """
+    --time HH:MM [duration_hours] -> (start_min, end_min) minutes of day;
+    end_min < start_min when the window wraps past midnight.
+    Raises ValueError on a malformed value.
+    """
+    start_time = datetime.strptime(time_args[0], "%H:%M").time()
+    duration_hours = int(time_args[1]) if len(time_args) > 1 else 1
+    end_time = (datetime.combine(datetime.today(), start_time) + timedelta(hours=duration_hours)).time()
+    return start_time.hour * 60 + start_time.minute, end_time.hour * 60 + end_time.minute
+
+def auto_limit(time_args, day=None, from_day=None, to_day=None):
+    """Row limit that covers the --time window on every selected day"""
+    duration_hours = int(time_args[1]) if len(time_args) > 1 else 1
+    if from_day and to_day:
+        start_date = datetime.strptime(from_day, "%Y-%m-%d").date()
+        end_date = datetime.strptime(to_day, "%Y-%m-%d").date()
         day_count = (end_date - start_date).days + 1
-    elif args.day:
+    else:
         day_count = 1
+    return duration_hours * 60 * day_count
+
+def build_filter(time_keys, day=None, from_day=None, to_day=None, time_window=None, filter_nonzero=False,
+                 missing=(), source="solar_log_v2", site_id=None):
+    """
+    SQL conditions for the minute query; missing columns (see
+    missing_columns()) are selected as NULL, rows are read from source
+    (see system_config_utils.logbook_source()), only those of site_id
+    if given.
+
+    Returns:
+        dict with where/params (SQL), time_clause, the half-open
+        epoch-minute range lo/hi (None = open end, only with time keys)
+        and time_window/filter_nonzero for filtering archived months
+    """
+    where_clauses = []
+    params = []
+    if site_id is not None:
+        where_clauses.append(f"solar_log_v2.{SITE_COLUMN} = ?")
+        params.append(site_id)
+
+    # Optional time-of-day filter (in SQL)
+    time_clause = ""
+    if time_window:
+        start_min, end_min = time_window
+        if time_keys:
+            if start_min <= end_min:
+                time_clause = f"AND minute_of_day BETWEEN {start_min} AND {end_min}"
+            else:
+                # Window wraps past midnight
+                time_clause = f"AND (minute_of_day >= {start_min} OR minute_of_day <= {end_min})"
+        else:
+            start_str = f"{start_min // 60:02d}:{start_min % 60:02d}:00"
+            end_str = f"{end_min // 60:02d}:{end_min % 60:02d}:00"
+            time_clause = f"AND TIME(timestamp) BETWEEN '{start_str}' AND '{end_str}'"
+
+    range_lo = range_hi = None
+    if time_keys:
+        lower = [day_start_minute(d) for d in (day, from_day) if d]
+        upper = [day_start_minute(d) + 1440 for d in (day, to_day) if d]
+        range_lo = max(lower) if lower else None
+        range_hi = min(upper) if upper else None
+
+        # Served by ix_solar_log_v2_site_epoch_minute (ix_solar_log_v2_epoch_minute
+        # in a logbook from before sites existed)
+        if range_lo is not None:
+            where_clauses.append("epoch_minute >= ?")
+            params.append(range_lo)
+        if range_hi is not None:
+            where_clauses.append("epoch_minute < ?")
+            params.append(range_hi)
     else:
-        day_count = 1  # fallback
-    args.limit = duration_hours * 60 * day_count
+        if day:
+            where_clauses.append("DATE(timestamp) = ?")
+            params.append(day)
+
+        if to_day:
+            where_clauses.append("DATE(timestamp) <= ?")
+            params.append(to_day)
+
+        if from_day:
+            where_clauses.append("DATE(timestamp) >= ?")
+            params.append(from_day)
+
+    if filter_nonzero:
+        where_clauses.append("(power1 > 0 OR power2 > 0)")
+
+    return {
+        "time_keys": time_keys,
+        "where": where_clauses,
+        "params": params,
+        "time_clause": time_clause,
+        "lo": range_lo,
+        "hi": range_hi,
+        "time_window": time_window,
+        "filter_nonzero": filter_nonzero,
+        "missing": set(missing),
+        "source": source,
+    }
+
+def minute_query(filt, seg_lo=None, seg_hi=None, limit=None):
+    """(sql, params) selecting epoch minute + VALUE_HEADERS in time order"""
+    seg_clauses = list(filt["where"])
+    seg_params = list(filt["params"])
+    if seg_lo is not None:
+        seg_clauses.append("epoch_minute >= ?")
+        seg_params.append(seg_lo)
+    if seg_hi is not None:
+        seg_clauses.append("epoch_minute < ?")
+        seg_params.append(seg_hi)
+    seg_where = "WHERE " + " AND ".join(seg_clauses) if seg_clauses else ""
+    time_clause = filt["time_clause"]
+    if time_clause:
+        seg_where += f" {time_clause}" if seg_where else f"WHERE {time_clause[4:]}"
+
+    minute_key = "epoch_minute" if filt["time_keys"] else "CAST(strftime('%s', timestamp) AS INTEGER) / 60"
+    query = f"""
+        SELECT {minute_key}, {', '.join("NULL" if h in filt.get("missing", ()) else h for h in VALUE_HEADERS)}
+        FROM {filt.get("source", "solar_log_v2")}
+        {seg_where}
+        ORDER BY {"epoch_minute" if filt["time_keys"] else "timestamp"} ASC
+    """
+    if limit is not None:
+        query += " LIMIT ?"
+        seg_params.append(limit)
+    return query, seg_params
+
+# ---------------------------------------------
+# Plain path: sqlite3 rows, no numpy
+# ---------------------------------------------
+def _watt_per_klux(lux, power):
+    if lux is None or power is None or not lux > 0:
+        return None
+    # Same rounding as np.round(x, 1) in the columnar path
+    return round(power / lux * 1000 * 10) / 10
+
+def query_rows(cursor, filt, limit=None):
+    """
+    Output rows (HEADERS order) straight from SQLite, without archive,
+    interpolation or numpy - the fast path for small plain queries
+    """
+    cursor.execute(*minute_query(filt, limit=limit))
+    lux_i, power_i = VALUE_HEADERS.index("lux") + 1, VALUE_HEADERS.index("power1") + 1
+    rows = []
+    for row in cursor.fetchall():
+        rows.append([time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(row[0] * 60)),
+                     *(None if v is None else float(v) for v in row[1:]),
+                     _watt_per_klux(row[lux_i], row[power_i])])
+    return rows
 
 # ---------------------------------------------
-# Build WHERE clause
+# Columnar path: NumPy chunks from SQLite and the archive
 # ---------------------------------------------
-where_clauses = []
-params = []
+def archive_segments(filt, manifest):
+    """
+    Time-ordered ("sql", lo, hi) / ("archive", month) segments: closed
+    months frozen by archive_solar_logbook.py are read from the
+    memory-mapped archive, everything else from SQLite
+    """
+    if not manifest or not filt["time_keys"]:
+        return [("sql", None, None)]
+    return plan_segments(manifest, filt["lo"], filt["hi"])
+
+def _archive_chunk(filt, archive_dir, manifest, month):
+    import numpy as np
+    from archive_utils import read_month
+    from columnar_utils import column_count
+
+    chunk = read_month(archive_dir, manifest, month, VALUE_HEADERS, filt["lo"], filt["hi"])
+    keep = np.ones(column_count(chunk), dtype=bool)
+    if filt["time_window"]:
+        start_min, end_min = filt["time_window"]
+        minute_of_day = chunk["timestamp"] % 1440
+        if start_min <= end_min:
+            keep &= (minute_of_day >= start_min) & (minute_of_day <= end_min)
+        else:
+            keep &= (minute_of_day >= start_min) | (minute_of_day <= end_min)
+    if filt["filter_nonzero"]:
+        keep &= (chunk["power1"] > 0) | (chunk["power2"] > 0)
+    return {name: col[keep] for name, col in chunk.items()}
+
+def result_chunks(cursor, filt, limit=None, archive_dir=None, manifest=None, chunk_size=10000):
+    """Yield the result as time-ordered column chunks, at most limit rows"""
+    from columnar_utils import iter_column_chunks, column_count
+
+    remaining = limit
+    for segment in archive_segments(filt, manifest):
+        if remaining is not None and remaining <= 0:
+            return
+        if segment[0] == "archive":
+            chunks = [_archive_chunk(filt, archive_dir, manifest, segment[1])]
+        else:
+            cursor.execute(*minute_query(filt, segment[1], segment[2], remaining))
+            chunks = iter_column_chunks(cursor, VALUE_HEADERS, chunk_size)
+        for chunk in chunks:
+            if remaining is not None:
+                chunk = {name: col[:remaining] for name, col in chunk.items()}
+                remaining -= column_count(chunk)
+            yield chunk
+
+def query_columns(cursor, filt, limit=None, interpolate=False, max_gap=None,
+                  archive_dir=None, manifest=None, chunk_size=10000, stats=None, model=None):
+    """
+    The result as one column dict (see columnar_utils), optionally
+    interpolated, with 'watt_per_klux' added - and with a
+    solar_utils.ExpectedPower model its EXPECTED_HEADERS columns
+    """
+    from columnar_utils import concat_columns, column_count
+    from interpolation_utils import interpolate_columns, watt_per_klux_column
 
-if args.day:
-    where_clauses.append("DATE(timestamp) = ?")
-    params.append(args.day)
+    stats = stats or RunStats()
+    with stats.stage("query"):
+        columns = concat_columns(list(result_chunks(cursor, filt, limit, archive_dir, manifest, chunk_size)),
+                                 VALUE_HEADERS)
+    if column_count(columns):
+        if interpolate:
+            with stats.stage("interpolate"):
+                columns = interpolate_columns(columns, VALUE_HEADERS, max_gap)
+        columns["watt_per_klux"] = watt_per_klux_column(columns)
+        if model is not None:
+            with stats.stage("expected"):
+                columns.update(model.columns(columns))
+    return columns
 
-if args.to_day:
-    where_clauses.append("DATE(timestamp) <= ?")
-    params.append(args.to_day)
+def export_csv(cursor, filt, out, interpolate=False, max_gap=None,
+               archive_dir=None, manifest=None, chunk_size=10000, stats=None, model=None):
+    """
+    Stream every matching row as CSV to the text file out (plus the
+    expected power columns of model); returns the row count
+    """
+    from columnar_utils import column_count, iter_rows
+    from interpolation_utils import watt_per_klux_column, GapInterpolator
 
-if args.from_day:
-    where_clauses.append("DATE(timestamp) >= ?")
-    params.append(args.from_day)
+    stats = stats or RunStats()
+    interpolator = GapInterpolator(VALUE_HEADERS, max_gap) if interpolate else None
+    headers = output_headers(model)
+    exported = 0
+    writer = csv.writer(out)
+    writer.writerow(headers)
 
-if args.filter_nonzero:
-    where_clauses.append("(power1 > 0 OR power2 > 0)")
+    def write_chunk(chunk):
+        nonlocal exported
+        if chunk is None or not column_count(chunk):
+            return
+        chunk["watt_per_klux"] = watt_per_klux_column(chunk)
+        if model is not None:
+            chunk.update(model.columns(chunk))
+        writer.writerows(iter_rows(chunk, headers))
+        exported += column_count(chunk)
 
-where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-if time_clause:
-    where_sql += f" {time_clause}" if where_sql else f"WHERE {time_clause[4:]}"
+    # Interleaved per chunk: each stage is timed on its own
+    chunks = result_chunks(cursor, filt, None, archive_dir, manifest, chunk_size)
+    while True:
+        with stats.stage("query"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if interpolator:
+            with stats.stage("interpolate"):
+                chunk = interpolator.feed(chunk)
+        with stats.stage("render"):
+            write_chunk(chunk)
+    if interpolator:
+        with stats.stage("interpolate"):
+            chunk = interpolator.flush()
+        with stats.stage("render"):
+            write_chunk(chunk)
+    return exported
+
+def output_headers(model=None):
+    """HEADERS, plus the expected power columns when a model is given"""
+    if model is None:
+        return HEADERS
+    from solar_utils import EXPECTED_HEADERS
+
+    return HEADERS + EXPECTED_HEADERS
+
+def fetch_rows(cursor, filt, limit=None, interpolate=False, max_gap=None,
+               archive_dir=None, manifest=None, chunk_size=10000, stats=None, model=None):
+    """
+    Output rows (output_headers(model) order): the plain sqlite3 path
+    when neither interpolation, expected power nor archived months are
+    involved, else the columnar one. Stage timings go to stats ('query',
+    'interpolate', 'expected') if given.
+    """
+    stats = stats or RunStats()
+    if (not interpolate and model is None
+            and all(seg[0] == "sql" for seg in archive_segments(filt, manifest))):
+        with stats.stage("query"):
+            rows = query_rows(cursor, filt, limit)
+    else:
+        from columnar_utils import iter_rows
+
+        columns = query_columns(cursor, filt, limit, interpolate, max_gap, archive_dir, manifest, chunk_size,
+                                stats, model)
+        with stats.stage("query"):
+            rows = list(iter_rows(columns, output_headers(model)))
+    stats.count("rows", len(rows))
+    return rows
+
+def query(db_path, day=None, from_day=None, to_day=None, time_of_day=None, filter_nonzero=False,
+          limit=10, interpolate=False, max_gap=None, archive_dir=None, connections=None, stats=None,
+          model=None, site=DEFAULT_SITE):
+    """
+    Library entry point: minute rows of one site's solar_log_v2 rows as
+    dicts keyed by HEADERS. time_of_day is (HH:MM, duration_hours) like
+    --time; limit=None returns every row; archive_dir=None reads SQLite
+    only; stats is an optional stats_utils.RunStats; model an optional
+    solar_utils.ExpectedPower adding EXPECTED_HEADERS keys. Raises
+    KeyError for a site the logbook does not know.
+    """
+    with connection(db_path, connections) as conn:
+        cursor = conn.cursor()
+        time_keys = has_time_keys(cursor)
+        [(_, site_id)] = logbook_sites(cursor, [site])
+        filt = build_filter(time_keys, day, from_day, to_day,
+                            parse_time_window(time_of_day) if time_of_day else None, filter_nonzero,
+                            missing_columns(cursor), logbook_source(cursor), site_id)
+        # The archive holds the default site only
+        manifest = load_manifest(archive_dir) if time_keys and site == DEFAULT_SITE else None
+        rows = fetch_rows(cursor, filt, limit, interpolate, max_gap, archive_dir, manifest, stats=stats, model=model)
+    return [dict(zip(output_headers(model), row)) for row in rows]
 
 # ---------------------------------------------
-# Query data sorted by timestamp
+# Argument parser
 # ---------------------------------------------
-query = f"""
-    SELECT timestamp, lux, power1, power2,
-           modules1, azimuth1, tilt1,
-           modules2, azimuth2, tilt2,
-           batteries, battery_cap,
-           power_load, battery_load,
-           grid_power, grid_export, grid_fossil_share, total_power,
-           solar_energy1, solar_energy2
-    FROM solar_log_v2
-    {where_sql}
-    ORDER BY timestamp ASC
-    LIMIT ?
-"""
-params.append(args.limit)
-cursor.execute(query, params)
-rows = cursor.fetchall()
+def build_parser(config):
+    parser = argparse.ArgumentParser(description="Query or clean the solar_log_v2 table.")
+    parser.add_argument(
+        '--db-path',
+        default=config.get("paths", "logbook_db_path", fallback="/config/solar_logbook.db"),
+        help='Path to the SQLite database'
+    )
+    parser.add_argument('--limit', type=int, default=10, help='Limit number of rows to display')
+    parser.add_argument('--remove-duplicates', action='store_true', help='Remove duplicate entries by timestamp')
+    parser.add_argument('--format', action='store_true', help='Pretty-print the result in table format')
+    parser.add_argument('--day', help='Show only rows for a specific date (YYYY-MM-DD)')
+    parser.add_argument('--to-day', help='End date (inclusive) in format YYYY-MM-DD')
+    parser.add_argument('--from-day', help='Start date (inclusive) in format YYYY-MM-DD')
+    parser.add_argument('--time', nargs='+', help='Time of day filter: HH:MM [duration_hours]')
+    parser.add_argument('--auto-limit', action='store_true', help='Automatically set limit based on time range')
+    parser.add_argument('--filter-nonzero', action='store_true', help='Only show rows with power1 or power2 > 0')
+    parser.add_argument('--export', help=(
+        'Stream all matching rows (no --limit) as CSV to this file; '
+        'a .gz suffix writes gzip-CSV, "-" writes to stdout'
+    ))
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per fetchmany() call for --export (default: 10000)')
+    parser.add_argument('--no-archive', action='store_true', help='Read archived months from SQLite instead of the columnar archive')
+    parser.add_argument('--interpolate', action='store_true', help='Interpolate missing numeric values')
+    parser.add_argument(
+        '--max-gap',
+        type=float,
+        default=config.getfloat("interpolation", "max_gap_minutes", fallback=None),
+        help='Longest gap in minutes that --interpolate fills (default from conf, none = no limit)'
+    )
+    parser.add_argument('--resolution', choices=list(RESOLUTIONS), help='Read hour/day/month rollups instead of minute rows')
+    parser.add_argument('--correlation', choices=["summary", "bins"], help=(
+        'Lux/power1 statistics per configuration from the moments kept at insert time '
+        '(summary: regression and outlier band, bins: per lux bin); '
+        '--day/--from-day/--to-day select the months'
+    ))
+    parser.add_argument(
+        '--outlier-sigma',
+        type=float,
+        default=config.getfloat("correlation", "outlier_sigma", fallback=3.0),
+        help='Standard deviations beyond which --correlation counts a minute as outlier (default from conf)'
+    )
+    parser.add_argument('--expected', action='store_true', help=(
+        'Add clear-sky expected power of both strings and the performance ratio '
+        '(model for the HA location and [system], cached per site)'
+    ))
+    parser.add_argument('--site', action='append', help=(
+        f'Site to query, repeatable; several sites add a leading "site" column '
+        f'(default: {DEFAULT_SITE}, the plain [paths]/[system] installation)'
+    ))
+    parser.add_argument('--all-sites', action='store_true', help=(
+        'Query every site in the logbook; --correlation merges their moments per configuration'
+    ))
+    parser.add_argument('--no-cache', action='store_true', help=(
+        'Run the query even if the result cache ([query_cache]) holds its output'
+    ))
+    parser.add_argument('--cache-stats', action='store_true', help='Show the result cache size and hit/miss counters')
+    parser.add_argument('--clear-cache', action='store_true', help='Empty the result cache and reset its counters')
+    return parser
+
+def print_rows(rows, headers, pretty=False, blank_none=False):
+    """Grid table with pretty, else tab-separated lines"""
+    if pretty:
+        from tabulate import tabulate
+
+        print(tabulate(rows, headers=headers, tablefmt="grid"))
+    else:
+        for r in rows:
+            print("\t".join("" if v is None and blank_none else str(v) for v in r))
 
 # ---------------------------------------------
-# Column headers
+# Result cache
 # ---------------------------------------------
-headers = ["timestamp", "lux", "power1", "power2",
-           "modules1", "azimuth1", "tilt1",
-           "modules2", "azimuth2", "tilt2",
-           "batteries", "battery_cap",
-           "power_load", "battery_load",
-           "grid_power", "grid_export", "grid_fossil_share", "total_power",
-           "solar_energy1", "solar_energy2",
-           "watt_per_klux"]
+# Arguments that do not change the printed result
+UNCACHED_ARGS = {"no_cache", "cache_stats", "clear_cache"}
+
+def cache_params(args, config):
+    """
+    The normalized parameters the printed result depends on: arguments,
+    config and (with --expected) the HA location; None when the run must
+    not be cached (it writes, streams an export or fails on its site)
+    """
+    if args.remove_duplicates or args.export:
+        return None
+    params = {key: value for key, value in vars(args).items() if key not in UNCACHED_ARGS}
+    params["db_path"] = os.path.abspath(args.db_path)
+    params["config"] = {section: dict(config.items(section)) for section in config.sections()}
+    if args.expected:
+        from ha_location import read_ha_location_from_storage
+
+        try:
+            sites = [site_config(config, site) for site in args.site or [DEFAULT_SITE]]
+        except KeyError:
+            return None
+        params["location"] = [read_ha_location_from_storage(site_location_path(site)) for site in sites]
+    return params
+
+def cached_query(conn, args, config, stats, params, cache_path, connections=None):
+    """
+    run_query() through the result cache: the output printed for the same
+    parameters since the logbook last changed, else the query's output,
+    stored for the next call
+    """
+    max_entries = config.getint("query_cache", "max_entries", fallback=200)
+    max_bytes = int(config.getfloat("query_cache", "max_mb", fallback=20) * 1024 * 1024)
+    try:
+        with stats.stage("cache"):
+            marker = change_marker(conn.cursor(), args.db_path)
+            key = cache_key(params, marker)
+            with connection(cache_path, connections, open_cache) as cache:
+                output = cache_get(cache, key)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Query cache unavailable ({e}), querying without it")
+        run_query(conn, args, config, stats)
+        return
+    if output is not None:
+        stats.count("cache_hits")
+        sys.stdout.write(output)
+        return
+
+    stats.count("cache_misses")
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            run_query(conn, args, config, stats)
+    finally:
+        # Also the messages of a run that fails with an error (not stored)
+        sys.stdout.write(buffer.getvalue())
+    try:
+        with stats.stage("cache"):
+            with connection(cache_path, connections, open_cache) as cache:
+                cache_put(cache, key, params["db_path"], marker, buffer.getvalue(), max_entries, max_bytes)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Query result not cached ({e})")
+
+def print_cache_stats(counters, pretty=False):
+    requests = counters["hits"] + counters["misses"]
+    rows = [[name, value] for name, value in counters.items()]
+    rows.append(["hit_rate_pct", round(100 * counters["hits"] / requests, 1) if requests else ""])
+    print_rows(rows, ["counter", "value"], pretty)
 
 # ---------------------------------------------
-# Output: print or export
+# Main
 # ---------------------------------------------
-if rows:
-    base_headers = headers[:-1]  # all except watt_per_klux
-    records = [
-        {base_headers[i]: row[i] if base_headers[i] != "timestamp" else datetime.fromisoformat(row[0])
-         for i in range(len(base_headers))}
-        for row in rows
-    ]
+def run_query(conn, args, config, stats):
+    """
+    The query, duplicate removal or statistics main() was called for,
+    printed to stdout. Raises ValueError for unusable options and
+    sqlite3.DatabaseError for a logbook missing what they need.
+    """
+    cursor = conn.cursor()
 
-    if args.interpolate:
-        records = interpolate_timeseries(records)
-        records = add_watt_per_klux(records)
-    else:
-        records = add_watt_per_klux(records)
+    # Optional: Remove duplicates by timestamp
+    if args.remove_duplicates:
+        print("🔧 Removing duplicates based on timestamp...")
+        with stats.stage("dedupe"):
+            removed = remove_duplicates(conn, config.get("paths", "archive_dir", fallback="/config/solar_archive"))
+        stats.count("duplicates", removed)
+        print(f"✅ Removed {removed} duplicate rows.")
+
+    # [(name, site_id)]; several sites are queried one after the other
+    try:
+        sites = logbook_sites(cursor, None if args.all_sites else args.site or [DEFAULT_SITE])
+    except KeyError as e:
+        raise ValueError(f"Site '{e.args[0]}' has no rows in the logbook.") from None
+    labeled = len(sites) > 1 or args.all_sites
+
+    # Optional: lux/power statistics from the stored moments
+    if args.correlation:
+        from_month = (args.day or args.from_day or "")[:7] or None
+        to_month = (args.day or args.to_day or "")[:7] or None
+        read, headers = ((correlation_summary, CORRELATION_HEADERS) if args.correlation == "summary"
+                         else (correlation_bins, BIN_HEADERS))
+        site_ids = None if args.all_sites or sites[0][1] is None else [site_id for _, site_id in sites]
+        try:
+            with stats.stage("query"):
+                rows = read(cursor, from_month, to_month, args.outlier_sigma, site_ids)
+        except sqlite3.OperationalError:
+            raise sqlite3.OperationalError("Correlation tables not found. Run migrate_solar_logbook.py.") from None
+        stats.count("rows", len(rows))
+        if not rows:
+            print("ℹ️ No data found.")
+        else:
+            with stats.stage("render"):
+                if not args.format:
+                    print("\t".join(headers))
+                print_rows(rows, headers, args.format, blank_none=True)
+        return
+
+    # Optional: rollups (hour/day/month) instead of minute rows
+    if args.resolution:
+        if args.time or args.interpolate or args.filter_nonzero or args.expected:
+            print("⚠️ --time, --interpolate, --filter-nonzero and --expected are ignored with --resolution")
+        rollups = []
+        try:
+            with stats.stage("query"):
+                for name, site_id in sites:
+                    rows = query_rollups(cursor, args.resolution, args.day, args.from_day, args.to_day,
+                                         args.limit, site_id)
+                    rollups += [[name, *row] for row in rows] if labeled else rows
+        except sqlite3.OperationalError:
+            raise sqlite3.OperationalError(f"Rollup table {RESOLUTIONS[args.resolution][0]} not found or outdated. "
+                                           "Run migrate_solar_logbook.py.") from None
+        stats.count("rows", len(rollups))
+        if not rollups:
+            print("ℹ️ No data found.")
+        else:
+            with stats.stage("render"):
+                print_rows(rollups, ["site"] * labeled + rollup_headers(), args.format, blank_none=True)
+        return
+
+    # Integer time keys (added by migrate_solar_logbook.py)
+    time_keys = has_time_keys(cursor)
+    if not time_keys and (args.day or args.from_day or args.to_day or args.time):
+        print("⚠️ solar_log_v2 has no epoch_minute index, date/time filters scan the whole table. Run migrate_solar_logbook.py.")
+
+    time_window = None
+    if args.time:
+        try:
+            time_window = parse_time_window(args.time)
+        except ValueError:
+            raise ValueError("Invalid --time format. Use --time HH:MM [duration_hours]") from None
+        if args.auto_limit:
+            args.limit = auto_limit(args.time, args.day, args.from_day, args.to_day)
 
-    if args.format:
-        print(tabulate([[r.get(h, "") for h in headers] for r in records], headers=headers, tablefmt="grid"))
+    filters = [(name, build_filter(time_keys, args.day, args.from_day, args.to_day, time_window,
+                                   args.filter_nonzero, missing_columns(cursor), logbook_source(cursor), site_id))
+               for name, site_id in sites]
+    model = None
+    if args.expected:
+        if labeled:
+            raise ValueError("--expected works on one site at a time")
+        from ha_location import read_ha_location_from_storage
+        from solar_utils import expected_power_model
+
+        try:
+            site = site_config(config, sites[0][0])
+        except KeyError as e:
+            raise ValueError(f"--expected: {e.args[0]}") from None
+        model = expected_power_model(site, read_ha_location_from_storage(site_location_path(site)))
+        if model is None:
+            raise ValueError("--expected needs latitude/longitude in the HA location (.storage/core.config)")
+    archive_dir = config.get("paths", "archive_dir", fallback="/config/solar_archive")
+    manifest = None if args.no_archive or not time_keys else load_manifest(archive_dir)
+
+    # Optional: streaming CSV export without row limit
+    if args.export:
+        if labeled:
+            raise ValueError("--export streams one site at a time")
+        name, filt = filters[0]
+        if name != DEFAULT_SITE:
+            # The archive holds the default site only
+            manifest = None
+        if args.export == "-":
+            out = sys.stdout
+        elif args.export.endswith(".gz"):
+            out = gzip.open(args.export, "wt", newline="")
+        else:
+            out = open(args.export, "w", newline="")
+        exported = export_csv(cursor, filt, out, args.interpolate, args.max_gap,
+                              archive_dir, manifest, args.chunk_size, stats, model)
+        stats.count("rows", exported)
+        if out is not sys.stdout:
+            out.close()
+            print(f"✅ Exported {exported} rows to {args.export}")
+        return
+
+    rows = []
+    for name, filt in filters:
+        site_rows = fetch_rows(cursor, filt, args.limit, args.interpolate, args.max_gap,
+                               archive_dir, manifest if name == DEFAULT_SITE else None,
+                               args.chunk_size, stats, model)
+        rows += [[name, *row] for row in site_rows] if labeled else site_rows
+
+    # Output: print or export
+    if rows:
+        with stats.stage("render"):
+            print_rows(rows, ["site"] * labeled + output_headers(model), args.format)
     else:
-        for r in records:
-            print("\t".join(str(r.get(h, "")) for h in headers))
-else:
-    print("ℹ️ No data found.")
+        print("ℹ️ No data found.")
+
+def main(argv=None, connections=None):
+    """
+    Command line entry point. argv defaults to sys.argv[1:]; a long-running
+    caller may pass a connections dict to keep the DB open between runs.
+    """
+    config = load_config()
+    args = build_parser(config).parse_args(argv)
+    cache_path = config.get("query_cache", "path", fallback="").strip()
 
-conn.close()
+    if args.cache_stats or args.clear_cache:
+        if not cache_path:
+            print("ℹ️ Query cache is off ([query_cache] path is empty).")
+            return
+        with connection(cache_path, connections, open_cache) as cache:
+            if args.clear_cache:
+                clear_cache(cache)
+                print(f"✅ Query cache cleared ({cache_path})")
+            else:
+                print_cache_stats(cache_stats(cache), args.format)
+        return
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ Database not found at {args.db_path}")
+        exit(1)
+
+    stats = RunStats("query")
+    params = None if args.no_cache or not cache_path else cache_params(args, config)
+    try:
+        with connection(args.db_path, connections) as conn:
+            if params is None:
+                run_query(conn, args, config, stats)
+            else:
+                cached_query(conn, args, config, stats, params, cache_path, connections)
+    except (ValueError, sqlite3.DatabaseError) as e:
+        print(f"❌ {e}")
+        exit(1)
+    emit_stats(stats, config)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# repair_solar_logbook.py
+# Version       : 1.1.0
+# Last updated  : 2026-10-18
+# Description   : Find days whose sensors cover too little of the high
+#                 noon window (solar_coverage) and re-export only those,
+#                 per site
+# ---------------------------------------------
+
+import sqlite3
+import os
+import argparse
+from datetime import datetime, timedelta
+from config_utils import load_config
+from coverage_utils import COVERAGE_SENSORS, COVERAGE_TABLE, day_coverage, day_runs, deficient_days, expected_minutes
+from db_utils import connection
+from ha_location import read_ha_location_from_storage
+from site_utils import DEFAULT_SITE, DEFAULT_SITE_ID, SITE_COLUMN, logbook_sites, site_config, site_location_path, site_names
+from stats_utils import RunStats, emit_stats
+import export_solar_logbook
+
+
+def expected_windows(days, location, delta_hours, solar_offset):
+    """{day: minutes of its high noon window on that UTC day}"""
+    expected = {}
+    for day in days:
+        start_utc, end_utc = export_solar_logbook.high_noon_window(
+            day, location['time_zone'], delta_hours, solar_offset, location.get('longitude'))
+        expected[day] = expected_minutes(day, start_utc, end_utc)
+    return expected
+
+
+def find_deficient(cursor, from_day, to_day, sensors, min_ratio, location, delta_hours, solar_offset, site_id):
+    first = datetime.strptime(from_day, "%Y-%m-%d").date()
+    last = datetime.strptime(to_day, "%Y-%m-%d").date()
+    days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+    coverage = day_coverage(cursor, from_day, to_day, sensors, site_id)
+    return deficient_days(coverage, expected_windows(days, location, delta_hours, solar_offset), sensors, min_ratio)
+
+
+def configured_sensors(config):
+    return [s.strip() for s in config.get("coverage", "sensors", fallback="timestamp, lux, power1").split(",") if s.strip()]
+
+
+def print_deficient(deficient):
+    for day, low in deficient:
+        print(f"{day}\t" + ", ".join(f"{sensor} {ratio:.0%}" for sensor, ratio in low.items()))
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser(config):
+    parser = argparse.ArgumentParser(description="Re-export the days with incomplete sensor coverage.")
+    parser.add_argument('--from-day', help='First day to check (YYYY-MM-DD). Default: first logbook day')
+    parser.add_argument('--to-day', help='Last day to check (YYYY-MM-DD). Default: yesterday')
+    parser.add_argument('--sensor', action='append', choices=COVERAGE_SENSORS,
+                        help='Logbook column to check, repeatable ("timestamp" = any row). Default from conf [coverage] sensors')
+    parser.add_argument('--min-ratio', type=float,
+                        default=config.getfloat("coverage", "min_ratio", fallback=0.9),
+                        help='Share of the window a sensor must cover (default from conf)')
+    parser.add_argument('--list', action='store_true', help='Only list the incomplete days')
+    parser.add_argument('--max-days', type=int, help='Re-export at most this many days per run')
+    parser.add_argument('--source', choices=export_solar_logbook.SOURCES, default=None,
+                        help='HA data to re-export from (default from conf [ha_db] source)')
+    parser.add_argument('--delta-hours', type=int, default=None,
+                        help='Half-width of window around high noon in hours (default from conf)')
+    parser.add_argument('--solar-offset', nargs='?', const="",
+                        help='Solar correction in hours, as in export_solar_logbook.py')
+    parser.add_argument('--site', default=DEFAULT_SITE,
+                        help=f'[site:NAME] section whose days to check and re-export (default: {DEFAULT_SITE})')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None, connections=None):
+    config = load_config()
+    args = build_parser(config).parse_args(argv)
+    sensors = args.sensor or configured_sensors(config)
+    unknown = [s for s in sensors if s not in COVERAGE_SENSORS]
+    if unknown:
+        print(f"❌ Unknown sensor(s) in [coverage] sensors: {', '.join(unknown)}")
+        exit(1)
+
+    if args.site not in site_names(config):
+        print(f"❌ No [site:{args.site}] section in the config")
+        exit(1)
+    site_cfg = site_config(config, args.site)
+
+    logbook_path = config["paths"]["logbook_db_path"]
+    if not os.path.exists(logbook_path):
+        print(f"❌ Database not found at {logbook_path}")
+        exit(1)
+
+    location = read_ha_location_from_storage(site_location_path(site_cfg))
+    solar_offset = export_solar_logbook.resolve_solar_offset(args.solar_offset, location)
+    delta_hours = args.delta_hours if args.delta_hours is not None else config.getint("time", "delta_hours", fallback=7)
+    to_day = args.to_day or (datetime.now().date() - timedelta(days=1)).isoformat()
+
+    stats = RunStats("repair")
+    with connection(logbook_path, connections) as conn:
+        cursor = conn.cursor()
+        try:
+            site_id = logbook_sites(cursor, [args.site])[0][1]
+            if site_id is None:
+                site_id = DEFAULT_SITE_ID
+        except KeyError:
+            print(f"ℹ️ Site '{args.site}' has no rows in the logbook.")
+            return
+        window = (sensors, args.min_ratio, location, delta_hours, solar_offset, site_id)
+        try:
+            from_day = args.from_day
+            if from_day is None:
+                cursor.execute(f"SELECT MIN(day) FROM {COVERAGE_TABLE} WHERE {SITE_COLUMN} = ?", (site_id,))
+                from_day = cursor.fetchone()[0]
+            if from_day is None:
+                print("ℹ️ Logbook is empty.")
+                return
+            with stats.stage("check"):
+                deficient = find_deficient(cursor, from_day, to_day, *window)
+        except sqlite3.OperationalError:
+            print("❌ Coverage table not found. Run migrate_solar_logbook.py.")
+            exit(1)
+
+    stats.count("deficient", len(deficient))
+    if not deficient:
+        print(f"✅ All days from {from_day} to {to_day} are complete.")
+        emit_stats(stats, config)
+        return
+    print(f"🔎 {len(deficient)} incomplete day(s) from {from_day} to {to_day}:")
+    print_deficient(deficient)
+    if args.list:
+        emit_stats(stats, config)
+        return
+
+    days = [day for day, _ in deficient][:args.max_days]
+    source = args.source or site_cfg.get("ha_db", "source", fallback="states")
+    for first, last in day_runs(days):
+        print(f"🔧 Re-exporting {first}" + (f" to {last}" if last != first else ""))
+        export_solar_logbook.backfill(first, last, config=config, fill=True, delta_hours=delta_hours,
+                                      solar_offset=solar_offset, location=location,
+                                      connections=connections, source=source, stats=stats, site=args.site)
+    stats.count("repaired", len(days))
+
+    # Days the HA DB has no more data for stay incomplete
+    with connection(logbook_path, connections) as conn:
+        remaining = [day for day, _ in find_deficient(conn.cursor(), days[0], days[-1], *window) if day in days]
+    if remaining:
+        print(f"⚠️ {len(remaining)} of {len(days)} day(s) still incomplete (no more data in the HA DB): {', '.join(remaining)}")
+    else:
+        print(f"✅ Repair complete: {len(days)} day(s) re-exported")
+    emit_stats(stats, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# rollup_utils.py
+# Version      : 1.3.0
+# Last updated : 2026-10-18
+# Description  : Hourly/daily/monthly rollups of solar_log_v2,
+#                refreshed for the periods an export touched,
+#                per site
+# ---------------------------------------------
+
+from site_utils import DEFAULT_SITE_ID, SITE_COLUMN, logged_site_ids, partition_table
+
+# Periods are prefixes of the UTC minute timestamp 'YYYY-MM-DD HH:MM'
+RESOLUTIONS = {
+    "hour": ("solar_rollup_hour", 13),
+    "day": ("solar_rollup_day", 10),
+    "month": ("solar_rollup_month", 7),
+}
+
+# Minute columns summarized as sum/count/mean/min/max
+ROLLUP_METRICS = ["lux", "power1", "power2", "power_load", "energy_efactor"]
+
+# Cumulative kWh counters turned into reset-aware energy deltas
+ENERGY_COUNTERS = {"energy1_kwh": "solar_energy_string1", "energy2_kwh": "solar_energy_string2"}
+
+# A counter drop of more than this share of its last reading is a reset;
+# smaller drops are sensor jitter and count as zero
+RESET_DROP_RATIO = 0.1
+
+STAT_SUFFIXES = ["sum", "count", "mean", "min", "max"]
+
+# Minutes a logbook row stands for: 1 for minutes aggregated from HA states,
+# 5 / 60 for rows taken from HA short-term / hourly statistics. Rollups
+# weight rows by it, so 'minutes', sums and means stay comparable.
+RESOLUTION_COLUMN = "source_resolution"
+RESOLUTION_COLUMN_SQL = f"ALTER TABLE solar_log_v2 ADD COLUMN {RESOLUTION_COLUMN} INTEGER DEFAULT 1"
+
+ROLLUP_COLUMNS = (
+    ["period", "minutes"]
+    + [f"{m}_{s}" for m in ROLLUP_METRICS for s in STAT_SUFFIXES]
+    + list(ENERGY_COUNTERS)
+)
+
+
+def _create_rollup_table(cursor, table):
+    columns = ", ".join(f"{c} REAL" for c in ROLLUP_COLUMNS[2:])
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {SITE_COLUMN} INTEGER NOT NULL DEFAULT {DEFAULT_SITE_ID},
+            period TEXT,
+            minutes INTEGER,
+            {columns},
+            PRIMARY KEY ({SITE_COLUMN}, period)
+        )
+    """)
+
+
+def ensure_rollup_tables(cursor):
+    """
+    Create the rollup tables, key tables from before sites existed by
+    site and add metric columns that older tables lack
+    """
+    for table, _ in RESOLUTIONS.values():
+        partition_table(cursor, table, lambda c, table=table: _create_rollup_table(c, table))
+        _create_rollup_table(cursor, table)
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for column in ROLLUP_COLUMNS[2:]:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+
+
+def _energy_deltas(cursor, column, first, last, site_id=DEFAULT_SITE_ID):
+    """
+    Sum per hour of the increments of a cumulative counter between
+    first and last (inclusive minute timestamps) of one site.
+
+    A drop of more than RESET_DROP_RATIO is treated as a reset: the new
+    reading counts as energy produced since the reset.
+    """
+    cursor.execute(f"""
+        SELECT {column} FROM solar_log_v2
+        WHERE {SITE_COLUMN} = ? AND timestamp < ? AND {column} IS NOT NULL
+        ORDER BY timestamp DESC LIMIT 1
+    """, (site_id, first))
+    result = cursor.fetchone()
+    prev = result[0] if result else None
+
+    cursor.execute(f"""
+        SELECT timestamp, {column} FROM solar_log_v2
+        WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ? AND {column} IS NOT NULL
+        ORDER BY timestamp
+    """, (site_id, first, last))
+
+    deltas = {}
+    for timestamp, value in cursor.fetchall():
+        hour = timestamp[:13]
+        if prev is None:
+            delta = 0.0
+        elif value >= prev:
+            delta = value - prev
+        elif value < prev * (1 - RESET_DROP_RATIO):
+            delta = value
+        else:
+            delta = 0.0
+        deltas[hour] = deltas.get(hour, 0.0) + delta
+        prev = value
+    return deltas
+
+
+def _upsert(cursor, table, site_id, records):
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO {table} ({SITE_COLUMN}, {', '.join(ROLLUP_COLUMNS)}) "
+        f"VALUES ({', '.join(['?'] * (len(ROLLUP_COLUMNS) + 1))})",
+        [(site_id, *record) for record in records]
+    )
+
+
+def refresh_rollups(cursor, first, last, site_id=DEFAULT_SITE_ID):
+    """
+    Recompute the hour, day and month rollups of a site overlapping the
+    minute timestamps first..last (inclusive) from solar_log_v2. Does
+    not commit.
+    """
+    ensure_rollup_tables(cursor)
+
+    # Hours: aggregate the raw rows of every touched hour, each weighted
+    # by the minutes it stands for (sum and count are minute-weighted)
+    hour_first, hour_last = first[:13], last[:13] + ":59"
+    w = f"COALESCE({RESOLUTION_COLUMN}, 1)"
+    stats = ", ".join(
+        f"SUM({m} * {w}), SUM(({m} IS NOT NULL) * {w}), "
+        f"SUM({m} * {w}) / NULLIF(SUM(({m} IS NOT NULL) * {w}), 0), MIN({m}), MAX({m})"
+        for m in ROLLUP_METRICS
+    )
+    cursor.execute(f"""
+        SELECT substr(timestamp, 1, 13) AS period, SUM({w}), {stats}
+        FROM solar_log_v2
+        WHERE {SITE_COLUMN} = ? AND timestamp BETWEEN ? AND ?
+        GROUP BY period
+    """, (site_id, hour_first, hour_last))
+    hours = cursor.fetchall()
+    energy = {name: _energy_deltas(cursor, column, hour_first, hour_last, site_id)
+              for name, column in ENERGY_COUNTERS.items()}
+    _upsert(cursor, "solar_rollup_hour", site_id, [
+        (*row, *(energy[name].get(row[0]) for name in ENERGY_COUNTERS)) for row in hours
+    ])
+
+    # Days from hours, months from days
+    for source, target, width in (("hour", "day", 10), ("day", "month", 7)):
+        source_table = RESOLUTIONS[source][0]
+        stats = ", ".join(
+            f"SUM({m}_sum), SUM({m}_count), SUM({m}_sum) / NULLIF(SUM({m}_count), 0), "
+            f"MIN({m}_min), MAX({m}_max)" for m in ROLLUP_METRICS
+        )
+        energy_sums = ", ".join(f"SUM({name})" for name in ENERGY_COUNTERS)
+        cursor.execute(f"""
+            SELECT substr(period, 1, {width}) AS p, SUM(minutes), {stats}, {energy_sums}
+            FROM {source_table}
+            WHERE {SITE_COLUMN} = ? AND period BETWEEN ? AND ?
+            GROUP BY p
+        """, (site_id, first[:width], last[:width] + "~"))
+        _upsert(cursor, RESOLUTIONS[target][0], site_id, cursor.fetchall())
+
+
+def rebuild_rollups(cursor):
+    """Recompute all rollups of every site from the full solar_log_v2 table"""
+    ensure_rollup_tables(cursor)
+    for site_id in logged_site_ids(cursor):
+        cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM solar_log_v2 WHERE {SITE_COLUMN} = ?", (site_id,))
+        first, last = cursor.fetchone()
+        if first is not None:
+            refresh_rollups(cursor, first, last, site_id)
+    cursor.execute("SELECT COUNT(*) FROM solar_rollup_hour")
+    return cursor.fetchone()[0]
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# site_utils.py
+# Version      : 1.0.1
+# Last updated : 2026-10-18
+# Description  : Several installations in one logbook: [site:NAME]
+#                sections of solar_logbook.conf, the solar_site
+#                registry and the site_id key of solar_log_v2
+# ---------------------------------------------
+
+import os
+from configparser import ConfigParser
+
+SITE_TABLE = "solar_site"
+SITE_COLUMN = "site_id"
+SITE_COLUMN_SQL = f"ALTER TABLE solar_log_v2 ADD COLUMN {SITE_COLUMN} INTEGER NOT NULL DEFAULT 0"
+
+# Unique key of a partitioned logbook, used by the exporter's upserts
+SITE_INDEX = "ix_solar_log_v2_site_timestamp"
+SITE_INDEX_SQL = f"CREATE UNIQUE INDEX IF NOT EXISTS {SITE_INDEX} ON solar_log_v2 ({SITE_COLUMN}, timestamp)"
+
+# Date range filters of one site's minutes; replaces the epoch_minute
+# index of a logbook from before sites existed
+SITE_TIME_INDEX = "ix_solar_log_v2_site_epoch_minute"
+SITE_TIME_INDEX_SQL = f"CREATE INDEX IF NOT EXISTS {SITE_TIME_INDEX} ON solar_log_v2 ({SITE_COLUMN}, epoch_minute)"
+TIME_INDEX = "ix_solar_log_v2_epoch_minute"
+
+# The installation configured by the plain sections ([paths] ha_db_path,
+# [system], [ha_sensors]); rows logged before sites existed belong to it
+DEFAULT_SITE = "default"
+DEFAULT_SITE_ID = 0
+
+SITE_SECTION_PREFIX = "site:"
+
+# [site:NAME] keys besides the [system] and [ha_sensors] ones
+SITE_PATH_KEYS = ["ha_db_path", "output_dir", "ha_location_path"]
+
+
+# ---------------------------------------------
+# Config
+# ---------------------------------------------
+def site_names(config):
+    """DEFAULT_SITE and the NAME of every [site:NAME] section, in conf order"""
+    return [DEFAULT_SITE] + [s[len(SITE_SECTION_PREFIX):] for s in config.sections()
+                             if s.startswith(SITE_SECTION_PREFIX)]
+
+
+def site_config(config, name):
+    """
+    The config as one site sees it: a copy with the keys of its
+    [site:NAME] section put into [paths], [system] or [ha_sensors].
+    CSV files of a site go to [paths] output_dir/NAME and its HA location
+    is read from .storage/core.config next to its ha_db_path unless the
+    section sets output_dir / ha_location_path. Raises KeyError for an
+    unknown site, ValueError for a key that belongs to none of these
+    sections.
+    """
+    if name == DEFAULT_SITE:
+        return config
+    section = SITE_SECTION_PREFIX + name
+    if not config.has_section(section):
+        raise KeyError(f"no [{section}] section in the config")
+
+    site = ConfigParser()
+    site.read_dict({s: dict(config.items(s, raw=True)) for s in config.sections()})
+    site.set("paths", "output_dir", os.path.join(config.get("paths", "output_dir", fallback="/share/data"), name))
+    if config.has_option(section, "ha_db_path"):
+        site.set("paths", "ha_location_path",
+                 os.path.join(os.path.dirname(config.get(section, "ha_db_path")), ".storage", "core.config"))
+    for key, value in config.items(section, raw=True):
+        if key in SITE_PATH_KEYS:
+            site.set("paths", key, value)
+        elif config.has_option("system", key):
+            site.set("system", key, value)
+        elif config.has_option("ha_sensors", key):
+            site.set("ha_sensors", key, value)
+        else:
+            raise ValueError(f"unknown key '{key}' in [{section}]")
+    return site
+
+
+def site_location_path(config):
+    """HA .storage/core.config of the site whose site_config() this is"""
+    return config.get("paths", "ha_location_path", fallback="/config/.storage/core.config")
+
+
+# ---------------------------------------------
+# Logbook
+# ---------------------------------------------
+def ensure_site_table(cursor):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {SITE_TABLE} (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+    cursor.execute(f"INSERT OR IGNORE INTO {SITE_TABLE} (id, name) VALUES (?, ?)", (DEFAULT_SITE_ID, DEFAULT_SITE))
+
+
+def site_id(cursor, name):
+    """Id of the site name, registered on first use. Does not commit."""
+    if name == DEFAULT_SITE:
+        return DEFAULT_SITE_ID
+    ensure_site_table(cursor)
+    cursor.execute(f"INSERT OR IGNORE INTO {SITE_TABLE} (name) VALUES (?)", (name,))
+    cursor.execute(f"SELECT id FROM {SITE_TABLE} WHERE name = ?", (name,))
+    return cursor.fetchone()[0]
+
+
+def _has_site_table(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SITE_TABLE,))
+    return cursor.fetchone() is not None
+
+
+def find_site_id(cursor, name):
+    """Id of a registered site or None (also when no site is registered yet)"""
+    if name == DEFAULT_SITE:
+        return DEFAULT_SITE_ID
+    if not _has_site_table(cursor):
+        return None
+    cursor.execute(f"SELECT id FROM {SITE_TABLE} WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def logged_site_ids(cursor):
+    """Site ids with rows in solar_log_v2 (DEFAULT_SITE_ID before sites existed)"""
+    if not has_site_column(cursor):
+        return [DEFAULT_SITE_ID]
+    # Skip-scan over the (site_id, timestamp) index
+    ids = []
+    cursor.execute(f"SELECT MIN({SITE_COLUMN}) FROM solar_log_v2")
+    current = cursor.fetchone()[0]
+    while current is not None:
+        ids.append(current)
+        cursor.execute(f"SELECT MIN({SITE_COLUMN}) FROM solar_log_v2 WHERE {SITE_COLUMN} > ?", (current,))
+        current = cursor.fetchone()[0]
+    return ids
+
+
+def logbook_sites(cursor, names=None):
+    """
+    [(name, site_id)] of the named sites, default every site with rows.
+    site_id is None for the default site of a logbook from before sites
+    existed (nothing to filter). Raises KeyError for a name the logbook
+    does not know.
+    """
+    if not has_site_column(cursor):
+        unknown = [name for name in names or [] if name != DEFAULT_SITE]
+        if unknown:
+            raise KeyError(unknown[0])
+        return [(DEFAULT_SITE, None)]
+    if names is None:
+        registered = {DEFAULT_SITE_ID: DEFAULT_SITE}
+        if _has_site_table(cursor):
+            registered.update((i, name) for i, name in cursor.execute(f"SELECT id, name FROM {SITE_TABLE}"))
+        return [(registered.get(i, str(i)), i) for i in logged_site_ids(cursor)]
+    sites = []
+    for name in names:
+        found = find_site_id(cursor, name)
+        if found is None:
+            raise KeyError(name)
+        sites.append((name, found))
+    return sites
+
+
+def has_site_column(cursor, table="solar_log_v2"):
+    cursor.execute(f"PRAGMA table_xinfo({table})")
+    return SITE_COLUMN in {row[1] for row in cursor.fetchall()}
+
+
+def ensure_site_time_index(cursor):
+    """
+    The site-leading time index in place of TIME_INDEX, once solar_log_v2
+    has the site_id column and the epoch_minute time key. Does not commit.
+    """
+    cursor.execute("PRAGMA table_xinfo(solar_log_v2)")
+    if {SITE_COLUMN, "epoch_minute"} <= {row[1] for row in cursor.fetchall()}:
+        cursor.execute(SITE_TIME_INDEX_SQL)
+        cursor.execute(f"DROP INDEX IF EXISTS {TIME_INDEX}")
+
+
+def ensure_site_column(cursor, unique=True):
+    """
+    Give solar_log_v2 the site_id column, the site-leading time index
+    and (with unique) its unique key, which fails with
+    sqlite3.IntegrityError while duplicates remain; True if the column
+    was added. Does not commit.
+    """
+    added = not has_site_column(cursor)
+    if added:
+        cursor.execute(SITE_COLUMN_SQL)
+    # Before the unique key: a logbook with duplicates keeps a time index
+    ensure_site_time_index(cursor)
+    if unique:
+        cursor.execute(SITE_INDEX_SQL)
+    return added
+
+
+def is_partitioned(cursor):
+    """
+    True if solar_log_v2 can hold the same minute for several sites,
+    i.e. no key on timestamp alone is left from before sites existed
+    """
+    if not has_site_column(cursor):
+        return False
+    cursor.execute("PRAGMA index_list(solar_log_v2)")
+    for _, name, unique, *_ in cursor.fetchall():
+        if unique:
+            cursor.execute(f"PRAGMA index_info({name})")
+            if [row[2] for row in cursor.fetchall()] == ["timestamp"]:
+                return False
+    return True
+
+
+def partition_table(cursor, table, create):
+    """
+    Re-create a table from before sites existed with a leading site_id
+    key: create(cursor) makes the new layout, the rows are copied as
+    DEFAULT_SITE_ID. No-op for a missing or already partitioned table;
+    True if converted. Does not commit.
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = [row[1] for row in cursor.fetchall()]
+    if not columns or SITE_COLUMN in columns:
+        return False
+    old = f"{table}_unpartitioned"
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    create(cursor)
+    cursor.execute(f"""
+        INSERT INTO {table} ({SITE_COLUMN}, {', '.join(columns)})
+        SELECT {DEFAULT_SITE_ID}, {', '.join(columns)} FROM {old}
+    """)
+    cursor.execute(f"DROP TABLE {old}")
+    return True
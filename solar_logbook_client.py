@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# solar_logbook_client.py
+# Version       : 1.2.0
+# Last updated  : 2026-10-18
+# Description   : Thin client for solar_logbook_service.py;
+#                 runs the script directly if the service is down
+# ---------------------------------------------
+#
+# Usage: solar_logbook_client.py export|query|archive|maintain|repair [script args...]
+
+import json
+import os
+import socket
+import sys
+from configparser import ConfigParser
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    "export": "export_solar_logbook.py",
+    "query": "query_solar_logbook.py",
+    "archive": "archive_solar_logbook.py",
+    "maintain": "maintain_solar_logbook.py",
+    "repair": "repair_solar_logbook.py",
+}
+
+if len(sys.argv) < 2 or sys.argv[1] not in SCRIPTS:
+    print(f"Usage: {os.path.basename(sys.argv[0])} {'|'.join(SCRIPTS)} [args...]", file=sys.stderr)
+    sys.exit(2)
+
+command, argv = sys.argv[1], sys.argv[2:]
+
+config = ConfigParser()
+config.read(os.path.join(BASE_DIR, "solar_logbook.conf"))
+socket_path = os.environ.get(
+    "SOLAR_LOGBOOK_SOCKET",
+    config.get("service", "socket_path", fallback="/config/solar_logbook.sock")
+)
+
+try:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps({"command": command, "args": argv}) + "\n").encode("utf-8"))
+        response = json.loads(sock.makefile("rb").readline())
+except (FileNotFoundError, ConnectionRefusedError):
+    # No service running: behave exactly like the plain script
+    script = os.path.join(BASE_DIR, SCRIPTS[command])
+    os.execv(sys.executable, [sys.executable, script, *argv])
+
+sys.stdout.write(response["output"])
+sys.exit(response["exit_code"])
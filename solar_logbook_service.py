@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# solar_logbook_service.py
+# Version       : 1.3.1
+# Last updated  : 2026-10-18
+# Description   : Long-running logbook service: scheduled incremental
+#                 exports and export/query requests over a Unix socket
+# ---------------------------------------------
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+from config_utils import load_config
+from db_utils import close_connections
+import archive_solar_logbook
+import export_solar_logbook
+import maintain_solar_logbook
+import query_solar_logbook
+import repair_solar_logbook
+
+# ---------------------------------------------
+# Load config
+# ---------------------------------------------
+config = load_config()
+
+COMMANDS = {
+    "export": export_solar_logbook,
+    "query": query_solar_logbook,
+    "archive": archive_solar_logbook,
+    "maintain": maintain_solar_logbook,
+    "repair": repair_solar_logbook,
+}
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+parser = argparse.ArgumentParser(description="Run the solar logbook tools as a persistent service.")
+parser.add_argument(
+    '--socket',
+    default=config.get("service", "socket_path", fallback="/config/solar_logbook.sock"),
+    help='Unix socket to listen on'
+)
+parser.add_argument(
+    '--interval',
+    type=int,
+    default=config.getint("service", "export_interval_minutes", fallback=0),
+    help='Minutes between scheduled incremental exports (0 = no schedule)'
+)
+parser.add_argument(
+    '--export-args',
+    default=config.get("service", "export_args", fallback="--incremental"),
+    help='Arguments for the scheduled export, e.g. --export-args="--incremental" (the current --day is added)'
+)
+
+# SQLite connections kept open between runs; the commands share them
+# and redirect stdout, so one run at a time
+connections = {}
+run_lock = threading.Lock()
+
+# Config, HA location and the entity map are cached inside the modules,
+# numpy is loaded on the first run that needs it and then stays warm
+def run_command(command, argv):
+    """
+    Call a logbook command's main() in this process, as if started from
+    the shell.
+
+    Returns:
+        (exit_code, captured stdout + stderr)
+    """
+    output = io.StringIO()
+    exit_code = 0
+    module = COMMANDS[command]
+    with run_lock:
+        # argparse takes the program name for usage messages from argv[0]
+        saved_argv = sys.argv
+        sys.argv = [module.__file__]
+        try:
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                module.main(argv, connections=connections)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if isinstance(e.code, str):
+                output.write(e.code + "\n")
+        except Exception as e:
+            exit_code = 1
+            output.write(f"❌ {type(e).__name__}: {e}\n")
+        finally:
+            sys.argv = saved_argv
+    return exit_code, output.getvalue()
+
+# ---------------------------------------------
+# Socket protocol: one JSON line in, one JSON line out
+#   {"command": "query", "args": ["--day", "2025-08-30"]}
+#   {"exit_code": 0, "output": "...", "seconds": 0.12}
+# ---------------------------------------------
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        started = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request["command"]
+            argv = [str(a) for a in request.get("args", [])]
+            if command not in COMMANDS:
+                raise ValueError(f"unknown command '{command}'")
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"exit_code": 2, "output": f"❌ Invalid request: {e}\n"}
+        else:
+            exit_code, output = run_command(command, argv)
+            response = {"exit_code": exit_code, "output": output}
+        response["seconds"] = round(time.perf_counter() - started, 3)
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def schedule_exports(interval, export_args):
+    """Run the incremental export every interval minutes, on the minute grid"""
+    while True:
+        time.sleep(interval * 60 - time.time() % (interval * 60))
+        argv = ["--day", datetime.now().date().isoformat(), *export_args.split()]
+        exit_code, output = run_command("export", argv)
+        lines = output.strip().splitlines()
+        # sys.__stdout__: a request thread may be redirecting sys.stdout right now
+        print(f"{datetime.now().isoformat(timespec='seconds')} export exit={exit_code}: {lines[-1] if lines else ''}",
+              file=sys.__stdout__, flush=True)
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    if args.interval > 0:
+        threading.Thread(target=schedule_exports, args=(args.interval, args.export_args), daemon=True).start()
+
+    with ThreadingUnixServer(args.socket, RequestHandler) as server:
+        os.chmod(args.socket, 0o660)
+        schedule = f"export every {args.interval} min" if args.interval > 0 else "exports scheduled by HA"
+        print(f"🔌 Solar logbook service listening on {args.socket} ({schedule})", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(args.socket)
+            close_connections(connections)
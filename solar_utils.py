@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# solar_utils.py
+# Version      : 1.0.0
+# Last updated : 2026-10-18
+# Description  : Solar position (NOAA formulas with equation of time),
+#                true solar noon and clear-sky plane-of-array
+#                irradiance, cached per site as a day-of-year x
+#                minute-of-day table for expected power
+# ---------------------------------------------
+
+import math
+import os
+from datetime import datetime, timezone
+import numpy as np
+
+# Rows of the lookup table: one per day of a leap year. Other years use
+# the row of their own day of year (declination is off by at most one
+# day, < 0.4 degrees).
+TABLE_DAYS = 366
+MINUTES_PER_DAY = 1440
+TABLE_VERSION = 1
+
+SOLAR_CONSTANT = 1353   # W/m², as in Meinel's clear-sky model
+ALBEDO = 0.2
+DEFAULT_DERATE = 0.85   # inverter, wiring, soiling and temperature losses
+
+# Expected power below this share of the string's Wp gives no ratio
+MIN_RATIO_SHARE = 0.02
+
+EXPECTED_HEADERS = ["expected_power1", "expected_power2", "performance_ratio"]
+
+
+# ---------------------------------------------
+# Solar geometry
+# ---------------------------------------------
+def _fractional_year(day_of_year, utc_minutes):
+    return 2 * np.pi / 365 * (day_of_year - 1 + (utc_minutes / 60 - 12) / 24)
+
+
+def equation_of_time(day_of_year, utc_minutes=720):
+    """Equation of time in minutes (NOAA), scalar or array"""
+    g = _fractional_year(day_of_year, utc_minutes)
+    return 229.18 * (0.000075 + 0.001868 * np.cos(g) - 0.032077 * np.sin(g)
+                     - 0.014615 * np.cos(2 * g) - 0.040849 * np.sin(2 * g))
+
+
+def declination(day_of_year, utc_minutes=720):
+    """Solar declination in radians (NOAA), scalar or array"""
+    g = _fractional_year(day_of_year, utc_minutes)
+    return (0.006918 - 0.399912 * np.cos(g) + 0.070257 * np.sin(g)
+            - 0.006758 * np.cos(2 * g) + 0.000907 * np.sin(2 * g)
+            - 0.002697 * np.cos(3 * g) + 0.00148 * np.sin(3 * g))
+
+
+def solar_noon_utc(day, longitude):
+    """
+    True solar noon of a YYYY-MM-DD day at longitude (degrees east) as
+    UTC epoch seconds: 12:00 UTC shifted by 4 minutes per degree and
+    the equation of time
+    """
+    day_dt = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    noon = 720 - 4 * longitude
+    # second pass: the equation of time at (not before) solar noon
+    for _ in range(2):
+        noon = 720 - 4 * longitude - float(equation_of_time(day_dt.timetuple().tm_yday, noon))
+    return day_dt.timestamp() + noon * 60
+
+
+def solar_position(day_of_year, utc_minutes, latitude, longitude):
+    """
+    Vectorized solar position for arrays of day of year and UTC minute
+    of day. Returns (cos_zenith, azimuth): azimuth in radians clockwise
+    from north (pi = south).
+    """
+    eot = equation_of_time(day_of_year, utc_minutes)
+    decl = declination(day_of_year, utc_minutes)
+    true_solar_minutes = utc_minutes + eot + 4 * longitude
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    lat = math.radians(latitude)
+
+    cos_zenith = np.clip(math.sin(lat) * np.sin(decl) + math.cos(lat) * np.cos(decl) * np.cos(hour_angle), -1, 1)
+    azimuth = np.arctan2(np.sin(hour_angle), np.cos(hour_angle) * math.sin(lat) - np.tan(decl) * math.cos(lat)) + np.pi
+    return cos_zenith, azimuth
+
+
+def clear_sky_poa(day_of_year, utc_minutes, latitude, longitude, azimuth, tilt):
+    """
+    Clear-sky plane-of-array irradiance (W/m²) of a surface facing
+    azimuth (degrees from north, 180 = south) at tilt degrees: Meinel
+    beam irradiance with Kasten-Young air mass, 10 % diffuse (isotropic
+    sky) and ground reflection
+    """
+    cos_z, sun_az = solar_position(day_of_year, utc_minutes, latitude, longitude)
+    up = cos_z > 0.01
+    zenith_deg = np.degrees(np.arccos(np.where(up, cos_z, 1)))
+    air_mass = 1 / (np.where(up, cos_z, 1) + 0.50572 * (96.07995 - zenith_deg) ** -1.6364)
+    eccentricity = 1 + 0.033 * np.cos(2 * np.pi * day_of_year / 365)
+    dni = np.where(up, SOLAR_CONSTANT * eccentricity * 0.7 ** (air_mass ** 0.678), 0.0)
+    dhi = 0.1 * dni
+    ghi = dni * np.maximum(cos_z, 0) + dhi
+
+    beta = math.radians(tilt)
+    sin_z = np.sqrt(1 - cos_z ** 2)
+    cos_aoi = cos_z * math.cos(beta) + sin_z * math.sin(beta) * np.cos(sun_az - math.radians(azimuth))
+    return (dni * np.maximum(cos_aoi, 0) + dhi * (1 + math.cos(beta)) / 2
+            + ghi * ALBEDO * (1 - math.cos(beta)) / 2)
+
+
+# ---------------------------------------------
+# Per-site lookup table
+# ---------------------------------------------
+# (latitude, longitude, azimuth, tilt) -> float32 table [day of year - 1, UTC minute of day]
+_tables = {}
+
+
+def _table_path(cache_dir, key):
+    name = "clearsky_v{}_{:.4f}_{:.4f}_{:g}_{:g}.npy".format(TABLE_VERSION, *key)
+    return os.path.join(cache_dir, name)
+
+
+def poa_table(latitude, longitude, azimuth, tilt, cache_dir=None):
+    """
+    Clear-sky POA for every day of year and UTC minute of day of one
+    site and orientation, computed once over the whole year and kept in
+    memory and (with cache_dir) as a memory-mapped .npy file
+    """
+    key = (round(latitude, 4), round(longitude, 4), float(azimuth), float(tilt))
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    path = _table_path(cache_dir, key) if cache_dir else None
+    if path and os.path.exists(path):
+        table = np.load(path, mmap_mode="r")
+    else:
+        day_of_year = np.arange(1, TABLE_DAYS + 1, dtype=np.float64)[:, None]
+        minutes = np.arange(MINUTES_PER_DAY, dtype=np.float64)[None, :]
+        table = clear_sky_poa(day_of_year, minutes, *key).astype(np.float32)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp.npy"
+            np.save(tmp_path, table)
+            os.replace(tmp_path, path)
+    _tables[key] = table
+    return table
+
+
+def day_of_year_index(epoch_minutes):
+    """0-based day of year of epoch minutes (UTC), for the table rows"""
+    days = (epoch_minutes // MINUTES_PER_DAY).astype("datetime64[D]")
+    return (days - days.astype("datetime64[Y]").astype("datetime64[D]")).astype(np.int64)
+
+
+class ExpectedPower:
+    """
+    Clear-sky expected power of the configured strings at epoch minutes,
+    and the performance ratio of measured power1/power2 against it
+    """
+
+    def __init__(self, latitude, longitude, strings, derate=DEFAULT_DERATE, cache_dir=None):
+        # strings: [(Wp, azimuth, tilt)] for string 1 and 2
+        self.strings = [(wp or 0, 180 if azimuth is None else azimuth, tilt or 0) for wp, azimuth, tilt in strings]
+        self.derate = derate
+        self.tables = [poa_table(latitude, longitude, azimuth, tilt, cache_dir) if wp else None
+                       for wp, azimuth, tilt in self.strings]
+
+    def power(self, epoch_minutes):
+        """Expected W per string as float64 arrays"""
+        epoch_minutes = np.asarray(epoch_minutes, dtype=np.int64)
+        rows = day_of_year_index(epoch_minutes)
+        cols = epoch_minutes % MINUTES_PER_DAY
+        result = []
+        for (wp, _, _), table in zip(self.strings, self.tables):
+            if table is None:
+                result.append(np.zeros(len(epoch_minutes)))
+            else:
+                result.append(table[rows, cols].astype(np.float64) * wp / 1000 * self.derate)
+        return result
+
+    def columns(self, columns):
+        """
+        EXPECTED_HEADERS columns for a column dict with timestamp (epoch
+        minutes), power1 and power2; the ratio is NaN when the expected
+        power is below MIN_RATIO_SHARE of the installed Wp
+        """
+        expected = self.power(columns["timestamp"])
+        measured = [columns["power1"], columns["power2"]]
+        total_wp = sum(wp for wp, _, _ in self.strings)
+        used = [i for i, (wp, _, _) in enumerate(self.strings) if wp]
+
+        expected_total = sum((expected[i] for i in used), np.zeros(len(columns["timestamp"])))
+        measured_stack = np.array([measured[i] for i in used]) if used else np.full((1, len(expected_total)), np.nan)
+        has_value = ~np.isnan(measured_stack).all(axis=0)
+        measured_total = np.nansum(measured_stack, axis=0)
+
+        ratio = np.full(len(expected_total), np.nan)
+        valid = has_value & (expected_total >= MIN_RATIO_SHARE * total_wp) & (total_wp > 0)
+        ratio[valid] = np.round(measured_total[valid] / expected_total[valid], 3)
+        return {
+            "expected_power1": np.round(expected[0], 1),
+            "expected_power2": np.round(expected[1], 1),
+            "performance_ratio": ratio,
+        }
+
+
+def expected_power_model(config, location, system=None):
+    """
+    ExpectedPower for the strings in system (the exporter's system
+    values, default [system]) at the HA location, or None without one
+    """
+    if not location or location.get("latitude") is None or location.get("longitude") is None:
+        return None
+
+    def number(key):
+        if system is not None and system.get(key) is not None:
+            return float(system[key])
+        value = config.get("system", key, fallback=None)
+        return float(value) if value else None
+
+    strings = [(number(f"modules{i}"), number(f"azimuth{i}"), number(f"tilt{i}")) for i in (1, 2)]
+    derate = number("derate") or DEFAULT_DERATE
+    cache_dir = config.get("paths", "model_cache_dir", fallback=None)
+    return ExpectedPower(location["latitude"], location["longitude"], strings, derate, cache_dir)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# startup_budget.py
+# Version       : 1.0.1
+# Last updated  : 2026-10-18
+# Description   : Measure the startup time of the command line entry
+#                 points and check it against a budget
+# ---------------------------------------------
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Heavy modules a run must not load unless its options need them
+HEAVY_MODULES = {"numpy", "tabulate", "pytz"}
+
+
+def median_ms(cmd, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=BASE_DIR)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def imported_modules(cmd):
+    """Top-level package names imported by cmd, from -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *cmd[1:]],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, cwd=BASE_DIR)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+
+# ---------------------------------------------
+# Argument parser
+# ---------------------------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Check CLI startup time against a budget.")
+    parser.add_argument('--budget-ms', type=float, default=80,
+                        help='Allowed time above a bare interpreter start, per run (default: 80)')
+    parser.add_argument('--runs', type=int, default=15, help='Runs per command; the median counts (default: 15)')
+    parser.add_argument('--day', default=datetime.now().date().isoformat(),
+                        help='Day for the plain --day query (default: today)')
+    return parser
+
+
+# ---------------------------------------------
+# Main
+# ---------------------------------------------
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    commands = {
+        "query --day": ["query_solar_logbook.py", "--day", args.day, "--limit", "10"],
+        "query --help": ["query_solar_logbook.py", "--help"],
+        "export --help": ["export_solar_logbook.py", "--help"],
+        "archive --list": ["archive_solar_logbook.py", "--list"],
+    }
+
+    baseline = median_ms([sys.executable, "-c", "pass"], args.runs)
+    print(f"ℹ️ Bare interpreter: {baseline:.0f} ms, budget: +{args.budget_ms:.0f} ms")
+
+    failed = 0
+    for name, script_args in commands.items():
+        cmd = [sys.executable, *script_args]
+        overhead = median_ms(cmd, args.runs) - baseline
+        heavy = sorted(HEAVY_MODULES & imported_modules(cmd))
+        ok = overhead <= args.budget_ms and not heavy
+        failed += not ok
+        note = f", loads {', '.join(heavy)}" if heavy else ""
+        print(f"{'✅' if ok else '❌'} {name:<15} +{overhead:.0f} ms{note}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
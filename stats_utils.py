@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# stats_utils.py
+# Version      : 1.0.0
+# Last updated : 2026-10-18
+# Description  : Per-stage timings and counters of export/query runs,
+#                emitted as JSON lines and a stats file for HA sensors
+# ---------------------------------------------
+
+import contextlib
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+LOGGER_NAME = "solar_logbook.stats"
+
+# stats_log is rotated at this size, keeping one old file
+STATS_LOG_MAX_BYTES = 1024 * 1024
+
+
+class RunStats:
+    """
+    Stage timings (ms) and counters of one run. stage() times a block,
+    add() books time measured elsewhere, count() adds to a counter.
+    """
+
+    def __init__(self, command=None):
+        self.command = command
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self):
+        """The run as one JSON-serialisable dict"""
+        return {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "command": self.command,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+# (log_level, stats_log) the logger is set up for
+_configured = None
+
+
+def stats_logger(config):
+    """
+    The stats logger, set up from [logging]: log_level gates it (INFO
+    emits the JSON lines, DEBUG also prints them and one line per stage
+    to stderr, WARNING or above turns stats off); stats_log is the
+    JSON lines file
+    """
+    global _configured
+    level_name = config.get("logging", "log_level", fallback="INFO").strip().upper()
+    stats_log = config.get("logging", "stats_log", fallback="").strip() or None
+    logger = logging.getLogger(LOGGER_NAME)
+    if _configured == (level_name, stats_log):
+        return logger
+
+    level = logging.getLevelName(level_name)
+    if not isinstance(level, int):
+        print(f"⚠️ Unknown log_level '{level_name}' in [logging], fallback to INFO")
+        level = logging.INFO
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.setLevel(level)
+    logger.propagate = False
+
+    if stats_log:
+        try:
+            handler = logging.handlers.RotatingFileHandler(stats_log, maxBytes=STATS_LOG_MAX_BYTES,
+                                                           backupCount=1, encoding="utf-8")
+        except OSError as e:
+            print(f"⚠️ Cannot open stats_log {stats_log}: {e}")
+        else:
+            handler.setLevel(logging.INFO)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+    if level <= logging.DEBUG:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+
+    _configured = (level_name, stats_log)
+    return logger
+
+
+def write_stats_file(path, record):
+    """
+    Keep the latest record per command in the JSON file at path,
+    replaced atomically so a sensor never reads half a file
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            latest = json.load(f)
+    except (OSError, ValueError):
+        latest = {}
+    latest[record["command"]] = record
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(latest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def emit_stats(stats, config):
+    """Emit a finished run to stats_log / stats_file if log_level allows"""
+    logger = stats_logger(config)
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    record = stats.record()
+    for name, ms in record["stages_ms"].items():
+        logger.debug(f"⏱️ {stats.command} {name}: {ms} ms")
+    logger.info(json.dumps(record))
+
+    stats_file = config.get("logging", "stats_file", fallback="").strip()
+    if stats_file:
+        try:
+            write_stats_file(stats_file, record)
+        except OSError as e:
+            print(f"⚠️ Cannot write stats_file {stats_file}: {e}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# ---------------------------------------------
+# system_config_utils.py
+# Version      : 1.1.0
+# Last updated : 2026-10-18
+# Description  : [system] values stored once per validity interval in
+#                system_config and referenced from solar_log_v2 by
+#                config_id; readers join them back in
+# ---------------------------------------------
+
+# Static system columns, one value per configuration
+SYSTEM_COLUMNS = [
+    "modules1", "azimuth1", "tilt1",
+    "modules2", "azimuth2", "tilt2",
+    "batteries", "battery_cap"
+]
+
+SYSTEM_CONFIG_TABLE = "system_config"
+CONFIG_ID_COLUMN = "config_id"
+CONFIG_ID_COLUMN_SQL = f"ALTER TABLE solar_log_v2 ADD COLUMN {CONFIG_ID_COLUMN} INTEGER"
+
+# solar_log_v2 with the system columns joined back in; column names stay
+# unambiguous (system_config has no timestamp or measurement columns)
+JOINED_SOURCE = (f"solar_log_v2 LEFT JOIN {SYSTEM_CONFIG_TABLE} "
+                 f"ON {SYSTEM_CONFIG_TABLE}.id = solar_log_v2.{CONFIG_ID_COLUMN}")
+
+
+def ensure_system_config_table(cursor):
+    # valid_from / valid_to: first and last minute timestamp written with the values
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SYSTEM_CONFIG_TABLE} (
+            id INTEGER PRIMARY KEY,
+            {', '.join(f'{c} REAL' for c in SYSTEM_COLUMNS)},
+            valid_from TEXT,
+            valid_to TEXT
+        )
+    """)
+
+
+def is_normalized(cursor):
+    """True if solar_log_v2 references system_config instead of holding the values"""
+    cursor.execute("PRAGMA table_xinfo(solar_log_v2)")
+    return CONFIG_ID_COLUMN in {row[1] for row in cursor.fetchall()}
+
+
+def logbook_source(cursor):
+    """FROM clause that yields the system columns for either layout"""
+    return JOINED_SOURCE if is_normalized(cursor) else "solar_log_v2"
+
+
+def _stored_values(cursor, config_id):
+    cursor.execute(f"SELECT {', '.join(SYSTEM_COLUMNS)} FROM {SYSTEM_CONFIG_TABLE} WHERE id = ?", (config_id,))
+    return cursor.fetchone()
+
+
+def config_id(cursor, values, first, last, site_id=None):
+    """
+    Id of the configuration with values (in SYSTEM_COLUMNS order) for
+    minutes first..last: the one in force right before first or right
+    after last if its values match, else a new version. Its validity
+    interval is widened to cover first..last. None if all values are None.
+    With site_id only that site's rows are neighbours, so every version
+    belongs to a single site.
+    """
+    values = tuple(values)
+    if all(v is None for v in values):
+        return None
+    ensure_system_config_table(cursor)
+
+    site = "" if site_id is None else "site_id = ? AND "
+    found = None
+    for condition, order, ts in (("<", "DESC", first), (">", "ASC", last)):
+        cursor.execute(f"""
+            SELECT {CONFIG_ID_COLUMN} FROM solar_log_v2
+            WHERE {site}timestamp {condition} ? AND {CONFIG_ID_COLUMN} IS NOT NULL
+            ORDER BY timestamp {order} LIMIT 1
+        """, (ts,) if site_id is None else (site_id, ts))
+        row = cursor.fetchone()
+        if row and _stored_values(cursor, row[0]) == values:
+            found = row[0]
+            break
+
+    if found is None:
+        cursor.execute(f"""
+            INSERT INTO {SYSTEM_CONFIG_TABLE} ({', '.join(SYSTEM_COLUMNS)}, valid_from, valid_to)
+            VALUES ({', '.join(['?'] * len(SYSTEM_COLUMNS))}, ?, ?)
+        """, (*values, first, last))
+        return cursor.lastrowid
+    cursor.execute(f"""
+        UPDATE {SYSTEM_CONFIG_TABLE}
+        SET valid_from = MIN(valid_from, ?), valid_to = MAX(valid_to, ?)
+        WHERE id = ?
+    """, (first, last, found))
+    return found
+
+
+def normalize(cursor):
+    """
+    Move the system columns of a wide solar_log_v2 into system_config:
+    one version per run of consecutive minutes with equal values, rows
+    get its config_id and the columns are dropped. Does not commit; the
+    freed pages need a VACUUM. Returns the number of versions.
+    """
+    ensure_system_config_table(cursor)
+    cursor.execute(CONFIG_ID_COLUMN_SQL)
+    cursor.execute(f"SELECT timestamp, {', '.join(SYSTEM_COLUMNS)} FROM solar_log_v2 ORDER BY timestamp")
+
+    runs = []  # [values, first, last]
+    while True:
+        chunk = cursor.fetchmany(10000)
+        if not chunk:
+            break
+        for timestamp, *values in chunk:
+            if runs and runs[-1][0] == values:
+                runs[-1][2] = timestamp
+            else:
+                runs.append([values, timestamp, timestamp])
+
+    versions = 0
+    for values, first, last in runs:
+        if all(v is None for v in values):
+            continue
+        cursor.execute(f"""
+            INSERT INTO {SYSTEM_CONFIG_TABLE} ({', '.join(SYSTEM_COLUMNS)}, valid_from, valid_to)
+            VALUES ({', '.join(['?'] * len(SYSTEM_COLUMNS))}, ?, ?)
+        """, (*values, first, last))
+        cursor.execute(f"UPDATE solar_log_v2 SET {CONFIG_ID_COLUMN} = ? WHERE timestamp BETWEEN ? AND ?",
+                       (cursor.lastrowid, first, last))
+        versions += 1
+
+    for column in SYSTEM_COLUMNS:
+        cursor.execute(f"ALTER TABLE solar_log_v2 DROP COLUMN {column}")
+    return versions
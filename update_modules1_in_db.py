@@ -1,41 +1,70 @@
 from configparser import ConfigParser
 import sqlite3
 import os
+from archive_utils import invalidate_months, month_range
+from config_utils import load_config
+from correlation_utils import rebuild_correlation
+from query_cache_utils import bump_generation
+from system_config_utils import is_normalized
 
-# Pfad zur DB-Datei
-db_path = "/config/solar_logbook.db"
 
-# Verbindung zur SQLite-Datenbank herstellen
-conn = sqlite3.connect(db_path)
-cur = conn.cursor()
+def main():
+    # Pfad zur DB-Datei
+    db_path = "/config/solar_logbook.db"
 
-# Update-Befehl ausführen
-cur.execute("UPDATE solar_log_v2 SET modules1 = 760 WHERE modules1 = 2")
-updated_rows = cur.rowcount
+    # Verbindung zur SQLite-Datenbank herstellen
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
 
-# Änderungen speichern und Verbindung schließen
-conn.commit()
-conn.close()
+    # Update-Befehl ausführen: nach der Migration eine Zeile je Konfigurationsversion
+    table = "system_config" if is_normalized(cur) else "solar_log_v2"
+    # Minutes written with the wrong value; the archive holds copies of their months
+    if table == "system_config":
+        cur.execute("SELECT MIN(valid_from), MAX(valid_to) FROM system_config WHERE modules1 = 2")
+    else:
+        cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM solar_log_v2 WHERE modules1 = 2")
+    first, last = cur.fetchone()
+    cur.execute(f"UPDATE {table} SET modules1 = 760 WHERE modules1 = 2")
+    updated_rows = cur.rowcount
 
-print(f"✅ Updated {updated_rows} rows: modules1 = 2 → 760")
+    # modules1 is part of the lux/power correlation key
+    if updated_rows:
+        rebuild_correlation(cur)
+        bump_generation(cur)
 
-# Pfad zur .conf-Datei
-conf_path = "solar_logbook.conf"
+    # Änderungen speichern und Verbindung schließen
+    conn.commit()
+    conn.close()
 
-# Config laden
-config = ConfigParser()
-config.read(conf_path)
+    print(f"✅ Updated {updated_rows} rows in {table}: modules1 = 2 → 760")
 
-# Prüfen & ersetzen
-if config.has_section("system") and config.has_option("system", "modules1"):
-    old_value = config.get("system", "modules1")
-    config.set("system", "modules1", "760")
-    print(f"✅ modules1 updated from {old_value} to 760")
-else:
-    print("⚠️ 'modules1' not found in [system] section. Nothing changed.")
+    # Archived months still hold modules1 = 2; queries read them from SQLite again
+    if updated_rows and first:
+        archive_dir = load_config().get("paths", "archive_dir", fallback="/config/solar_archive")
+        dropped = invalidate_months(archive_dir, month_range(first, last))
+        if dropped:
+            print(f"⚠️ Archived month(s) {', '.join(dropped)} changed and now read from SQLite; re-run archive_solar_logbook.py")
 
-# Zurückschreiben
-with open(conf_path, "w") as configfile:
-    config.write(configfile)
-    print(f"📝 Changes saved to {conf_path}")
+    # Pfad zur .conf-Datei
+    conf_path = "solar_logbook.conf"
 
+    # Config laden
+    config = ConfigParser()
+    config.read(conf_path)
+
+    # Prüfen & ersetzen
+    if config.has_section("system") and config.has_option("system", "modules1"):
+        old_value = config.get("system", "modules1")
+        config.set("system", "modules1", "760")
+        print(f"✅ modules1 updated from {old_value} to 760")
+    else:
+        print("⚠️ 'modules1' not found in [system] section. Nothing changed.")
+
+    # Zurückschreiben
+    with open(conf_path, "w") as configfile:
+        config.write(configfile)
+        print(f"📝 Changes saved to {conf_path}")
+
+
+if __name__ == "__main__":
+    main()